@@ -0,0 +1,312 @@
+# Cross-sectional analytics over the whole symbol universe
+# The stored stocks are aligned into one (dates x symbols) price matrix on the
+# union of their trading days. Histories are ragged (listings, delistings, data
+# gaps): a symbol is NaN before its first and after its last bar, and prices of
+# missing bars inside its span are carried forward (zero return that day, the
+# move is booked on the next real bar). All the statistics are computed on the
+# whole matrix at once, missing values are handled with masks and prefix sums,
+# never with a loop over the symbols.
+
+import threading
+import numpy as np
+import pandas as pd
+
+# trading days per year (volatility annualization)
+trading_days = 252
+
+
+def ffill(values):
+    '''
+    Forward fill the NaN values of a 2D array along the rows (axis 0)
+    '''
+    rows = np.where(np.isnan(values), 0, np.arange(len(values))[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return values[rows, np.arange(values.shape[1])]
+
+
+def align_columns(dates, values, symbol_ids, n_symbols):
+    '''
+    Scatter concatenated per-symbol series into a (dates x symbols) matrix
+
+    Input parameters
+    ----------------
+    dates      : datetime64 array, concatenated dates of all the series
+    values     : float array, concatenated values
+    symbol_ids : int array, column of every value
+    n_symbols  : int, number of columns
+
+    Output
+    ------
+    union of the dates (sorted), matrix with NaN where a symbol has no bar
+    '''
+    axis, rows = np.unique(dates, return_inverse=True)
+    matrix = np.full((len(axis), n_symbols), np.nan)
+    matrix[rows.ravel(), symbol_ids] = values
+    return axis, matrix
+
+
+def _window_sums(values, window):
+    # rolling sum, sum of squares and count of the non-NaN values along axis 0 (prefix sums)
+    valid = ~np.isnan(values)
+    clean = np.where(valid, values, 0.0)
+    zeros = np.zeros((1, values.shape[1]))
+    csum = np.concatenate([zeros, np.cumsum(clean, axis=0)])
+    csum2 = np.concatenate([zeros, np.cumsum(clean * clean, axis=0)])
+    count = np.concatenate([zeros, np.cumsum(valid, axis=0)])
+    start = np.maximum(np.arange(1, len(values) + 1) - window, 0)
+    end = np.arange(1, len(values) + 1)
+    return (csum[end] - csum[start], csum2[end] - csum2[start], count[end] - count[start])
+
+
+def rolling_std(values, window=21, min_periods=None):
+    '''
+    Rolling (sample) standard deviation along axis 0, ignoring the NaN values
+
+    Input parameters
+    ----------------
+    values      : 2D float array
+    window      : int, number of rows of the window (default : 21)
+    min_periods : int, minimum number of values in the window (default : None, window)
+
+    Output
+    ------
+    2D array, NaN where the window has less than min_periods values
+    '''
+    min_periods = window if min_periods is None else max(min_periods, 2)
+    s, s2, n = _window_sums(values, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        var = (s2 - s * s / n) / (n - 1)
+    var = np.where(n >= min_periods, np.maximum(var, 0.0), np.nan)
+    return np.sqrt(var)
+
+
+def pairwise_corr(values, min_periods=20):
+    '''
+    Correlation matrix of the columns over their pairwise complete rows (like pandas.DataFrame.corr)
+
+    Input parameters
+    ----------------
+    values      : 2D float array (rows x columns), NaN for missing values
+    min_periods : int, minimum number of common rows of a pair (default : 20)
+
+    Output
+    ------
+    (columns x columns) correlation matrix, NaN for the pairs with too few common rows
+    '''
+    valid = (~np.isnan(values)).astype('float64')
+    clean = np.where(valid > 0, values, 0.0)
+    n = valid.T @ valid
+    sx = clean.T @ valid
+    sxx = (clean * clean).T @ valid
+    sxy = clean.T @ clean
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = sxy - sx * sx.T / n
+        var_x = sxx - sx * sx / n
+        corr = cov / np.sqrt(var_x * var_x.T)
+    corr = np.where(n >= min_periods, np.clip(corr, -1.0, 1.0), np.nan)
+    return corr
+
+
+def rank_columns(values):
+    '''
+    Percentile rank (0 - 1) of the values of every row across the columns, NaN stays NaN
+    '''
+    valid = ~np.isnan(values)
+    # NaN sort last, ranks of the valid values are 0 .. count - 1
+    ranks = np.argsort(np.argsort(np.where(valid, values, np.inf), axis=1, kind='stable'),
+                       axis=1, kind='stable').astype('float64')
+    count = valid.sum(axis=1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        pct = ranks / (count - 1)
+    return np.where(valid, np.where(count > 1, pct, 1.0), np.nan)
+
+
+class Universe:
+    '''
+    Aligned (dates x symbols) prices of a set of stocks and their cross-sectional statistics
+
+    Input parameters
+    ----------------
+    dates   : datetime64 array, union of the trading days (sorted)
+    symbols : list of symbols (columns)
+    prices  : 2D float array (dates x symbols), NaN where a symbol has no bar
+    '''
+
+    def __init__(self, dates, symbols, prices):
+        self.dates = np.asarray(dates)
+        self.symbols = list(symbols)
+        self.observed = ~np.isnan(prices)
+        # listing span of every symbol
+        rows = np.arange(len(prices))[:, None]
+        first = np.where(self.observed, rows, len(prices)).min(axis=0, initial=len(prices))
+        last = np.where(self.observed, rows, -1).max(axis=0, initial=-1)
+        self.alive = (rows >= first) & (rows <= last)
+        # carry the prices over the missing bars inside the span only
+        self.prices = np.where(self.alive, ffill(prices), np.nan)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def lookback(self, days):
+        '''
+        Universe restricted to the last days rows (None : all)
+        '''
+        if days is None or days >= len(self.dates):
+            return self
+        sub = Universe.__new__(Universe)
+        sub.dates = self.dates[-days:]
+        sub.symbols = self.symbols
+        sub.observed = self.observed[-days:]
+        sub.alive = self.alive[-days:]
+        sub.prices = self.prices[-days:]
+        return sub
+
+    def returns(self, log=False):
+        '''
+        Daily returns (dates x symbols), NaN on the first row and outside the listing spans
+        '''
+        ret = np.full(self.prices.shape, np.nan)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if log:
+                ret[1:] = np.diff(np.log(self.prices), axis=0)
+            else:
+                ret[1:] = self.prices[1:] / self.prices[:-1] - 1
+        return ret
+
+    def volatility(self, window=21, annualize=True):
+        '''
+        Rolling volatility of the daily returns (dates x symbols)
+        '''
+        vol = rolling_std(self.returns(log=True), window=window)
+        return vol * np.sqrt(trading_days) if annualize else vol
+
+    def correlation(self, min_periods=20):
+        '''
+        Correlation matrix (symbols x symbols) of the daily returns
+        '''
+        return pairwise_corr(self.returns(log=True), min_periods=min_periods)
+
+    def drawdowns(self):
+        '''
+        Drawdown from the running peak (dates x symbols), 0 at a new high
+        '''
+        peak = np.fmax.accumulate(self.prices, axis=0)
+        with np.errstate(invalid='ignore'):
+            return self.prices / peak - 1
+
+    def relative_strength(self, window=63):
+        '''
+        Return over window rows relative to the equal weight universe, and its percentile rank
+
+        Output
+        ------
+        relative strength, rank : 2D arrays (dates x symbols)
+        '''
+        past = np.full(self.prices.shape, np.nan)
+        past[window:] = self.prices[:-window]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ret = self.prices / past - 1
+        # equal weight universe return (NaN on the rows without any value)
+        count = (~np.isnan(ret)).sum(axis=1, keepdims=True)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            bench = np.nansum(ret, axis=1, keepdims=True) / count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rs = (1 + ret) / (1 + bench) - 1
+        return rs, rank_columns(rs)
+
+    def ranking(self, window=63, vol_window=21):
+        '''
+        Last value of the statistics of every symbol, sorted by relative strength
+
+        Output
+        ------
+        dataframe with the columns Symbol, Return, RelativeStrength, Rank,
+        Volatility, Drawdown, MaxDrawdown
+        '''
+        if not len(self.dates):
+            return pd.DataFrame(columns=['Symbol', 'Return', 'RelativeStrength', 'Rank',
+                                         'Volatility', 'Drawdown', 'MaxDrawdown'])
+        rs, rank = self.relative_strength(window=window)
+        dd = self.drawdowns()
+        start = self.prices[max(len(self.prices) - window - 1, 0)]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ret = self.prices[-1] / start - 1
+        df = pd.DataFrame({'Symbol': self.symbols,
+                           'Return': ret,
+                           'RelativeStrength': rs[-1],
+                           'Rank': rank[-1],
+                           'Volatility': self.volatility(window=vol_window)[-1],
+                           'Drawdown': dd[-1],
+                           'MaxDrawdown': np.nanmin(np.where(np.isnan(dd), np.inf, dd), axis=0)})
+        df.loc[np.isinf(df['MaxDrawdown']), 'MaxDrawdown'] = np.nan
+        return df.sort_values('RelativeStrength', ascending=False, ignore_index=True)
+
+
+def load_universe(store, symbols=None, column='Close', suffix='.NS'):
+    '''
+    Load the stored stocks into one aligned Universe
+
+    Input parameters
+    ----------------
+    store   : store object (see store.py)
+    symbols : list of symbols without suffix (default : None, all the stored symbols)
+    column  : str, price column (default : 'Close')
+    suffix  : str, exchange suffix (default : '.NS', '' : the symbols are tickers)
+
+    Output
+    ------
+    Universe, columns in the order of the symbols found in the store
+    '''
+    if symbols is None:
+        tickers = sorted(store.symbols(suffix=suffix))
+    else:
+        tickers = [s + suffix for s in symbols if store.exists(s + suffix)]
+
+    # reading the files is the only per-symbol step
+    dates, values = [], []
+    for ticker in tickers:
+        if hasattr(store, 'load_columns'):
+            arrays = store.load_columns(ticker, ['Date', column])
+        else:
+            arrays = store.load(ticker, columns=[column])
+        dates.append(np.asarray(arrays['Date'], dtype='datetime64[ns]'))
+        values.append(np.asarray(arrays[column], dtype='float64'))
+
+    names = [t[:len(t) - len(suffix)] for t in tickers]
+    if not tickers:
+        return Universe(np.array([], dtype='datetime64[ns]'), [], np.zeros((0, 0)))
+    lengths = np.array([len(d) for d in dates])
+    axis, prices = align_columns(np.concatenate(dates), np.concatenate(values),
+                                 np.repeat(np.arange(len(tickers)), lengths), len(tickers))
+    return Universe(axis, names, prices)
+
+
+class UniverseCache:
+    '''
+    Keep the last loaded Universe until one of the stored files changes
+
+    Input parameters
+    ----------------
+    store  : store object (see store.py)
+    suffix : str, exchange suffix (default : '.NS', '' : the symbols are tickers)
+    '''
+
+    def __init__(self, store, suffix='.NS'):
+        self.store = store
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        self._key = None
+        self._universe = None
+
+    def get(self, symbols=None, column='Close'):
+        if symbols is None:
+            tickers = self.store.symbols(suffix=self.suffix)
+        else:
+            tickers = [s + self.suffix for s in symbols]
+        key = (tuple(symbols) if symbols is not None else None, column,
+               tuple((t, self.store.mtime(t)) for t in tickers))
+        with self._lock:
+            if key != self._key:
+                self._universe = load_universe(self.store, symbols, column=column, suffix=self.suffix)
+                self._key = key
+            return self._universe
@@ -0,0 +1,133 @@
+// Clientside callbacks of stocks_view_app.py
+// render_figure  (render_mode = 'client')  : the panel OHLC data is sent once per symbol (base64
+//                typed arrays, see make_panel_data), the figure is rebuilt here for every
+//                change of the display controls (price column, chart types, SMA length).
+// render_payload (render_mode = 'compact') : decode the base64 typed arrays sent by the
+//                server (compact.py) into the figures of the changed panels.
+// copy_options  : the symbol list is sent once and copied to every dropdown.
+// The figure callbacks use the static layout and trace styles of the 'figure-layout' store, and end
+// the figures with the empty 'Live' trace of the live mode.
+
+// simple moving average, null for the first (days - 1) points like pandas rolling().mean(),
+// and for the windows with a missing (NaN) value: the running sum skips them and counts
+// the missing values of the window (like _window_sums in analytics.py)
+function simpleMovingAverage(values, days) {
+  var sma = new Array(values.length);
+  var sum = 0;
+  var missing = 0;
+  for (var i = 0; i < values.length; i++) {
+    var value = values[i];
+    if (value === null || value !== value) {
+      missing++;
+    } else {
+      sum += value;
+    }
+    if (i >= days) {
+      var old = values[i - days];
+      if (old === null || old !== old) {
+        missing--;
+      } else {
+        sum -= old;
+      }
+    }
+    sma[i] = i >= days - 1 && missing === 0 ? sum / days : null;
+  }
+  return sma;
+}
+
+// base64 little-endian array -> Float32Array / Float64Array
+function decodeArray(encoded) {
+  var binary = atob(encoded.b64);
+  var bytes = new Uint8Array(binary.length);
+  for (var i = 0; i < binary.length; i++) {
+    bytes[i] = binary.charCodeAt(i);
+  }
+  return encoded.dtype === 'f4' ? new Float32Array(bytes.buffer) : new Float64Array(bytes.buffer);
+}
+
+// base layout with the panel axis ranges
+function panelLayout(base, xrange, yrange, xtype) {
+  var layout = Object.assign({}, base.layout);
+  layout.xaxis = Object.assign({}, layout.xaxis, {range: xrange});
+  if (xtype) {
+    layout.xaxis.type = xtype;
+  }
+  layout.yaxis = Object.assign({}, layout.yaxis, {range: yrange});
+  return layout;
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+  stocks: {
+    render_figure: function(data, graph_name, chart_name, days, base) {
+      if (!data) {
+        return {data: [], layout: Object.assign({}, base.layout)};
+      }
+
+      var columns = {};
+      ['Date', 'Open', 'High', 'Low', 'Close'].forEach(function(column) {
+        columns[column] = decodeArray(data[column]);
+      });
+      var traces = [];
+      (chart_name || []).forEach(function(cname) {
+        var trace = Object.assign({}, base.styles[cname], {name: cname, x: columns.Date});
+        if (cname === 'StockPrice') {
+          trace.y = columns[graph_name];
+        }
+        if (cname === 'Candlestick') {
+          Object.assign(trace, {open: columns.Open, high: columns.High, low: columns.Low, close: columns.Close});
+        }
+        if (cname === 'SimpleMovingAverage') {
+          trace.y = simpleMovingAverage(columns[graph_name], days);
+        }
+        traces.push(trace);
+      });
+      // extended by the live ticks (update_live in stocks_view_app.py)
+      if (base.live) {
+        traces.push(Object.assign({}, base.styles.Live, {name: 'Live', x: [], y: []}));
+      }
+
+      return {data: traces, layout: panelLayout(base, base.layout.xaxis.range, data.yaxis_range, 'date')};
+    },
+
+    render_payload: function(payload, base) {
+      if (!payload) {
+        throw window.dash_clientside.PreventUpdate;
+      }
+      // date axes (ms since epoch) shared by the traces
+      var axes = payload.axes.map(decodeArray);
+
+      var figures = [];
+      for (var i = 0; i < payload.n_panels; i++) {
+        var panel = payload.panels[String(i)];
+        if (!panel) {
+          figures.push(window.dash_clientside.no_update);
+          continue;
+        }
+        var traces = panel.traces.map(function(t) {
+          if (t.name === 'Live') {
+            // plain arrays, extended by the live ticks
+            return Object.assign({}, base.styles.Live, {name: 'Live', x: [], y: []});
+          }
+          var trace = Object.assign({}, base.styles[t.name], {name: t.name, x: axes[t.x]});
+          ['y', 'open', 'high', 'low', 'close'].forEach(function(column) {
+            if (t[column]) {
+              trace[column] = decodeArray(t[column]);
+            }
+          });
+          return trace;
+        });
+        figures.push({data: traces, layout: panelLayout(base, panel.xrange, panel.yrange, 'date')});
+      }
+      return figures;
+    },
+
+    copy_options: function(options, ids) {
+      if (!options) {
+        throw window.dash_clientside.PreventUpdate;
+      }
+      return ids.map(function() {
+        return options;
+      });
+    }
+  }
+});
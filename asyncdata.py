@@ -0,0 +1,242 @@
+# Asyncio data access layer
+# The downloads of missing or stale symbols run as tasks of an asyncio event loop
+# (one background thread) instead of blocking the flask threads of the callbacks,
+# at most max_concurrency at a time (semaphore). A callback asks for a symbol with
+# request(): stored, fresh data is 'ready' right away, otherwise the download is
+# started (once per symbol). The callback draws the stored data of a stale symbol
+# and answers with a placeholder for a missing one, the panel is rendered again
+# once the data landed (pending panels, see stocks_view_app.py).
+# Coroutines await get() instead.
+#
+# Async fetchers implement: async fetch(symbol, period='1y', start=None) -> dataframe
+#   HttpFetcher     : csv over HTTP (fetch.FakeQuoteServer api) with asyncio streams
+#   ExecutorFetcher : a blocking fetcher (default : Yahoo finance, which has no async
+#                     client) run on its own bounded thread pool
+
+import io
+import time
+import asyncio
+import logging
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, urlencode, quote
+import pandas as pd
+from fetch import YahooFetcher
+from store import get_store
+from registry import get_registry
+from locks import FileLock, lock_path
+from utils import get_single_stock, apply_delta
+
+logger = logging.getLogger(__name__)
+
+
+class HttpFetcher:
+    '''
+    Async fetcher of the csv stock history served at <url>/history/<symbol>?period=..&start=..
+
+    Input parameters
+    ----------------
+    url     : str, e.g. 'http://127.0.0.1:8050' (http or https)
+    timeout : float, seconds per request (default : 30)
+    '''
+
+    def __init__(self, url, timeout=30.0):
+        parsed = urlparse(url)
+        self.ssl = parsed.scheme == 'https'
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if self.ssl else 80)
+        self.prefix = parsed.path.rstrip('/')
+        self.timeout = timeout
+
+    async def _get(self, path):
+        reader, writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl or None)
+        try:
+            writer.write('GET {} HTTP/1.0\r\nHost: {}\r\n\r\n'.format(path, self.host).encode())
+            await writer.drain()
+            # HTTP/1.0 : the server closes the connection after the body
+            data = await reader.read()
+        finally:
+            writer.close()
+        head, _, body = data.partition(b'\r\n\r\n')
+        status = int(head.split(None, 2)[1])
+        if status != 200:
+            raise IOError('HTTP {} for {}'.format(status, path))
+        return body
+
+    async def fetch(self, symbol, period='1y', start=None):
+        query = {'period': period}
+        if start is not None:
+            query['start'] = pd.Timestamp(start).strftime('%Y-%m-%d')
+        path = '{}/history/{}?{}'.format(self.prefix, quote(symbol), urlencode(query))
+        body = await asyncio.wait_for(self._get(path), self.timeout)
+        return pd.read_csv(io.BytesIO(body), parse_dates=['Date'], index_col='Date')
+
+
+class ExecutorFetcher:
+    '''
+    Async wrapper of a blocking fetcher (fetch(symbol, period, start)), run on a thread pool
+
+    Input parameters
+    ----------------
+    fetcher     : blocking fetcher (default : YahooFetcher())
+    max_workers : int, threads of the pool (default : 8)
+    '''
+
+    def __init__(self, fetcher=None, max_workers=8):
+        self.fetcher = fetcher or YahooFetcher()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    async def fetch(self, symbol, period='1y', start=None):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(self.fetcher.fetch, symbol, period=period, start=start))
+
+
+class AsyncDataLayer:
+    '''
+    Non-blocking loads of the stock data on an asyncio event loop thread
+
+    Input parameters
+    ----------------
+    fetcher         : async fetcher (default : ExecutorFetcher(), Yahoo finance)
+    datadir         : directory of the stock data (default : './data/')
+    period          : str, time period of a full download (default : '1y')
+    max_age         : float, stored data older than max_age seconds is refreshed (default : None, never)
+    max_concurrency : int, downloads at the same time (default : 8)
+    retry_after     : float, seconds before a failed symbol is downloaded again (default : 30)
+    '''
+
+    def __init__(self, fetcher=None, datadir='./data/', period='1y', max_age=None, max_concurrency=8,
+                 retry_after=30.0):
+        self.fetcher = fetcher or ExecutorFetcher(max_workers=max_concurrency)
+        self.datadir = datadir
+        self.store = get_store(datadir)
+        self.registry = get_registry(datadir)
+        self.period = period
+        self.max_age = max_age
+        self.max_concurrency = max_concurrency
+        self.retry_after = retry_after
+        # symbol -> future of the download task, symbol -> (time, error) of the last failure
+        self._tasks = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+        self._semaphore = None
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name='async-data', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def fresh(self, symbol):
+        '''
+        Return True if symbol is stored and not older than max_age
+        '''
+        mtime = self.registry.mtime(self.registry.resolve(symbol))
+        return mtime is not None and (self.max_age is None or time.time() - mtime / 1e9 <= self.max_age)
+
+    def request(self, symbol):
+        '''
+        Start the download of symbol unless its stored data is fresh, never blocks
+
+        Output
+        ------
+        'ready' (load it with get_single_stock), 'stale' (stored, being refreshed: load
+        the stored data), 'loading' (not stored) or 'failed' (not stored, within
+        retry_after seconds of a failed download). The stored data of a symbol whose
+        refresh failed is 'ready'.
+        '''
+        mtime = self.registry.mtime(self.registry.resolve(symbol))
+        if mtime is not None and (self.max_age is None or time.time() - mtime / 1e9 <= self.max_age):
+            return 'ready'
+        status = 'loading' if mtime is None else 'stale'
+        with self._lock:
+            future = self._tasks.get(symbol)
+            if future is not None and not future.done():
+                return status
+            error = self._errors.get(symbol)
+            if error is not None and time.time() - error[0] < self.retry_after:
+                return 'failed' if mtime is None else 'ready'
+            self._tasks[symbol] = asyncio.run_coroutine_threadsafe(self._download(symbol), self.loop)
+        return status
+
+    def error(self, symbol):
+        '''
+        Return the error of the last failed download of symbol or None
+        '''
+        error = self._errors.get(symbol)
+        return None if error is None else error[1]
+
+    def pending(self):
+        '''
+        Number of downloads started and not finished
+        '''
+        with self._lock:
+            return sum(not f.done() for f in self._tasks.values())
+
+    async def _download(self, symbol):
+        record = self.registry.resolve(symbol)
+        ticker = record.ticker
+        loop = asyncio.get_event_loop()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        try:
+            async with self._semaphore:
+                # the store is read on a thread, the loop keeps serving the other downloads
+                last = await loop.run_in_executor(None, self.store.last_date, ticker)
+                if last is not None:
+                    delta = await self.fetcher.fetch(ticker, period=self.period, start=last)
+                    new = await loop.run_in_executor(None, self._save, ticker, delta, last)
+                    if new is not None:
+                        self.registry.refreshed(record)
+                        return
+                logger.info('Download %s stock data', symbol)
+                df = await self.fetcher.fetch(ticker, period=self.period)
+                await loop.run_in_executor(None, self._save, ticker, df, None)
+                self.registry.refreshed(record)
+            with self._lock:
+                self._errors.pop(symbol, None)
+        except Exception as err:
+            logger.warning('Download of %s failed: %s', symbol, err)
+            with self._lock:
+                self._errors[symbol] = (time.time(), err)
+            raise
+
+    def _save(self, ticker, df, last):
+        # another worker process may write the same symbol
+        with FileLock(lock_path(self.store.path(ticker))):
+            if last is not None:
+                return apply_delta(self.store, ticker, df, last)
+            self.store.save(ticker, df)
+            return -1
+
+    async def get(self, symbol):
+        '''
+        Awaitable stock dataframe of symbol (frame cache, store or download)
+        '''
+        status = self.request(symbol)
+        if status == 'failed':
+            raise self.error(symbol)
+        if status == 'loading':
+            await asyncio.wrap_future(self._tasks[symbol])
+        elif status == 'stale':
+            try:
+                await asyncio.wrap_future(self._tasks[symbol])
+            except Exception:
+                # logged by _download, the stored data is served
+                pass
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(get_single_stock, symbol, period=self.period, datadir=self.datadir))
+
+    def result(self, symbol, timeout=None):
+        '''
+        Blocking get() from a thread outside the event loop
+        '''
+        return asyncio.run_coroutine_threadsafe(self.get(symbol), self.loop).result(timeout)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
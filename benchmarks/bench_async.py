@@ -0,0 +1,100 @@
+# Cached panel latency while uncached symbols are downloaded, blocking vs asyncio loads
+# A pool of --threads workers (the threads of the flask server) serves a burst of
+# requests for --missing symbols that are not stored, mixed with requests for stored
+# (cached) symbols. The downloads come from a local fetch.FakeQuoteServer with
+# --latency seconds per request:
+#   blocking : the worker calls get_single_stock, yfinance is replaced by a blocking
+#              http client of the fake server (the download holds the worker)
+#   asyncio  : the worker calls AsyncDataLayer.request and answers at once (placeholder)
+# Reported: latency of the cached requests and time until all the data landed.
+#
+# usage: python benchmarks/bench_async.py [--threads 4] [--missing 16] [--latency 0.5]
+
+import os, sys
+import io
+import time
+import types
+import argparse
+import tempfile
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from fetch import FakeQuoteServer, make_fake_stock
+from store import get_store
+from asyncdata import AsyncDataLayer, HttpFetcher
+from utils import get_single_stock
+
+
+def install_http_yfinance(url):
+    # yfinance replaced by a blocking client of the fake quote server
+    class Ticker:
+        def __init__(self, symbol):
+            self.symbol = symbol
+
+        def history(self, period='1y', **kwargs):
+            with urllib.request.urlopen('{}/history/{}?period={}'.format(url, self.symbol, period)) as r:
+                return pd.read_csv(io.BytesIO(r.read()), parse_dates=['Date'], index_col='Date')
+
+    module = types.ModuleType('yfinance')
+    module.Ticker = Ticker
+    sys.modules['yfinance'] = module
+
+
+def run(mode, threads, missing, cached, datadir, url, max_concurrency):
+    layer = AsyncDataLayer(HttpFetcher(url), datadir=datadir, max_concurrency=max_concurrency) \
+        if mode == 'asyncio' else None
+
+    def handle(symbol, start):
+        # latency from the arrival of the request, waiting for a free worker included
+        if layer is not None and layer.request(symbol) != 'ready':
+            # placeholder answer, the panel is rendered when the data landed
+            return symbol, time.perf_counter() - start
+        get_single_stock(symbol, datadir=datadir)
+        return symbol, time.perf_counter() - start
+
+    # the requests of the missing symbols arrive first, then the cached panels
+    requests = missing + cached
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = [pool.submit(handle, s, time.perf_counter()) for s in requests]
+        latency = dict(f.result() for f in futures)
+    # wait for the data of the placeholders
+    if layer is not None:
+        while layer.pending():
+            time.sleep(0.01)
+    landed = time.perf_counter() - start
+    if layer is not None:
+        layer.stop()
+    store = get_store(datadir)
+    assert all(store.exists(s + '.NS') for s in missing)
+    return np.array([latency[s] for s in cached]) * 1000, landed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Cached panel latency with blocking and asyncio downloads')
+    parser.add_argument('--threads', type=int, default=4, help='server worker threads')
+    parser.add_argument('--missing', type=int, default=16, help='symbols to download')
+    parser.add_argument('--cached', type=int, default=6, help='requests of stored symbols')
+    parser.add_argument('--latency', type=float, default=0.5, help='seconds per download')
+    parser.add_argument('--concurrency', type=int, default=8, help='asyncio downloads at the same time')
+    args = parser.parse_args()
+
+    server = FakeQuoteServer(latency=args.latency).start()
+    install_http_yfinance(server.url)
+    print('{} workers, {} downloads of {}s, {} cached requests'.format(
+        args.threads, args.missing, args.latency, args.cached))
+    print('{:<10s} {:>16s} {:>16s} {:>18s}'.format('mode', 'cached p50 (ms)', 'cached max (ms)', 'all landed (s)'))
+    for mode in ['blocking', 'asyncio']:
+        with tempfile.TemporaryDirectory() as datadir:
+            store = get_store(datadir)
+            cached = ['CACHED{}'.format(i) for i in range(args.cached)]
+            for s in cached:
+                store.save(s + '.NS', make_fake_stock(s + '.NS'))
+            missing = ['MISSING{}'.format(i) for i in range(args.missing)]
+            latency, landed = run(mode, args.threads, missing, cached, datadir, server.url, args.concurrency)
+        print('{:<10s} {:>16.1f} {:>16.1f} {:>18.2f}'.format(mode, np.median(latency), latency.max(), landed))
+    server.stop()
@@ -0,0 +1,90 @@
+# Memory of N worker processes holding the same stock data (Linux)
+# Every worker loads all the symbols either into its own frame cache
+# (utils.get_single_stock) or by attaching the shared data plane segments
+# (utils.get_shared_stock), touches all the values and reports its private
+# memory growth (/proc/self/smaps_rollup). With the data plane the total stays
+# flat as workers are added, the mapped pages are shared (with a single worker
+# they are still counted as private, nobody else maps them).
+#
+# usage: python benchmarks/bench_dataplane.py [--symbols 100] [--bars 5000] [--workers 1 2 4 8]
+
+import os, sys
+import argparse
+import tempfile
+import contextlib, io
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fetch import make_fake_stock
+from store import get_store
+from dataplane import DataPlane
+from utils import get_single_stock, get_shared_stock
+
+
+def private_kb():
+    # private (not shared) resident memory of this process
+    total = 0
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            if line.startswith('Private_Clean:') or line.startswith('Private_Dirty:'):
+                total += int(line.split()[1])
+    return total
+
+
+def worker(mode, symbols, datadir, planedir, queue, barrier):
+    before = private_kb()
+    frames = []
+    plane = DataPlane(planedir) if mode == 'plane' else None
+    for symbol in symbols:
+        if plane is not None:
+            df = get_shared_stock(symbol, plane, datadir=datadir)
+        else:
+            df = get_single_stock(symbol, datadir=datadir)
+        # read all the values
+        for column in ['Open', 'High', 'Low', 'Close']:
+            df[column].values.sum()
+        frames.append(df)
+    queue.put(private_kb() - before)
+    # keep the data alive until every worker measured
+    barrier.wait()
+
+
+def measure(mode, n_workers, symbols, datadir, planedir):
+    queue = multiprocessing.Queue()
+    barrier = multiprocessing.Barrier(n_workers)
+    procs = [multiprocessing.Process(target=worker, args=(mode, symbols, datadir, planedir, queue, barrier))
+             for _ in range(n_workers)]
+    for p in procs:
+        p.start()
+    growth = [queue.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return sum(growth)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the worker memory with and without the data plane')
+    parser.add_argument('--symbols', type=int, default=100)
+    parser.add_argument('--bars', type=int, default=5000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    if not os.path.isfile('/proc/self/smaps_rollup'):
+        sys.exit('/proc/self/smaps_rollup is not available, Linux only')
+
+    with tempfile.TemporaryDirectory() as datadir, tempfile.TemporaryDirectory() as planedir:
+        store = get_store(datadir)
+        symbols = ['SYM{}'.format(i) for i in range(args.symbols)]
+        with contextlib.redirect_stdout(io.StringIO()):
+            for symbol in symbols:
+                store.save(symbol + '.NS', make_fake_stock(symbol + '.NS', nrows=args.bars))
+        DataPlane(planedir).publish_store(store)
+
+        print('{} symbols x {} bars'.format(args.symbols, args.bars))
+        print('{:>8s} {:>18s} {:>18s}'.format('workers', 'frames (MB)', 'data plane (MB)'))
+        for n in args.workers:
+            with contextlib.redirect_stdout(io.StringIO()):
+                frames = measure('frames', n, symbols, datadir, planedir)
+                plane = measure('plane', n, symbols, datadir, planedir)
+            print('{:>8d} {:>18.1f} {:>18.1f}'.format(n, frames / 1024, plane / 1024))
@@ -0,0 +1,88 @@
+# Check and microbenchmark of the default view of the graphs (no zoom)
+# Only the bars inside the x range of the graphs (date_range) are drawn: every line
+# of a figure must have min(visible bars, max_points) points and the candles
+# min(visible bars, max_candles), whatever the length of the stored history. The
+# script exits with an error if any case differs, then times the figure builds.
+#
+# usage: python benchmarks/bench_default_view.py [--repeat 20]
+
+import os, sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pandas as pd
+from check_figure import load_app
+from compact import PayloadBuilder, decode_array
+from fetch import make_fake_stock
+from store import normalize_stock_frame
+
+# temporary working directory, no warm start (see check_figure.py)
+app = load_app()
+
+chart_name = ['StockPrice', 'Candlestick', 'SimpleMovingAverage']
+# (stored daily bars, business days of date_range)
+cases = [(250, 250), (5000, 250), (5000, 1000), (5000, 5000), (300, 1000)]
+
+
+def set_view(nbars, ndays):
+    '''
+    Serve a synthetic history of nbars through load_stock, date_range over its last ndays
+    '''
+    df = normalize_stock_frame(make_fake_stock('VIEW.NS', nrows=nbars))
+    end = df['Date'].iloc[-1]
+    app.date_range = [str((end - pd.tseries.offsets.BDay(ndays - 1)).date()), str(end.date())]
+    app.load_stock = lambda symbol, interval='D': df
+    app.figure_cache.clear()
+    return df
+
+
+def expected_points(df):
+    visible = app.default_view_rows(df)
+    return {'StockPrice': min(visible, app.max_points), 'SimpleMovingAverage': min(visible, app.max_points),
+            'Candlestick': min(visible, app.max_candles)}
+
+
+def check_default_view():
+    errors = []
+    for nbars, ndays in cases:
+        df = set_view(nbars, ndays)
+        expected = expected_points(df)
+        fig = app.make_stock_figure('VIEW', 'Close', chart_name, 10)
+        builder = PayloadBuilder(1)
+        app.add_compact_panel(builder, 0, 'VIEW', 'Close', chart_name, 10)
+        for mode, traces in [('server', [(t['name'], len(t['x'])) for t in fig['data']]),
+                             ('compact', [(t['name'], len(decode_array(builder.axes[t['x']])))
+                                          for t in builder.panels[0]['traces']])]:
+            for name, npoints in traces:
+                if name in expected and npoints != expected[name]:
+                    errors.append('{} bars, {} days, {} {}: {} points != {}'.format(
+                        nbars, ndays, mode, name, npoints, expected[name]))
+    return errors
+
+
+def timeit(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        app.figure_cache.clear()
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check and time the default view of the graphs')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    errors = check_default_view()
+    if errors:
+        print('\n'.join(errors))
+        sys.exit('The default view has the wrong number of points in {} places!'.format(len(errors)))
+    print('default view ok ({} cases)'.format(len(cases)))
+
+    print('{:>6s} {:>6s} {:>8s} {:>12s}'.format('bars', 'days', 'visible', 'figure (ms)'))
+    for nbars, ndays in cases:
+        df = set_view(nbars, ndays)
+        t = timeit(lambda: app.make_stock_figure('VIEW', 'Close', chart_name, 10), args.repeat)
+        print('{:>6d} {:>6d} {:>8d} {:>12.2f}'.format(nbars, ndays, app.default_view_rows(df), t * 1000))
@@ -0,0 +1,94 @@
+# Offline benchmark of the bulk downloader against a fake data source
+# Compares the serial loop (one symbol at a time) with the BulkFetcher pool. Before
+# the timings, a refresh that downloads nothing (the empty frame of yfinance, without
+# a date index) must keep the stored bars, the script exits with an error otherwise.
+#
+# usage: python benchmarks/bench_fetch.py [--latency 0.2] [--workers 8]
+
+import os, sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from fetch import BulkFetcher, FakeFetcher, FetchError, make_fake_stock
+from store import get_store, normalize_stock_frame
+from utils import update_single_stock
+
+
+class ConstantFetcher:
+    '''
+    Data source answering every request with the same frame
+    '''
+
+    def __init__(self, df):
+        self.df = df
+
+    def fetch(self, symbol, period='1y', start=None):
+        return self.df
+
+
+def check_empty_refresh():
+    '''
+    Refresh stored bars with empty and dateless downloads, return the errors
+    '''
+    errors = []
+    # what yfinance returns when it has no data (utils.empty_df)
+    empty = pd.DataFrame(columns=['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume'])
+    empty.index.name = 'Date'
+    with tempfile.TemporaryDirectory() as datadir:
+        store = get_store(datadir)
+        store.save('CHECK.NS', normalize_stock_frame(make_fake_stock('CHECK.NS', nrows=50)))
+        try:
+            new = update_single_stock('CHECK', datadir=datadir, fetcher=ConstantFetcher(empty))
+            if new != 0:
+                errors.append('empty download: {} new bars != 0'.format(new))
+        except Exception as err:
+            errors.append('empty download: {!r}'.format(err))
+        try:
+            update_single_stock('CHECK', datadir=datadir, fetcher=ConstantFetcher(pd.DataFrame({'Close': [1.0]})))
+            errors.append('dateless download: no FetchError')
+        except FetchError:
+            pass
+        except Exception as err:
+            errors.append('dateless download: {!r}'.format(err))
+        if len(store.load('CHECK.NS')) != 50:
+            errors.append('stored bars changed')
+    return errors
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the bulk downloader offline')
+    parser.add_argument('--symbols', default='./data/symbols_ns.csv')
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=0, help='requests/s per host (0 : no limit)')
+    args = parser.parse_args()
+
+    errors = check_empty_refresh()
+    if errors:
+        print('\n'.join(errors))
+        sys.exit('A refresh without new bars failed in {} places!'.format(len(errors)))
+    print('empty refresh ok')
+
+    symbols = [s + '.NS' for s in pd.read_csv(args.symbols)['Symbol']]
+    fetcher = FakeFetcher(latency=args.latency)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        store = get_store(tmpdir)
+
+        start = time.perf_counter()
+        for s in symbols:
+            store.save(s, fetcher.fetch(s))
+        serial = time.perf_counter() - start
+
+        bulk = BulkFetcher(fetcher=fetcher, max_workers=args.workers, rate=args.rate or None)
+        start = time.perf_counter()
+        bulk.fetch_all(symbols, store=store)
+        pooled = time.perf_counter() - start
+
+    print('{} symbols, latency {}s'.format(len(symbols), args.latency))
+    print('serial : {:.2f}s'.format(serial))
+    print('pool   : {:.2f}s ({} workers, {:.1f}x)'.format(pooled, args.workers, serial / pooled))
@@ -0,0 +1,35 @@
+# Microbenchmark of the figure construction paths
+# Runs the parity check of check_figure.py first (make_fast_figure must produce the
+# same json as make_graph(make_plot_data(...))), then times both paths on the app
+# imported by the check (temporary working directory, no warm start).
+#
+# usage: python benchmarks/bench_figure.py [--bars 250] [--repeat 50]
+
+import os, sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from check_figure import chart_types, graph_object_figure, fast_figure, encode, run_check
+
+
+def timeit(func, df, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        encode(func(df, 'Close', chart_types, 10))
+    return (time.perf_counter() - start) / repeat
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check and time the fast figure construction path')
+    parser.add_argument('--bars', type=int, default=250)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    df = run_check(args.bars)
+
+    slow = timeit(graph_object_figure, df, args.repeat)
+    fast = timeit(fast_figure, df, args.repeat)
+    print('graph objects : {:8.2f} ms per figure (build + encode)'.format(slow * 1000))
+    print('fast path     : {:8.2f} ms per figure (build + encode), {:.1f}x'.format(fast * 1000, slow / fast))
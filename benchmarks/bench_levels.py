@@ -0,0 +1,90 @@
+# Parity check and microbenchmark of the weekly / monthly / quarterly bars (resample.py)
+# The aggregated bars must match a pandas resample of the daily bars. The script exits
+# with an error if any level differs, then times, per level:
+#   resample : pandas resample of the daily bars (the cost of every request without the levels)
+#   full     : aggregation of all the daily bars (first write of a symbol)
+#   append   : store.append of one new daily bar (daily + incremental level writes)
+#   load     : read of the stored level file (what an interval change costs now)
+#
+# usage: python benchmarks/bench_levels.py [--bars 5000] [--repeat 20]
+
+import os, sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import resample
+from fetch import make_fake_stock
+from store import get_store, get_level_store, normalize_stock_frame
+
+# pandas rule of every level (periods labelled by their first day)
+pandas_rules = {'W': 'W-SUN', 'M': 'MS', 'Q': 'QS'}
+pandas_aggregations = {'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'}
+
+
+def pandas_bars(df, level):
+    bars = df.set_index('Date').resample(pandas_rules[level]).agg(pandas_aggregations)
+    bars = bars.dropna(subset=['Close'])
+    if level == 'W':
+        # labelled by the sunday closing the week
+        bars.index = bars.index - np.timedelta64(6, 'D')
+    return bars
+
+
+def check_parity(df, datadir):
+    errors = []
+    for level in resample.levels:
+        stored = get_level_store(datadir, level).load('BENCH.NS')
+        expected = pandas_bars(df, level)
+        if len(stored) != len(expected):
+            errors.append('{}: {} bars != {}'.format(level, len(stored), len(expected)))
+            continue
+        if not np.array_equal(stored['Date'].values, expected.index.values.astype('datetime64[ns]')):
+            errors.append('{}: dates differ'.format(level))
+        for c in pandas_aggregations:
+            if not np.allclose(stored[c].values, expected[c].values):
+                errors.append('{}: {} differs'.format(level, c))
+    return errors
+
+
+def timeit(func, repeat):
+    func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check and time the aggregated bar levels')
+    parser.add_argument('--bars', type=int, default=5000, help='daily bars (about 20 years)')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    df = normalize_stock_frame(make_fake_stock('BENCH.NS', nrows=args.bars))
+    arrays = {c: df[c].values for c in df.columns}
+    with tempfile.TemporaryDirectory() as datadir:
+        store = get_store(datadir)
+        # all the bars but the last one, appended below
+        store.save('BENCH.NS', df.iloc[:-1])
+        store.append('BENCH.NS', df.iloc[-1:])
+        errors = check_parity(df, datadir)
+        if errors:
+            print('\n'.join(errors))
+            sys.exit('The aggregated bars differ from pandas resample in {} places!'.format(len(errors)))
+        print('parity ok ({} daily bars)'.format(len(df)))
+
+        append = timeit(lambda: store.append('BENCH.NS', df.iloc[-1:]), args.repeat)
+        print('append 1 daily bar (all levels) : {:8.2f} ms'.format(append * 1000))
+        print('{:<6s} {:>6s} {:>14s} {:>12s} {:>12s}'.format('level', 'bars', 'resample (ms)', 'full (ms)', 'load (ms)'))
+        for level in resample.levels:
+            bar_store = get_level_store(datadir, level)
+            nbars = len(bar_store.load('BENCH.NS'))
+            t_pandas = timeit(lambda: pandas_bars(df, level), args.repeat)
+            t_full = timeit(lambda: resample.aggregate(arrays, level), args.repeat)
+            t_load = timeit(lambda: bar_store.load('BENCH.NS'), args.repeat)
+            print('{:<6s} {:>6d} {:>14.2f} {:>12.2f} {:>12.2f}'.format(
+                level, nbars, t_pandas * 1000, t_full * 1000, t_load * 1000))
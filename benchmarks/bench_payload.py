@@ -0,0 +1,66 @@
+# Response size and encode time of the server and compact render modes
+# Six (or --panels) synthetic stocks are rendered with all the chart types, as
+# plotly figures encoded by Dash (server mode) and as the compact payload
+# (compact mode).
+#
+# usage: python benchmarks/bench_payload.py [--bars 250] [--panels 6] [--repeat 20]
+
+import os, sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import plotly
+from check_figure import load_app
+from compact import PayloadBuilder
+from fetch import make_fake_stock
+from store import normalize_stock_frame
+
+# temporary working directory, no warm start (see check_figure.py)
+app = load_app()
+
+chart_name = ['StockPrice', 'Candlestick', 'SimpleMovingAverage']
+
+
+def server_response(frames):
+    figures = []
+    for df in frames:
+        data = app.make_plot_data(df, graph_name='Close', chart_name=chart_name, days=10,
+                                  max_points=app.max_points, max_candles=app.max_candles)
+        yaxis_limits = [app.ylims_perc[0]*df['Low'].min(), app.ylims_perc[1]*df['High'].max()]
+        figures.append(app.make_graph(data, yaxis_limits=yaxis_limits, xaxis_limits=app.date_range))
+    return json.dumps(figures, cls=plotly.utils.PlotlyJSONEncoder)
+
+
+def compact_response(frames):
+    builder = PayloadBuilder(len(frames))
+    for i, df in enumerate(frames):
+        traces = app.plot_arrays(df, 'Close', chart_name, 10, None, app.max_points, app.max_candles)
+        yaxis_limits = [app.ylims_perc[0]*df['Low'].min(), app.ylims_perc[1]*df['High'].max()]
+        builder.add_panel(i, traces, xrange=app.date_range, yrange=yaxis_limits)
+    return json.dumps(builder.build(), cls=plotly.utils.PlotlyJSONEncoder)
+
+
+def measure(func, frames, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        text = func(frames)
+    return len(text), (time.perf_counter() - start) / repeat
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the callback response size and encode time')
+    parser.add_argument('--bars', type=int, default=250)
+    parser.add_argument('--panels', type=int, default=6)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    # the same trading days for every panel, like the default symbols
+    frames = [normalize_stock_frame(make_fake_stock('SYM{}.NS'.format(i), nrows=args.bars, end='2021-12-31'))
+              for i in range(args.panels)]
+
+    for name, func in [('server ', server_response), ('compact', compact_response)]:
+        nbytes, seconds = measure(func, frames, args.repeat)
+        print('{} : {:>10,d} bytes  {:8.2f} ms'.format(name, nbytes, seconds * 1000))
@@ -0,0 +1,53 @@
+# Cold-start benchmark of the dashboard
+# Every run starts a fresh python process, imports the app and serves the first
+# page and layout through the Flask test client (no network is required).
+#
+# usage: python benchmarks/bench_startup.py [--runs 5] [--budget 3.0]
+
+import os, sys
+import json
+import argparse
+import subprocess
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# measured inside the child process
+child = '''
+import time, json
+start = time.perf_counter()
+import stocks_view_app
+imported = time.perf_counter()
+client = stocks_view_app.server.test_client()
+assert client.get('/').status_code == 200
+assert client.get('/_dash-layout').status_code == 200
+served = time.perf_counter()
+print(json.dumps(dict(import_s=imported - start, first_layout_s=served - start)))
+'''
+
+
+def cold_start(runs=5):
+    '''
+    Return the per-run timings (s) of importing the app and serving the first layout
+    '''
+    results = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', child], cwd=root, check=True,
+                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                             universal_newlines=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the cold start time of the app')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=3.0, help='max time (s) to the first served layout')
+    args = parser.parse_args()
+
+    results = cold_start(args.runs)
+    worst = max(r['first_layout_s'] for r in results)
+    for r in results:
+        print('import {import_s:.3f}s  first layout {first_layout_s:.3f}s'.format(**r))
+    print('worst first layout {:.3f}s (budget {:.3f}s)'.format(worst, args.budget))
+    if worst > args.budget:
+        sys.exit('Cold start over budget!')
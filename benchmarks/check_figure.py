@@ -0,0 +1,122 @@
+# Parity check of the figure construction paths
+# make_fast_figure (plain dicts from a pre-validated layout) must produce the same
+# json as make_graph(make_plot_data(...)) (plotly graph objects) for every chart
+# combination. The app is imported from a temporary working directory (its data
+# directory, registry and summary index) with the warm start off, so the check
+# neither downloads nor writes to ./data. The script exits with an error if any
+# combination differs (bench_figure.py times both paths).
+#
+# usage: python benchmarks/check_figure.py [--bars 250]
+
+import os, sys
+import json
+import shutil
+import itertools
+import argparse
+import tempfile
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+import numpy as np
+import plotly
+from fetch import make_fake_stock
+from store import normalize_stock_frame
+
+chart_types = ['StockPrice', 'Candlestick', 'SimpleMovingAverage']
+# working directory of the imported app, removed at exit
+workdir = None
+
+
+def load_app():
+    '''
+    Import the app from a temporary working directory (only the symbols file is copied), without warm start
+    '''
+    global workdir
+    if 'stocks_view_app' not in sys.modules:
+        workdir = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(workdir.name, 'data'))
+        shutil.copy(os.path.join(root, 'data', 'symbols_ns.csv'), os.path.join(workdir.name, 'data'))
+        os.chdir(workdir.name)
+        # warm start off: the default symbols are not stored here, it would download them
+        import utils
+        utils.warm_cache = lambda *args, **kwargs: None
+    import stocks_view_app
+    return stocks_view_app
+
+
+app = load_app()
+
+
+def graph_object_figure(df, graph_name, chart_name, days, xrange=None):
+    data = app.make_plot_data(df, graph_name=graph_name, chart_name=chart_name, days=days,
+                              xrange=xrange, max_points=app.max_points, max_candles=app.max_candles)
+    yaxis_limits = [app.ylims_perc[0]*df['Low'].min(), app.ylims_perc[1]*df['High'].max()]
+    return app.make_graph(data, yaxis_limits=yaxis_limits, xaxis_limits=xrange or app.date_range)
+
+
+def fast_figure(df, graph_name, chart_name, days, xrange=None):
+    traces = app.plot_arrays(df, graph_name, chart_name, days, xrange, app.max_points, app.max_candles)
+    yaxis_limits = [app.ylims_perc[0]*df['Low'].min(), app.ylims_perc[1]*df['High'].max()]
+    return app.make_fast_figure(traces, yaxis_limits=yaxis_limits, xaxis_limits=xrange or app.date_range)
+
+
+def encode(fig):
+    # the way Dash serializes the callback outputs
+    return json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+
+
+def same(a, b, path='figure'):
+    '''
+    Compare two decoded json values (floats with a relative tolerance), return the differences
+    '''
+    if isinstance(a, dict) and isinstance(b, dict):
+        if set(a) != set(b):
+            return ['{}: keys {} != {}'.format(path, sorted(a), sorted(b))]
+        return sum((same(a[k], b[k], '{}.{}'.format(path, k)) for k in a), [])
+    if isinstance(a, list) and isinstance(b, list):
+        if len(a) != len(b):
+            return ['{}: length {} != {}'.format(path, len(a), len(b))]
+        return sum((same(x, y, '{}[{}]'.format(path, i)) for i, (x, y) in enumerate(zip(a, b))), [])
+    if isinstance(a, float) or isinstance(b, float):
+        if a is None or b is None or not np.isclose(a, b, rtol=1e-12):
+            return ['{}: {} != {}'.format(path, a, b)]
+        return []
+    return [] if a == b else ['{}: {!r} != {!r}'.format(path, a, b)]
+
+
+def check_parity(df):
+    '''
+    Compare both paths for every chart type combination, price column and a zoomed range
+    '''
+    errors = []
+    for n in range(len(chart_types) + 1):
+        for chart_name in itertools.permutations(chart_types, n):
+            for graph_name in ['Open', 'Close']:
+                for xrange in [None, [str(df['Date'].iloc[len(df) // 3].date()),
+                                      str(df['Date'].iloc[len(df) // 2].date())]]:
+                    args = (df, graph_name, list(chart_name), 10, xrange)
+                    diff = same(json.loads(encode(graph_object_figure(*args))),
+                                json.loads(encode(fast_figure(*args))))
+                    errors += ['{} {} {}: {}'.format(list(chart_name), graph_name, xrange, d) for d in diff]
+    return errors
+
+
+def run_check(bars=250):
+    '''
+    Run the parity check on a synthetic stock of the given bars, exit with an error if it fails
+    '''
+    df = normalize_stock_frame(make_fake_stock('PARITY.NS', nrows=bars))
+    errors = check_parity(df)
+    if errors:
+        print('\n'.join(errors[:20]))
+        sys.exit('make_fast_figure differs from make_graph in {} places!'.format(len(errors)))
+    print('parity ok')
+    return df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check that the fast figure path matches the plotly figures')
+    parser.add_argument('--bars', type=int, default=250)
+    args = parser.parse_args()
+    run_check(args.bars)
@@ -0,0 +1,343 @@
+# Offline benchmark suite of the dashboard data and render path
+# Every scenario (bars of the panel symbols x symbols of the dropdown universe) gets a
+# temporary data directory with synthetic OHLC fixtures (fetch.make_fake_stock, the
+# columns of data/sample_stock.csv) and runs in a fresh python process, where yfinance
+# is replaced by a fake module serving the same fixtures (no network). Timed:
+#   startup.import, startup.first_layout : cold start of the app (one run per scenario)
+#   get_single_stock.download            : missing file, mocked yfinance + store write
+#   get_single_stock.load                : empty frame cache, read from the store
+#   get_single_stock.cached              : frame cache hit
+#   make_plot_data, make_graph           : traces and plotly figure of a panel (all the chart types)
+#   make_fast_figure                     : dict figure of the server callbacks (fast_figures)
+#   callback.figures.cold / .cached      : the six panels through the flask test client,
+#                                          empty / filled figure cache
+#   callback.movers, callback.analytics, callback.search
+# The scenarios vary the bars with the smallest universe and the universe with the
+# smallest bars. The results are written as json (--output). --compare prints the
+# median ratios to a previous result file (e.g. of the parent commit) and flags the
+# regressions. The other scripts of this directory are focused checks (figure parity
+# of check_figure.py, payload sizes, bulk download, data plane memory, startup budget).
+#
+# usage: python benchmarks/suite.py [--profile quick|full] [--output results.json]
+#        python benchmarks/suite.py --bars 250 1000000 --symbols 6 2000 --compare base.json
+
+import os, sys
+import json
+import time
+import types
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+import numpy as np
+import pandas as pd
+from fetch import make_fake_stock
+
+profiles = {'quick': dict(bars=[250, 5000, 100000], symbols=[6, 200], repeat=5),
+            'full': dict(bars=[250, 5000, 100000, 1000000, 2000000], symbols=[6, 200, 2000], repeat=10)}
+# symbols of the panels (stocks_view_app.default_symbols)
+panel_symbols = ['RELIANCE', 'TATAMOTORS', 'ADANIPORTS', 'GLAXO', 'INFY', 'IRCTC']
+# bars of the other symbols of the universe
+universe_bars = 500
+chart_name = ['StockPrice', 'Candlestick', 'SimpleMovingAverage']
+
+
+def fixture_frame(symbol, nrows):
+    '''
+    Synthetic stock dataframe (make_fake_stock), minute bars above 50000 rows (190 years of days)
+    '''
+    return make_fake_stock(symbol, nrows=nrows, end='2021-12-31', freq='B' if nrows <= 50000 else 'min')
+
+
+def make_fixtures(workdir, bars, n_symbols):
+    '''
+    Write the symbols file and the stored data of a scenario in workdir/data
+    '''
+    from store import get_store
+    from summary import get_summary_index
+
+    datadir = os.path.join(workdir, 'data')
+    os.makedirs(datadir)
+    symbols = panel_symbols + ['SYM{:04d}'.format(i) for i in range(max(n_symbols - len(panel_symbols), 0))]
+    pd.DataFrame({'Symbol': symbols, 'Name': ['{} Industries'.format(s) for s in symbols]}).to_csv(
+        os.path.join(datadir, 'symbols_ns.csv'), index=False)
+    store = get_store(datadir)
+    with get_summary_index(datadir).batch():
+        for s in symbols:
+            store.save(s + '.NS', fixture_frame(s + '.NS', bars if s in panel_symbols else universe_bars))
+
+
+def install_fake_yfinance(nrows):
+    '''
+    Replace yfinance by a module serving fixture_frame data
+    '''
+    frames = {}
+
+    class Ticker:
+        def __init__(self, symbol):
+            self.symbol = symbol
+
+        def history(self, period='1y', start=None, **kwargs):
+            if self.symbol not in frames:
+                frames[self.symbol] = fixture_frame(self.symbol, nrows)
+            df = frames[self.symbol]
+            if start is not None:
+                df = df[df.index >= pd.Timestamp(start)]
+            return df.copy()
+
+    module = types.ModuleType('yfinance')
+    module.Ticker = Ticker
+    sys.modules['yfinance'] = module
+
+
+def measure(func, repeat, setup=None, warmup=1):
+    '''
+    Time repeat calls of func (setup is called before each, not timed) after
+    warmup untimed calls (imports, memoized layouts, ...)
+
+    Output
+    ------
+    dict of min, median, mean and max (ms)
+    '''
+    for _ in range(warmup):
+        if setup is not None:
+            setup()
+        func()
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    times = np.array(times) * 1000
+    return dict(repeat=repeat, min_ms=float(times.min()), median_ms=float(np.median(times)),
+                mean_ms=float(times.mean()), max_ms=float(times.max()))
+
+
+def callback_payload(deps, output, outputs, inputs, state=None):
+    '''
+    Body of a /_dash-update-component request for the callback whose output contains output
+    '''
+    spec = [d for d in deps if output in d['output']][0]
+    return {'output': spec['output'], 'outputs': outputs, 'inputs': inputs, 'state': state or [],
+            'changedPropIds': []}
+
+
+def run_scenario(bars, repeat):
+    '''
+    Time the scenario of the fixture directory (current directory), in the child process
+    '''
+    results = []
+
+    def add(name, timing, **extra):
+        results.append(dict(timing, name=name, **extra))
+
+    def once(seconds):
+        return dict(repeat=1, min_ms=seconds * 1000, median_ms=seconds * 1000,
+                    mean_ms=seconds * 1000, max_ms=seconds * 1000)
+
+    install_fake_yfinance(bars)
+    start = time.perf_counter()
+    import stocks_view_app as app
+    imported = time.perf_counter()
+    client = app.server.test_client()
+    assert client.get('/').status_code == 200
+    layout = client.get('/_dash-layout')
+    assert layout.status_code == 200
+    served = time.perf_counter()
+    add('startup.import', once(imported - start))
+    add('startup.first_layout', once(served - start), bytes=len(layout.data))
+    # the background warm cache must not overlap the timings
+    for thread in threading.enumerate():
+        if thread.name == 'warm-cache':
+            thread.join()
+
+    from utils import get_single_stock, frame_cache
+    from store import get_store
+    store = get_store(app.datadir)
+    add('get_single_stock.download',
+        measure(lambda: get_single_stock('DOWNLOAD', period=app.period, datadir=app.datadir, cache=False),
+                repeat, setup=lambda: store.exists('DOWNLOAD.NS') and store.remove('DOWNLOAD.NS')))
+    add('get_single_stock.load',
+        measure(lambda: get_single_stock(panel_symbols[0], period=app.period, datadir=app.datadir),
+                repeat, setup=frame_cache.invalidate))
+    add('get_single_stock.cached',
+        measure(lambda: get_single_stock(panel_symbols[0], period=app.period, datadir=app.datadir), repeat))
+
+    df = app.load_stock(panel_symbols[0])
+    yaxis_limits = app.stock_yaxis_limits(df)
+    add('make_plot_data', measure(lambda: app.make_plot_data(
+        df, 'Close', chart_name, 10, max_points=app.max_points, max_candles=app.max_candles), repeat))
+    data = app.make_plot_data(df, 'Close', chart_name, 10, max_points=app.max_points, max_candles=app.max_candles)
+    add('make_graph', measure(lambda: app.make_graph(data, yaxis_limits=yaxis_limits,
+                                                     xaxis_limits=app.date_range), repeat))
+    add('make_fast_figure', measure(lambda: app.make_fast_figure(
+        app.plot_arrays(df, 'Close', chart_name, 10, None, app.max_points, app.max_candles),
+        yaxis_limits=yaxis_limits, xaxis_limits=app.date_range), repeat))
+
+    deps = client.get('/_dash-dependencies').get_json()
+
+    def post(payload):
+        response = client.post('/_dash-update-component', json=payload)
+        assert response.status_code in (200, 204), response.data[:200]
+        return response
+
+    n = app.n_panels
+    values = [app.default_symbols[i % len(app.default_symbols)] for i in range(n)]
+    panel_inputs = [[{'id': {'index': i, 'type': 'drop'}, 'property': 'value', 'value': values[i]}
+                     for i in range(n)],
+                    [{'id': {'index': i, 'type': 'stock'}, 'property': 'relayoutData', 'value': None}
+                     for i in range(n)],
+                    {'id': 'stock-price', 'property': 'value', 'value': 'Close'},
+                    {'id': 'chart-type', 'property': 'value', 'value': chart_name},
+                    {'id': 'days', 'property': 'value', 'value': 10},
+                    {'id': 'interval', 'property': 'value', 'value': app.bar_interval}]
+    if app.render_mode in ('server', 'compact'):
+        if app.render_mode == 'server':
+            payload = callback_payload(deps, '"type":"stock"}.figure',
+                                       [{'id': {'index': i, 'type': 'stock'}, 'property': 'figure'}
+                                        for i in range(n)], panel_inputs)
+        else:
+            payload = callback_payload(deps, 'figure-payload', {'id': 'figure-payload', 'property': 'data'},
+                                       panel_inputs)
+        response = post(payload)
+        add('callback.figures.cold', measure(lambda: post(payload), repeat, setup=app.figure_cache.clear),
+            bytes=len(response.data))
+        add('callback.figures.cached', measure(lambda: post(payload), repeat), bytes=len(response.data))
+
+    movers = callback_payload(deps, 'movers-gainers',
+                              [{'id': 'movers-gainers', 'property': 'children'},
+                               {'id': 'movers-losers', 'property': 'children'}],
+                              [{'id': 'movers-horizon', 'property': 'value', 'value': '1m'}])
+    add('callback.movers', measure(lambda: post(movers), repeat))
+
+    analytics = callback_payload(deps, 'corr-heatmap',
+                                 [{'id': 'corr-heatmap', 'property': 'figure'},
+                                  {'id': 'rs-ranking', 'property': 'children'}],
+                                 [{'id': 'analytics-horizon', 'property': 'value', 'value': '3m'}])
+    add('callback.analytics', measure(lambda: post(analytics), repeat))
+
+    if app.symbol_search:
+        drop = {'index': 0, 'type': 'drop'}
+        search = callback_payload(deps, '"type":"drop"}.options', {'id': drop, 'property': 'options'},
+                                  [{'id': drop, 'property': 'search_value', 'value': 'sym00'}],
+                                  [{'id': drop, 'property': 'value', 'value': values[0]}])
+        add('callback.search', measure(lambda: post(search), repeat))
+    return results
+
+
+def run_child(bars, n_symbols, repeat):
+    '''
+    Make the fixtures of a scenario and time it in a new python process
+    '''
+    with tempfile.TemporaryDirectory() as workdir:
+        start = time.perf_counter()
+        make_fixtures(workdir, bars, n_symbols)
+        print('[{} bars, {} symbols] fixtures in {:.1f}s'.format(bars, n_symbols, time.perf_counter() - start))
+        # the app reads its data relative to the working directory
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', str(bars), str(repeat)],
+                              cwd=workdir, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              universal_newlines=True)
+        if proc.returncode != 0:
+            sys.stderr.write(proc.stderr[-3000:])
+            raise RuntimeError('scenario {} bars, {} symbols failed'.format(bars, n_symbols))
+        results = json.loads(proc.stdout.strip().splitlines()[-1])
+    for r in results:
+        r.update(bars=bars, symbols=n_symbols)
+    return results
+
+
+def metadata(profile):
+    '''
+    Commit, versions and machine of the run
+    '''
+    import dash, plotly
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=root, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, universal_newlines=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return dict(commit=commit, time=time.strftime('%Y-%m-%dT%H:%M:%S'), profile=profile,
+                python=platform.python_version(), numpy=np.__version__, pandas=pd.__version__,
+                dash=dash.__version__, plotly=plotly.__version__,
+                platform=platform.platform(), cpus=os.cpu_count())
+
+
+def compare(results, baseline, threshold=0.2, min_delta_ms=1.0):
+    '''
+    Print the median ratios to the baseline results
+
+    Output
+    ------
+    number of regressions (ratio above 1 + threshold and slower by more than min_delta_ms)
+    '''
+    base = {(r['name'], r['bars'], r['symbols']): r for r in baseline['results']}
+    regressions = 0
+    print('\n{:<28s} {:>9s} {:>8s} {:>12s} {:>12s} {:>7s}'.format('benchmark', 'bars', 'symbols',
+                                                               'base (ms)', 'now (ms)', 'ratio'))
+    for r in results:
+        b = base.get((r['name'], r['bars'], r['symbols']))
+        if b is None:
+            continue
+        ratio = r['median_ms'] / b['median_ms'] if b['median_ms'] else float('inf')
+        flag = ''
+        if ratio > 1 + threshold and r['median_ms'] - b['median_ms'] > min_delta_ms:
+            regressions += 1
+            flag = '  REGRESSION'
+        print('{:<28s} {:>9d} {:>8d} {:>12.3f} {:>12.3f} {:>6.2f}x{}'.format(
+            r['name'], r['bars'], r['symbols'], b['median_ms'], r['median_ms'], ratio, flag))
+    return regressions
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--child':
+        # scenario process, started by run_child in the fixture directory
+        sys.path.insert(0, root)
+        results = run_scenario(int(sys.argv[2]), int(sys.argv[3]))
+        print(json.dumps(results))
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description='Run the offline benchmark suite of the dashboard')
+    parser.add_argument('--profile', default='quick', choices=sorted(profiles))
+    parser.add_argument('--bars', type=int, nargs='+', help='bars of the panel symbols (overrides the profile)')
+    parser.add_argument('--symbols', type=int, nargs='+', help='symbols of the universe (overrides the profile)')
+    parser.add_argument('--repeat', type=int, default=None)
+    parser.add_argument('--output', default=None, help='json result file')
+    parser.add_argument('--compare', default=None, help='json result file of a previous run')
+    parser.add_argument('--threshold', type=float, default=0.2, help='regression threshold of --compare')
+    parser.add_argument('--min-delta', type=float, default=1.0,
+                        help='ignore the regressions of less than MIN_DELTA ms (timer noise)')
+    args = parser.parse_args()
+
+    config = profiles[args.profile]
+    bars = sorted(args.bars or config['bars'])
+    symbols = sorted(max(s, len(panel_symbols)) for s in (args.symbols or config['symbols']))
+    repeat = args.repeat or config['repeat']
+    # every bars scale with the smallest universe, every universe with the smallest bars
+    scenarios = [(b, symbols[0]) for b in bars] + [(bars[0], s) for s in symbols[1:]]
+
+    results = []
+    for b, s in scenarios:
+        results += run_child(b, s, repeat)
+
+    print('\n{:<28s} {:>9s} {:>8s} {:>12s} {:>12s}'.format('benchmark', 'bars', 'symbols', 'median (ms)', 'min (ms)'))
+    for r in results:
+        print('{:<28s} {:>9d} {:>8d} {:>12.3f} {:>12.3f}'.format(r['name'], r['bars'], r['symbols'],
+                                                               r['median_ms'], r['min_ms']))
+
+    report = dict(meta=metadata(args.profile), results=results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+        print('Results written to {}'.format(args.output))
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold, args.min_delta)
+        if regressions:
+            sys.exit('{} regressions over {:.0%}'.format(regressions, args.threshold))
@@ -0,0 +1,300 @@
+# Caches used by the dashboard
+# The frame cache keeps parsed stock dataframes so that repeated renders of the
+# same symbol never go back to the disk / csv parser. The figure caches keep the
+# figures of the callbacks: as figure objects in memory (a hit is returned as it is,
+# without parsing) or as json files in a directory shared by several worker processes.
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class FrameCache:
+    '''
+    Bounded, thread-safe LRU cache of parsed stock dataframes
+
+    Entries are keyed by (symbol, period) and tagged with the modification time
+    of the file they were read from. A lookup with a different mtime is treated
+    as a miss and the stale entry is dropped. Once the total memory of the cached
+    dataframes exceeds max_bytes, the least recently used entries are evicted.
+
+    Input parameters
+    ----------------
+    max_bytes : int, memory budget for all cached dataframes (default : 256 MB)
+    '''
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> (mtime, nbytes, dataframe), oldest first
+        self._frames = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __contains__(self, key):
+        return key in self._frames
+
+    def get(self, key, mtime=None):
+        '''
+        Return the cached dataframe for key or None
+
+        Input parameters
+        ----------------
+        key   : hashable, cache key e.g. (symbol, period)
+        mtime : file modification time the entry must match (default : None, no check)
+
+        Output
+        ------
+        cached dataframe or None (miss)
+        '''
+        with self._lock:
+            entry = self._frames.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if mtime is not None and entry[0] != mtime:
+                # the file changed on disk since it was cached
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._frames.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, df, mtime=None):
+        '''
+        Add (or replace) a dataframe in the cache and evict the LRU entries if required
+
+        Input parameters
+        ----------------
+        key   : hashable, cache key e.g. (symbol, period)
+        df    : dataframe to cache (treated as read-only by the callers)
+        mtime : modification time of the source file (default : None)
+        '''
+        nbytes = int(df.memory_usage(index=True, deep=True).sum())
+        with self._lock:
+            if key in self._frames:
+                self._remove(key)
+            # never keep a single frame bigger than the whole budget
+            if nbytes > self.max_bytes:
+                return
+            self._frames[key] = (mtime, nbytes, df)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                old_key = next(iter(self._frames))
+                self._remove(old_key)
+                self.evictions += 1
+
+    def invalidate(self, key=None):
+        '''
+        Drop a single entry (key) or the whole cache (key=None)
+        '''
+        with self._lock:
+            if key is None:
+                self._frames.clear()
+                self.nbytes = 0
+            elif key in self._frames:
+                self._remove(key)
+
+    def stats(self):
+        '''
+        Return the cache counters as dict
+        '''
+        with self._lock:
+            return dict(entries=len(self._frames),
+                        nbytes=self.nbytes,
+                        max_bytes=self.max_bytes,
+                        hits=self.hits,
+                        misses=self.misses,
+                        evictions=self.evictions)
+
+    def _remove(self, key):
+        _, nbytes, _ = self._frames.pop(key)
+        self.nbytes -= nbytes
+
+
+class FigureCache:
+    '''
+    Bounded, thread-safe LRU cache of figures (dicts / plotly figures) in memory
+
+    The figures are kept as objects, a hit is returned without parsing. Every entry
+    is accounted with the size given when the figure is added (e.g. bytes of its arrays).
+
+    Input parameters
+    ----------------
+    max_bytes : int, memory budget for all cached figures (default : 64 MB)
+    '''
+    # entries are figure objects, not json strings (see DiskFigureCache)
+    serialized = False
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> (figure, nbytes), oldest first
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._figures)
+
+    def get(self, key):
+        '''
+        Return the cached figure for key or None (miss)
+        '''
+        with self._lock:
+            entry = self._figures.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._figures.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, figure, nbytes):
+        '''
+        Add (or replace) the figure for key and evict the LRU entries if required
+
+        Input parameters
+        ----------------
+        key    : hashable
+        figure : figure dict or plotly figure, not modified afterwards
+        nbytes : int, size of the figure
+        '''
+        with self._lock:
+            if key in self._figures:
+                self.nbytes -= self._figures.pop(key)[1]
+            if nbytes > self.max_bytes:
+                return
+            self._figures[key] = (figure, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                _, (_, old) = self._figures.popitem(last=False)
+                self.nbytes -= old
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._figures.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        '''
+        Return the cache counters as dict
+        '''
+        with self._lock:
+            return dict(entries=len(self._figures), nbytes=self.nbytes, max_bytes=self.max_bytes,
+                        hits=self.hits, misses=self.misses, evictions=self.evictions)
+
+
+class DiskFigureCache:
+    '''
+    Size-bounded cache of serialized (json) figures in a directory
+
+    The directory can be shared by several worker processes. Every figure is a
+    file named after the hash of its key, written atomically (temp file + rename).
+    A hit refreshes the file modification time, and once the directory grows over
+    max_bytes the least recently used files are deleted.
+
+    Input parameters
+    ----------------
+    cachedir    : directory of the cached figures
+    max_bytes   : int, disk budget for all cached figures (default : 256 MB)
+    check_every : int, number of writes between two size checks (default : 32)
+    '''
+    # entries are json strings
+    serialized = True
+
+    def __init__(self, cachedir, max_bytes=256 * 1024 * 1024, check_every=32):
+        self.cachedir = os.path.abspath(os.path.expanduser(cachedir))
+        os.makedirs(self.cachedir, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.check_every = check_every
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def path(self, key):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.cachedir, digest + '.json')
+
+    def get(self, key):
+        '''
+        Return the cached figure json for key or None (miss)
+        '''
+        filename = self.path(key)
+        try:
+            with open(filename) as f:
+                text = f.read()
+            os.utime(filename)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return text
+
+    def put(self, key, text):
+        '''
+        Write the figure json for key and evict the LRU files if required
+        '''
+        filename = self.path(key)
+        tmpname = '{}.{}.{}.tmp'.format(filename, os.getpid(), threading.get_ident())
+        with open(tmpname, 'w') as f:
+            f.write(text)
+        os.replace(tmpname, filename)
+
+        with self._lock:
+            self._writes += 1
+            check = self._writes % self.check_every == 0
+        if check:
+            self.evict()
+
+    def evict(self):
+        '''
+        Delete the least recently used files until the directory fits in max_bytes
+        '''
+        files = []
+        for entry in os.scandir(self.cachedir):
+            if entry.name.endswith('.json'):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, entry.path))
+        total = sum(f[1] for f in files)
+        for _, size, filename in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(filename)
+            except OSError:
+                # already removed by another worker
+                pass
+            total -= size
+            with self._lock:
+                self.evictions += 1
+
+    def clear(self):
+        for entry in os.scandir(self.cachedir):
+            if entry.name.endswith('.json'):
+                os.remove(entry.path)
+
+    def stats(self):
+        '''
+        Return the cache counters (of this process) as dict
+        '''
+        with self._lock:
+            return dict(max_bytes=self.max_bytes, hits=self.hits, misses=self.misses,
+                        evictions=self.evictions)
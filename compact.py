@@ -0,0 +1,88 @@
+# Compact encoding of the stock panels for the browser
+# The traces are sent as base64-packed little-endian typed arrays (float32 prices,
+# float64 millisecond timestamps) instead of json lists of numbers and date strings.
+# Identical date axes are sent once per response and shared by all the traces and
+# panels that use them. The static styling is not repeated either: a panel only
+# carries its axis ranges, the rest comes from the figure-layout store
+# (see render_payload in assets/clientside.js).
+
+import base64
+import numpy as np
+
+
+def encode_array(values, dtype='float32'):
+    '''
+    Encode a numeric array as {'dtype': 'f4'|'f8', 'b64': base64 string}
+    '''
+    values = np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder('<'))
+    return {'dtype': 'f{}'.format(values.itemsize),
+            'b64': base64.b64encode(values.tobytes()).decode('ascii')}
+
+
+def decode_array(encoded):
+    '''
+    Decode an array encoded by encode_array
+    '''
+    return np.frombuffer(base64.b64decode(encoded['b64']), dtype='<' + encoded['dtype'])
+
+
+def date_ms(dates):
+    '''
+    Convert datetime64 dates to float64 milliseconds since the epoch (plotly date axis values)
+    '''
+    return np.asarray(dates).astype('datetime64[ms]').astype('int64').astype('float64')
+
+
+class PayloadBuilder:
+    '''
+    Build the compact payload of the changed panels of one callback response
+
+    Output (build)
+    --------------
+    dict with
+        n_panels : int, number of panels in the page
+        axes     : list of encoded date axes (float64 ms), shared by the traces
+        panels   : dict of panel position -> {'traces': [...], 'xrange': [...], 'yrange': [...]}
+                   each trace is {'name', 'x': axis number, <column>: encoded float32 array}
+    '''
+
+    def __init__(self, n_panels, float_dtype='float32'):
+        self.n_panels = n_panels
+        self.float_dtype = float_dtype
+        self.axes = []
+        self.panels = {}
+        self._axis_ids = {}
+
+    def add_axis(self, dates):
+        '''
+        Add a date axis (once for identical dates) and return its number
+        '''
+        ms = date_ms(dates)
+        key = ms.tobytes()
+        if key not in self._axis_ids:
+            self._axis_ids[key] = len(self.axes)
+            self.axes.append(encode_array(ms, dtype='float64'))
+        return self._axis_ids[key]
+
+    def add_panel(self, position, traces, xrange=None, yrange=None):
+        '''
+        Add a panel
+
+        Input parameters
+        ----------------
+        position : int, panel position in the page
+        traces   : list of (name, dates, {column: values}) e.g. ('StockPrice', dates, {'y': close})
+        xrange   : list, [start, end] dates of the x axis
+        yrange   : list, [min, max] of the y axis
+        '''
+        encoded = []
+        for name, dates, columns in traces:
+            trace = {'name': name, 'x': self.add_axis(dates)}
+            for column, values in columns.items():
+                trace[column] = encode_array(values, dtype=self.float_dtype)
+            encoded.append(trace)
+        self.panels[position] = {'traces': encoded, 'xrange': xrange,
+                                 'yrange': None if yrange is None else [float(v) for v in yrange]}
+
+    def build(self):
+        return {'n_panels': self.n_panels, 'axes': self.axes, 'panels': self.panels}
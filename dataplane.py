@@ -0,0 +1,209 @@
+# Shared-memory data plane for multi-process deployments (e.g. gunicorn workers)
+# A loader process publishes the OHLC arrays of every symbol as one segment file in
+# a shared memory directory (/dev/shm by default, same layout as the columnar store).
+# The workers memory map the segments read-only and use the mapped arrays in place
+# (SharedFrame), the pages are shared by all the processes through the page cache:
+# adding a worker does not add a copy of the data.
+#
+# A segment is replaced atomically (written to a temporary file and renamed), its
+# header records the version (modification time of the stored file) it was made
+# from. A worker keeps using the old mapping until its next attach notices the new
+# file, the old pages are freed once nobody maps them any more.
+#
+# usage: python dataplane.py [--datadir ./data/] [--plane DIR] [--watch 60]
+
+import os, sys
+import time
+import tempfile
+import threading
+import argparse
+import numpy as np
+import pandas as pd
+from store import ColumnarStore, get_store, ohlc_dtypes
+from registry import get_registry
+
+
+def default_plane_dir():
+    '''
+    Shared memory directory of the segments (/dev/shm if available)
+    '''
+    root = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(root, 'finance_dashboard')
+
+
+class SharedFrame:
+    '''
+    Read-only stock "dataframe" backed by the arrays of a mapped segment
+
+    Supports the dataframe operations used by the app: df[column] (a pandas Series
+    on the mapped array, no copy), len(df), df.columns and df.attrs. Use
+    to_frame() for a regular (copied) dataframe.
+
+    Input parameters
+    ----------------
+    arrays : dict of column name -> numpy array
+    attrs  : dict, e.g. {'symbol': 'RELIANCE', 'version': mtime}
+    '''
+
+    def __init__(self, arrays, attrs=None):
+        self._arrays = arrays
+        self.attrs = dict(attrs or {})
+
+    @property
+    def columns(self):
+        return list(self._arrays)
+
+    def __contains__(self, column):
+        return column in self._arrays
+
+    def __len__(self):
+        return len(self._arrays['Date'])
+
+    def __getitem__(self, column):
+        return pd.Series(self._arrays[column], name=column, copy=False)
+
+    def to_frame(self):
+        df = pd.DataFrame({c: np.array(v) for c, v in self._arrays.items()})
+        df.attrs.update(self.attrs)
+        return df
+
+
+class DataPlane(ColumnarStore):
+    '''
+    Segments of the published stock data, one file per symbol: <planedir>/<symbol>.seg
+
+    Input parameters
+    ----------------
+    planedir : shared memory directory (default : None, default_plane_dir())
+    '''
+    ext = '.seg'
+    summarized = False
+    aggregated = False
+
+    def __init__(self, planedir=None):
+        planedir = planedir or default_plane_dir()
+        os.makedirs(planedir, exist_ok=True)
+        super().__init__(planedir)
+        self._lock = threading.Lock()
+        # symbol -> ((inode, mtime) of the mapped file, SharedFrame)
+        self._attached = {}
+
+    def publish(self, symbol, arrays, version=None):
+        '''
+        Atomically replace the segment of symbol
+
+        Input parameters
+        ----------------
+        symbol  : str, stock symbol with extension (e.g. 'RELIANCE.NS')
+        arrays  : dict of column name -> numpy array (e.g. ColumnarStore.load_columns)
+                  or stock dataframe
+        version : int, modification time (ns) of the stored file the data comes from
+        '''
+        if isinstance(arrays, pd.DataFrame):
+            columns = self._column_arrays(arrays)
+        else:
+            columns = []
+            for name, values in arrays.items():
+                dtype = 'datetime64[ns]' if name == 'Date' else ohlc_dtypes.get(name, 'float64')
+                columns.append((name, np.asarray(values).astype(np.dtype(dtype).newbyteorder('<'), copy=False)))
+
+        outname = self.path(symbol)
+        tmpname = '{}.{}.{}.tmp'.format(outname, os.getpid(), threading.get_ident())
+        try:
+            self._write_arrays(tmpname, columns, meta={'version': version})
+            os.replace(tmpname, outname)
+        finally:
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+
+    def version(self, symbol):
+        '''
+        Return the version of the published segment of symbol or None
+        '''
+        frame = self.attach(symbol)
+        return None if frame is None else frame.attrs['version']
+
+    def attach(self, symbol, name=None):
+        '''
+        Map the current segment of symbol (read-only, zero-copy)
+
+        Input parameters
+        ----------------
+        symbol : str, stock symbol with extension (e.g. 'RELIANCE.NS', 'VOD.L')
+        name   : str, symbol of the frame attrs, e.g. the registry symbol 'RELIANCE'
+                 (default : None, symbol)
+
+        Output
+        ------
+        SharedFrame or None if the symbol is not published
+        '''
+        try:
+            st = os.stat(self.path(symbol))
+        except OSError:
+            return None
+        key = (st.st_ino, st.st_mtime_ns)
+        with self._lock:
+            attached = self._attached.get(symbol)
+            if attached is not None and attached[0] == key:
+                if name is not None:
+                    attached[1].attrs['symbol'] = name
+                return attached[1]
+
+        header, arrays = self.map_columns(symbol)
+        frame = SharedFrame(arrays, attrs={'symbol': name or symbol, 'version': header.get('version')})
+        with self._lock:
+            self._attached[symbol] = (key, frame)
+        return frame
+
+    def publish_store(self, store, symbols=None):
+        '''
+        Publish the stored symbols whose segment is missing or outdated
+
+        Input parameters
+        ----------------
+        store   : store object (see store.py)
+        symbols : list of symbols with extension (default : None, the stored symbols of
+                  all the exchanges, see registry.py)
+
+        Output
+        ------
+        list of published symbols
+        '''
+        if symbols is None:
+            registry = get_registry(store.datadir)
+            symbols = [registry.get(s).ticker for s in registry.stored()]
+        published = []
+        for symbol in symbols:
+            version = store.mtime(symbol)
+            if version is None or self.version(symbol) == version:
+                continue
+            if hasattr(store, 'load_columns'):
+                arrays = store.load_columns(symbol)
+            else:
+                arrays = store.load(symbol)
+            self.publish(symbol, arrays, version=version)
+            published.append(symbol)
+        return published
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Publish the stored stock data to the shared memory data plane')
+    parser.add_argument('--datadir', default='./data/')
+    parser.add_argument('--plane', default=None, help='segment directory (default : {})'.format(default_plane_dir()))
+    parser.add_argument('--watch', type=float, default=None,
+                        help='keep publishing the changed files every WATCH seconds')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.datadir):
+        sys.exit('Directory {} does not exist!'.format(args.datadir))
+    store = get_store(args.datadir)
+    plane = DataPlane(args.plane)
+    while True:
+        start = time.time()
+        published = plane.publish_store(store)
+        if published or args.watch is None:
+            print('Published {} symbols to {} in {:.2f}s'.format(len(published), plane.datadir,
+                                                                 time.time() - start))
+        if args.watch is None:
+            break
+        time.sleep(args.watch)
@@ -0,0 +1,113 @@
+# Shape-preserving downsampling of the plotted series
+# Lines use the Largest-Triangle-Three-Buckets (LTTB) algorithm, which keeps the
+# visually important points (peaks and troughs). Candles are re-bucketed into
+# coarser OHLC bars (first open, highest high, lowest low, last close).
+
+import numpy as np
+
+
+def lttb_indices(x, y, n_out):
+    '''
+    Select the indices of n_out points of a line with the LTTB algorithm
+
+    Input parameters
+    ----------------
+    x     : numpy array, increasing x values (numeric)
+    y     : numpy array, y values (no missing values)
+    n_out : int, number of points to keep
+
+    Output
+    ------
+    numpy array of the selected indices (first and last point always included)
+    '''
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+
+    # n_out - 2 buckets between the first and the last point
+    edges = np.linspace(1, n - 1, n_out - 1).astype('int64')
+    out = np.empty(n_out, dtype='int64')
+    out[0] = 0
+    out[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # average point of the next bucket (the last point for the last bucket)
+        nlo = hi
+        nhi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[nlo:nhi].mean()
+        avg_y = y[nlo:nhi].mean()
+        # keep the point making the largest triangle with the previous pick and the next average
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def downsample_line(x, y, n_out):
+    '''
+    Downsample a line (datetime or numeric x) to about n_out points, missing y values are dropped
+
+    Output
+    ------
+    downsampled x and y arrays
+    '''
+    x = np.asarray(x)
+    y = np.asarray(y, dtype='float64')
+    if n_out is None or len(x) <= n_out:
+        return x, y
+    valid = np.flatnonzero(~np.isnan(y))
+    xnum = x[valid].astype('int64') if np.issubdtype(x.dtype, np.datetime64) else x[valid]
+    keep = valid[lttb_indices(xnum, y[valid], n_out)]
+    return x[keep], y[keep]
+
+
+def downsample_ohlc(dates, open_, high, low, close, n_out):
+    '''
+    Re-bucket OHLC bars into at most n_out coarser bars
+
+    Output
+    ------
+    dates (first date of every bucket), open, high, low and close arrays
+    '''
+    n = len(dates)
+    if n_out is None or n <= n_out:
+        return dates, open_, high, low, close
+    starts = np.linspace(0, n, n_out, endpoint=False).astype('int64')
+    ends = np.append(starts[1:], n) - 1
+    return (np.asarray(dates)[starts], np.asarray(open_)[starts],
+            np.maximum.reduceat(np.asarray(high), starts),
+            np.minimum.reduceat(np.asarray(low), starts),
+            np.asarray(close)[ends])
+
+
+def visible_rows(dates, xrange=None):
+    '''
+    Return the slice of rows inside the [start, end] date range (plus one bar on each side)
+
+    Input parameters
+    ----------------
+    dates  : numpy datetime64 array, increasing dates
+    xrange : list, [start, end] dates (default : None, all rows)
+    '''
+    if not xrange:
+        return slice(None)
+    start, end = np.datetime64(xrange[0], 'ns'), np.datetime64(xrange[1], 'ns')
+    lo = max(int(np.searchsorted(dates, start, side='left')) - 1, 0)
+    hi = min(int(np.searchsorted(dates, end, side='right')) + 1, len(dates))
+    return slice(lo, hi)
+
+
+def relayout_xrange(relayout):
+    '''
+    Return the zoomed [start, end] x range of a dcc.Graph relayoutData or None (full range)
+    '''
+    if not relayout:
+        return None
+    if 'xaxis.range[0]' in relayout and 'xaxis.range[1]' in relayout:
+        return [relayout['xaxis.range[0]'], relayout['xaxis.range[1]']]
+    if 'xaxis.range' in relayout:
+        return list(relayout['xaxis.range'])
+    return None
@@ -0,0 +1,414 @@
+# Bulk download of stock history data
+# The BulkFetcher runs a pluggable fetcher (Yahoo finance or a local fake source)
+# on a bounded thread pool with per-host rate limiting and retries, and hands every
+# finished symbol back (and to the store) as soon as it completes.
+
+import os
+import json
+import time
+import logging
+import random
+import threading
+import socketserver
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class FetchError(Exception):
+    '''
+    Raised when a symbol could not be fetched after all the retries
+    '''
+
+
+class YahooFetcher:
+    '''
+    Fetch stock history data from Yahoo finance (yfinance)
+    '''
+    host = 'query1.finance.yahoo.com'
+
+    def fetch(self, symbol, period='1y', start=None):
+        '''
+        Return the stock history dataframe of symbol (e.g. 'RELIANCE.NS') for period,
+        or from the start date onwards if start is given
+        '''
+        import yfinance as yf
+        if start is not None:
+            return yf.Ticker(symbol).history(start=start)
+        return yf.Ticker(symbol).history(period=period)
+
+    def listed(self, symbols):
+        '''
+        Return the subset of symbols that have a price for the last trading day
+        (a single batched request for all symbols)
+        '''
+        import yfinance as yf
+        df = yf.download(list(symbols), period='1d', group_by='ticker',
+                         threads=False, progress=False)
+        if df.empty:
+            return set()
+        if len(symbols) == 1:
+            return set(symbols) if df['Close'].notna().any() else set()
+        return set(s for s in symbols
+                   if s in df.columns.get_level_values(0) and df[s]['Close'].notna().any())
+
+
+class FakeFetcher:
+    '''
+    Local fake data source with injected latency, used to benchmark/test offline
+
+    Input parameters
+    ----------------
+    latency      : float, seconds spent in every fetch call (default : 0.05)
+    jitter       : float, random extra latency in [0, jitter] seconds (default : 0)
+    failure_rate : float, probability for a fetch to raise an error (default : 0)
+    nrows        : int, number of daily bars per symbol (default : 250)
+    host         : str, host name used for rate limiting (default : 'fake')
+    unlisted     : list, symbols reported as not listed by listed() (default : None)
+    '''
+
+    def __init__(self, latency=0.05, jitter=0.0, failure_rate=0.0, nrows=250, host='fake',
+                 unlisted=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.nrows = nrows
+        self.host = host
+        self.unlisted = set(unlisted or [])
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def fetch(self, symbol, period='1y', start=None):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency + random.uniform(0, self.jitter))
+        if random.random() < self.failure_rate:
+            raise IOError('Injected failure for {}'.format(symbol))
+        df = make_fake_stock(symbol, nrows=self.nrows)
+        if start is not None:
+            df = df[df.index >= pd.Timestamp(start)]
+        return df
+
+    def listed(self, symbols):
+        '''
+        Return the subset of symbols that are listed (not in self.unlisted)
+        '''
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency + random.uniform(0, self.jitter))
+        return set(s for s in symbols if s not in self.unlisted)
+
+
+def make_fake_stock(symbol='FAKE.NS', nrows=250, end=None, seed=None, freq='B'):
+    '''
+    Make a synthetic stock history dataframe shaped like the yfinance output
+
+    Input parameters
+    ----------------
+    symbol : str, stock symbol, used as random seed if seed is None
+    nrows  : int, number of bars
+    end    : str/datetime, last date (default : None, today)
+    seed   : int, random seed (default : None)
+    freq   : str, pandas frequency of the bars (default : 'B', business days), e.g. 'min'
+             for the millions of bars that do not fit the datetime64[ns] range as days
+
+    Output
+    ------
+    dataframe with 'Date' index and OHLC, Volume, Dividends and Stock Splits columns
+    '''
+    if seed is None:
+        seed = sum(map(ord, symbol))
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp(end or pd.Timestamp.today()).normalize()
+    if freq == 'B':
+        dates = pd.bdate_range(end=end, periods=nrows, name='Date')
+    else:
+        dates = pd.date_range(end=end, periods=nrows, freq=freq, name='Date')
+
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.015, nrows)))
+    open_ = close * (1 + rng.normal(0, 0.005, nrows))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.008, nrows)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.008, nrows)))
+    return pd.DataFrame({'Open': open_, 'High': high, 'Low': low, 'Close': close,
+                         'Volume': rng.integers(10**5, 10**7, nrows),
+                         'Dividends': 0.0, 'Stock Splits': 0}, index=dates)
+
+
+class FakeQuoteServer:
+    '''
+    Local HTTP server of synthetic stock history data, used to test the network
+    fetchers offline (e.g. asyncdata.HttpFetcher)
+
+    GET /history/<symbol>?period=1y[&start=YYYY-MM-DD] answers the csv of
+    make_fake_stock (Date and OHLC columns) after latency seconds, 404 for the
+    symbols in missing.
+
+    Input parameters
+    ----------------
+    port    : int, 0 : any free port (default : 0)
+    latency : float, seconds spent in every request (default : 0.5)
+    nrows   : int, number of daily bars per symbol (default : 250)
+    missing : list, symbols answered with 404 (default : None)
+    '''
+
+    def __init__(self, port=0, latency=0.5, nrows=250, missing=None):
+        self.latency = latency
+        self.nrows = nrows
+        self.missing = set(missing or [])
+        self.requests = 0
+        self._lock = threading.Lock()
+        quotes = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                parts = url.path.strip('/').split('/')
+                with quotes._lock:
+                    quotes.requests += 1
+                time.sleep(quotes.latency)
+                if len(parts) != 2 or parts[0] != 'history' or parts[1] in quotes.missing:
+                    self.send_error(404)
+                    return
+                df = make_fake_stock(parts[1], nrows=quotes.nrows)
+                if 'start' in query:
+                    df = df[df.index >= pd.Timestamp(query['start'][0])]
+                body = df.to_csv().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/csv')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        class Server(socketserver.ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+        self._server = Server(('127.0.0.1', port), Handler)
+        self.url = 'http://127.0.0.1:{}'.format(self._server.server_address[1])
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-quotes', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class RateLimiter:
+    '''
+    Thread-safe token bucket rate limiter, one bucket per host
+
+    Input parameters
+    ----------------
+    rate  : float, requests per second per host (None or 0 : no limit)
+    burst : int, bucket size i.e. requests allowed back to back (default : 1)
+    '''
+
+    def __init__(self, rate=None, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, host=''):
+        '''
+        Block until a request to host is allowed
+        '''
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                tokens, last = self._buckets.get(host, (self.burst, now))
+                tokens = min(self.burst, tokens + (now - last) * self.rate)
+                if tokens >= 1:
+                    self._buckets[host] = (tokens - 1, now)
+                    return
+                self._buckets[host] = (tokens, now)
+                wait = (1 - tokens) / self.rate
+            time.sleep(wait)
+
+
+class BulkFetcher:
+    '''
+    Fetch many symbols concurrently on a bounded worker pool
+
+    Input parameters
+    ----------------
+    fetcher     : object with fetch(symbol, period) and host (default : YahooFetcher())
+    max_workers : int, number of worker threads (default : 8)
+    rate        : float, requests per second per host (default : 4, None : no limit)
+    burst       : int, requests allowed back to back per host (default : 4)
+    retries     : int, number of retries after a failed fetch (default : 3)
+    backoff     : float, base delay (s) of the exponential retry backoff (default : 0.5)
+    '''
+
+    def __init__(self, fetcher=None, max_workers=8, rate=4.0, burst=4, retries=3, backoff=0.5):
+        self.fetcher = fetcher or YahooFetcher()
+        self.max_workers = max_workers
+        self.limiter = RateLimiter(rate, burst=burst)
+        self.retries = retries
+        self.backoff = backoff
+
+    def fetch_one(self, symbol, period='1y', start=None):
+        '''
+        Fetch a single symbol (full period or from start onwards) with rate limiting and retries
+
+        Output
+        ------
+        stock dataframe, raise FetchError once all the retries failed
+        '''
+        host = getattr(self.fetcher, 'host', '')
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire(host)
+            try:
+                if start is not None:
+                    return self.fetcher.fetch(symbol, period=period, start=start)
+                return self.fetcher.fetch(symbol, period=period)
+            except Exception as err:
+                if attempt == self.retries:
+                    raise FetchError('Failed to fetch {}: {}'.format(symbol, err)) from err
+                # exponential backoff with jitter
+                time.sleep(self.backoff * 2 ** attempt * (1 + random.random()))
+
+    def iter_fetch(self, symbols, period='1y'):
+        '''
+        Fetch all symbols and yield them as they complete
+
+        Output
+        ------
+        generator of (symbol, dataframe or None, error or None)
+        '''
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(self.fetch_one, s, period): s for s in symbols}
+            for future in as_completed(futures):
+                symbol = futures[future]
+                try:
+                    yield symbol, future.result(), None
+                except FetchError as err:
+                    yield symbol, None, err
+
+    def fetch_all(self, symbols, period='1y', store=None):
+        '''
+        Fetch all symbols and stream every finished symbol to the store
+
+        Input parameters
+        ----------------
+        symbols : list, stock symbols with extension (e.g. ['RELIANCE.NS'])
+        period  : str, time period ('1d', '1m', '1y'... )
+        store   : store to write each symbol to as soon as it is fetched (default : None)
+
+        Output
+        ------
+        dict of symbol -> dataframe, dict of symbol -> error
+        '''
+        stock_dict = {}
+        errors = {}
+        start = time.perf_counter()
+        for symbol, df, err in self.iter_fetch(symbols, period=period):
+            if err is not None:
+                logger.warning('%s', err)
+                errors[symbol] = err
+                continue
+            stock_dict[symbol] = df
+            if store is not None:
+                store.save(symbol, df)
+        logger.info('Fetched %d/%d symbols in %.2fs', len(stock_dict), len(symbols), time.perf_counter() - start)
+        return stock_dict, errors
+
+
+class ListingValidator:
+    '''
+    Check in concurrent batches which symbols are listed on an exchange
+
+    Symbols are probed in batches (one request per batch) and all the batches run
+    at the same time on a thread pool. Confirmed listings are kept in a json cache
+    file and are not probed again. The symbols of a failed batch are neither listed
+    nor unlisted, listed() leaves them out and keeps them in unprobed.
+
+    Input parameters
+    ----------------
+    fetcher     : object with listed(symbols) and host (default : YahooFetcher())
+    cache_file  : json file with the cached results (default : None, no persistent cache)
+    batch_size  : int, number of symbols per request (default : 20)
+    max_workers : int, number of batches probed at the same time (default : 8)
+    '''
+
+    def __init__(self, fetcher=None, cache_file=None, batch_size=20, max_workers=8):
+        self.fetcher = fetcher or YahooFetcher()
+        self.cache_file = cache_file
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.cache = self._read_cache()
+        # symbols of the failed batches of the last listed() call
+        self.unprobed = set()
+
+    def _read_cache(self):
+        if self.cache_file and os.path.isfile(self.cache_file):
+            with open(self.cache_file) as f:
+                return json.load(f)
+        return {}
+
+    def _write_cache(self):
+        if not self.cache_file:
+            return
+        tmpfile = self.cache_file + '.tmp'
+        with open(tmpfile, 'w') as f:
+            json.dump(self.cache, f, indent=1, sort_keys=True)
+        os.replace(tmpfile, self.cache_file)
+
+    def _probe(self, batch):
+        start = time.perf_counter()
+        listed = self.fetcher.listed(batch)
+        return listed, time.perf_counter() - start
+
+    def listed(self, symbols):
+        '''
+        Return the set of listed symbols
+
+        Input parameters
+        ----------------
+        symbols : list, stock symbols with extension (e.g. ['RELIANCE.NS'])
+
+        Output
+        ------
+        set of listed symbols (the symbols that could not be probed are in self.unprobed)
+        '''
+        self.unprobed = set()
+        listed = set(s for s in symbols if self.cache.get(s, {}).get('listed'))
+        todo = [s for s in dict.fromkeys(symbols) if s not in listed]
+        batches = [todo[i:i + self.batch_size] for i in range(0, len(todo), self.batch_size)]
+        logger.info('%d symbols cached, probe %d symbols in %d batches', len(listed), len(todo), len(batches))
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(self._probe, b): i for i, b in enumerate(batches)}
+            for future in as_completed(futures):
+                i = futures[future]
+                batch = batches[i]
+                try:
+                    found, elapsed = future.result()
+                except Exception as err:
+                    # leave the batch out of the cache, it is probed again next time
+                    logger.warning('Batch %d failed: %s', i, err)
+                    self.unprobed.update(batch)
+                    continue
+                logger.info('Batch %d : %d/%d listed in %.2fs', i, len(found), len(batch), elapsed)
+                now = time.time()
+                for s in batch:
+                    self.cache[s] = dict(listed=s in found, checked=now)
+                listed |= found
+        logger.info('Probed %d batches in %.2fs', len(batches), time.perf_counter() - start)
+
+        self._write_cache()
+        return listed
@@ -0,0 +1,193 @@
+# Technical indicators computed from shared, precomputed per-column state
+# For every (symbol, column, data version) the engine keeps the column values
+# and their prefix (cumulative) sums. Any moving window is then an O(n)
+# vectorized difference of two prefix sums, and every result is memoized per
+# (symbol, column, indicator, parameters) with LRU eviction.
+
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+
+class IndicatorEngine:
+    '''
+    Memoized indicator engine (SMA, EMA, Bollinger bands, RSI)
+
+    The dataframes are identified by df.attrs['symbol'] and df.attrs['version']
+    (set by utils.get_single_stock). Dataframes without them are computed
+    every time and never cached.
+
+    Input parameters
+    ----------------
+    max_states  : int, number of (symbol, column) prefix states kept (default : 64)
+    max_results : int, number of memoized indicator arrays kept (default : 1024)
+    '''
+
+    def __init__(self, max_states=64, max_results=1024):
+        self.max_states = max_states
+        self.max_results = max_results
+        self.hits = 0
+        self.misses = 0
+        self._states = OrderedDict()
+        self._results = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _key(self, df, column):
+        symbol = df.attrs.get('symbol')
+        version = df.attrs.get('version')
+        if symbol is None or version is None:
+            return None
+        # the weekly / monthly / quarterly bars of a symbol are other series
+        return (symbol, df.attrs.get('interval', 'D'), column, version)
+
+    @staticmethod
+    def _lru_put(cache, key, value, max_size):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > max_size:
+            cache.popitem(last=False)
+
+    def state(self, df, column):
+        '''
+        Return the shared precomputed state of a column
+
+        Output
+        ------
+        dict with the column values, prefix sums of the values and of their squares
+        (missing values counted as 0) and the prefix count of the missing values
+        '''
+        key = self._key(df, column)
+        with self._lock:
+            if key is not None and key in self._states:
+                self._states.move_to_end(key)
+                return self._states[key]
+
+        values = np.asarray(df[column].values, dtype='float64')
+        missing = np.isnan(values)
+        clean = np.where(missing, 0.0, values)
+        state = dict(values=values,
+                     csum=np.concatenate([[0.0], np.cumsum(clean)]),
+                     csum2=np.concatenate([[0.0], np.cumsum(clean * clean)]),
+                     cnan=np.concatenate([[0], np.cumsum(missing)]))
+        if key is not None:
+            with self._lock:
+                self._lru_put(self._states, key, state, self.max_states)
+        return state
+
+    def _memoize(self, df, column, name, params, compute):
+        key = self._key(df, column)
+        if key is not None:
+            key = key + (name, params)
+            with self._lock:
+                if key in self._results:
+                    self._results.move_to_end(key)
+                    self.hits += 1
+                    return self._results[key]
+                self.misses += 1
+        result = compute(self.state(df, column))
+        if key is not None:
+            with self._lock:
+                self._lru_put(self._results, key, result, self.max_results)
+        return result
+
+    @staticmethod
+    def _window_sums(state, window):
+        # sums over [i - window + 1, i] for i >= window - 1, nan before and where a value is missing
+        n = len(state['values'])
+        out = np.full(n, np.nan)
+        out2 = np.full(n, np.nan)
+        if window < 1 or window > n:
+            return out, out2
+        csum, csum2, cnan = state['csum'], state['csum2'], state['cnan']
+        valid = (cnan[window:] - cnan[:-window]) == 0
+        out[window - 1:] = np.where(valid, csum[window:] - csum[:-window], np.nan)
+        out2[window - 1:] = np.where(valid, csum2[window:] - csum2[:-window], np.nan)
+        return out, out2
+
+    def sma(self, df, column='Close', window=10):
+        '''
+        Simple moving average, same as df[column].rolling(window).mean()
+        '''
+        def compute(state):
+            return self._window_sums(state, window)[0] / window
+        return self._memoize(df, column, 'sma', (window,), compute)
+
+    def ema(self, df, column='Close', span=10):
+        '''
+        Exponential moving average, same as df[column].ewm(span=span, adjust=False).mean()
+        '''
+        def compute(state):
+            return pd.Series(state['values']).ewm(span=span, adjust=False).mean().values
+        return self._memoize(df, column, 'ema', (span,), compute)
+
+    def bollinger(self, df, column='Close', window=20, num_std=2.0):
+        '''
+        Bollinger bands (rolling mean +- num_std rolling sample standard deviations)
+
+        Output
+        ------
+        middle, upper and lower band arrays
+        '''
+        def compute(state):
+            s1, s2 = self._window_sums(state, window)
+            mean = s1 / window
+            var = (s2 - s1 * mean) / (window - 1) if window > 1 else np.full_like(s1, np.nan)
+            std = np.sqrt(np.clip(var, 0, None))
+            return mean, mean + num_std * std, mean - num_std * std
+        return self._memoize(df, column, 'bollinger', (window, num_std), compute)
+
+    def rsi(self, df, column='Close', window=14):
+        '''
+        Relative strength index with Wilder smoothing (0-100)
+        '''
+        def compute(state):
+            delta = pd.Series(state['values']).diff()
+            gain = delta.clip(lower=0).ewm(alpha=1.0 / window, adjust=False, min_periods=window).mean()
+            loss = (-delta.clip(upper=0)).ewm(alpha=1.0 / window, adjust=False, min_periods=window).mean()
+            return (100 - 100 / (1 + gain / loss)).values
+        return self._memoize(df, column, 'rsi', (window,), compute)
+
+    def stats(self):
+        '''
+        Return the engine counters as dict
+        '''
+        with self._lock:
+            return dict(states=len(self._states), results=len(self._results),
+                        hits=self.hits, misses=self.misses)
+
+
+# indicator columns precomputed for every stored symbol (see pipeline.py)
+# column name -> (engine method, parameters, output number for the multi-output indicators)
+standard_indicators = {'SMA_5': ('sma', dict(window=5), None),
+                       'SMA_10': ('sma', dict(window=10), None),
+                       'SMA_20': ('sma', dict(window=20), None),
+                       'SMA_50': ('sma', dict(window=50), None),
+                       'EMA_20': ('ema', dict(span=20), None),
+                       'BB_upper_20': ('bollinger', dict(window=20), 1),
+                       'BB_lower_20': ('bollinger', dict(window=20), 2),
+                       'RSI_14': ('rsi', dict(window=14), None)}
+
+
+def compute_indicators(df, engine=None, column='Close', indicators=None):
+    '''
+    Compute a set of indicators of a stock dataframe
+
+    Input parameters
+    ----------------
+    df         : dataframe with 'Date' and column
+    engine     : IndicatorEngine (default : None, a new engine)
+    column     : str, price column (default : 'Close')
+    indicators : dict, see standard_indicators (default : None, standard_indicators)
+
+    Output
+    ------
+    dataframe with 'Date' and one column per indicator
+    '''
+    engine = engine or IndicatorEngine()
+    out = pd.DataFrame({'Date': df['Date'].values})
+    for name, (method, params, output) in (indicators or standard_indicators).items():
+        values = getattr(engine, method)(df, column=column, **params)
+        out[name] = values if output is None else values[output]
+    return out
+
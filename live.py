@@ -0,0 +1,225 @@
+# Live quotes of the displayed symbols
+# A background thread polls a quote source for the subscribed symbols and appends
+# the ticks to one fixed size ring buffer per symbol. Every tick gets a sequence
+# number, a client that remembers the last sequence it received only fetches the
+# newer ticks (see update_live in stocks_view_app.py), so the cost of a refresh
+# depends on the number of new ticks, never on the length of the history.
+#
+# Quote sources implement poll(symbols) -> {symbol: (time (datetime64[ms]), price, volume)}:
+#   SimulatedQuoteSource : local random walk, for testing and demos (no network)
+#   YahooQuoteSource     : last 1 minute bar from Yahoo finance (yfinance)
+
+import time
+import random
+import logging
+import threading
+import numpy as np
+from registry import get_registry
+
+logger = logging.getLogger(__name__)
+
+
+class SimulatedQuoteSource:
+    '''
+    Random walk quotes starting from the given prices
+
+    Input parameters
+    ----------------
+    volatility : float, standard deviation of the relative price change per poll (default : 0.001)
+    seed       : int, random seed (default : None)
+    '''
+
+    def __init__(self, volatility=0.001, seed=None):
+        self.volatility = volatility
+        self._random = random.Random(seed)
+        self._prices = {}
+        self._lock = threading.Lock()
+
+    def start_price(self, symbol, price):
+        '''
+        Set the price the random walk of symbol starts from (e.g. the last close)
+        '''
+        with self._lock:
+            self._prices.setdefault(symbol, float(price))
+
+    def poll(self, symbols):
+        now = np.datetime64(int(time.time() * 1000), 'ms')
+        quotes = {}
+        with self._lock:
+            for symbol in symbols:
+                price = self._prices.get(symbol, 100.0)
+                price *= 1 + self._random.gauss(0, self.volatility)
+                self._prices[symbol] = price
+                quotes[symbol] = (now, price, self._random.randint(1, 1000))
+        return quotes
+
+
+class YahooQuoteSource:
+    '''
+    Last 1 minute bar of the symbols from Yahoo finance
+
+    Input parameters
+    ----------------
+    datadir : str, data directory whose symbol registry resolves the tickers (default : './data/')
+    '''
+
+    def __init__(self, datadir='./data/'):
+        self.registry = get_registry(datadir)
+
+    def start_price(self, symbol, price):
+        pass
+
+    def poll(self, symbols):
+        import yfinance as yf
+        symbols = list(symbols)
+        if not symbols:
+            return {}
+        tickers = [self.registry.ticker(s) for s in symbols]
+        df = yf.download(tickers, period='1d', interval='1m', group_by='ticker',
+                         progress=False, threads=True)
+        quotes = {}
+        for symbol, ticker in zip(symbols, tickers):
+            bars = df[ticker] if len(tickers) > 1 else df
+            bars = bars.dropna(subset=['Close'])
+            if len(bars):
+                t = bars.index[-1].tz_localize(None) if bars.index.tz is not None else bars.index[-1]
+                quotes[symbol] = (np.datetime64(t, 'ms'), float(bars['Close'].iloc[-1]),
+                                  int(bars['Volume'].iloc[-1]))
+        return quotes
+
+
+class RingBuffer:
+    '''
+    Last capacity ticks (time, price, volume) of a symbol with their sequence numbers
+
+    Input parameters
+    ----------------
+    capacity : int, number of ticks kept (default : 1000)
+    '''
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype='datetime64[ms]')
+        self.prices = np.zeros(capacity)
+        self.volumes = np.zeros(capacity, dtype='int64')
+        # sequence number of the last tick (the first tick is 1)
+        self.seq = 0
+        self._lock = threading.Lock()
+
+    def append(self, t, price, volume=0):
+        with self._lock:
+            i = self.seq % self.capacity
+            self.times[i] = t
+            self.prices[i] = price
+            self.volumes[i] = volume
+            self.seq += 1
+
+    def since(self, seq=0):
+        '''
+        Return the ticks after sequence number seq (at most capacity ticks)
+
+        Output
+        ------
+        times, prices, volumes arrays (oldest first), sequence number of the last tick
+        '''
+        with self._lock:
+            last = self.seq
+            first = max(seq, last - self.capacity, 0)
+            idx = np.arange(first, last) % self.capacity
+            return self.times[idx], self.prices[idx], self.volumes[idx], last
+
+    def __len__(self):
+        return min(self.seq, self.capacity)
+
+
+class LiveFeed:
+    '''
+    Poll a quote source in a background thread and keep a RingBuffer per subscribed symbol
+
+    Symbols that are not requested for idle_timeout seconds are no longer polled.
+
+    Input parameters
+    ----------------
+    source       : quote source (default : SimulatedQuoteSource())
+    interval     : float, seconds between two polls (default : 1.0)
+    capacity     : int, ticks kept per symbol (default : 1000)
+    idle_timeout : float, seconds (default : 60)
+    '''
+
+    def __init__(self, source=None, interval=1.0, capacity=1000, idle_timeout=60.0):
+        self.source = source or SimulatedQuoteSource()
+        self.interval = interval
+        self.capacity = capacity
+        self.idle_timeout = idle_timeout
+        self.polls = 0
+        self.errors = 0
+        self._buffers = {}
+        self._last_request = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def subscribe(self, symbol, start_price=None):
+        '''
+        Poll symbol (again) from now on, start_price : first price of a simulated feed
+        '''
+        with self._lock:
+            self._last_request[symbol] = time.time()
+            if symbol not in self._buffers:
+                self._buffers[symbol] = RingBuffer(self.capacity)
+                if start_price is not None:
+                    self.source.start_price(symbol, start_price)
+        self.start()
+
+    def since(self, symbol, seq=0):
+        '''
+        Ticks of symbol after sequence number seq, see RingBuffer.since
+        '''
+        with self._lock:
+            self._last_request[symbol] = time.time()
+            buffer = self._buffers.get(symbol)
+        if buffer is None:
+            empty = np.zeros(0)
+            return empty.astype('datetime64[ms]'), empty, empty.astype('int64'), 0
+        return buffer.since(seq)
+
+    def poll_once(self):
+        '''
+        Poll the source once for the active symbols and append the quotes
+        '''
+        now = time.time()
+        with self._lock:
+            active = [s for s, t in self._last_request.items() if now - t < self.idle_timeout]
+        if not active:
+            return 0
+        quotes = self.source.poll(active)
+        with self._lock:
+            for symbol, (t, price, volume) in quotes.items():
+                if symbol in self._buffers:
+                    self._buffers[symbol].append(t, price, volume)
+        self.polls += 1
+        return len(quotes)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll_once()
+            except Exception as err:
+                # keep polling, the source may recover
+                self.errors += 1
+                logger.warning('Live quotes poll failed: %s', err)
+
+    def start(self):
+        '''
+        Start the polling thread (once)
+        '''
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='live-feed', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,125 @@
+# Concurrency helpers for the stock data downloads
+# SingleFlight coalesces concurrent calls for the same key inside a process (the
+# app runs with threaded=True), FileLock serializes the writers of a file across
+# worker processes. The lock files are kept apart from the data, in a 'locks'
+# directory next to the locked file (see lock_path).
+
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # windows
+    fcntl = None
+    import msvcrt
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    '''
+    Run a function once per key for all the threads calling it at the same time
+
+    The first caller runs the function, the callers arriving while it runs wait
+    for it and get the same result (or exception).
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, *args, **kwargs):
+        '''
+        Return func(*args, **kwargs), shared with the concurrent callers of the same key
+        '''
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    def in_flight(self):
+        '''
+        Return the keys currently running
+        '''
+        with self._lock:
+            return list(self._calls)
+
+
+# lock directories already created
+_lock_dirs = set()
+
+
+def lock_path(path):
+    '''
+    Return the lock file of a data file, <directory>/locks/<name>.lock
+
+    usage: FileLock(lock_path('./data/RELIANCE.NS.col')) -> ./data/locks/RELIANCE.NS.col.lock
+    '''
+    dirname, name = os.path.split(path)
+    lockdir = os.path.join(dirname, 'locks')
+    if lockdir not in _lock_dirs:
+        os.makedirs(lockdir, exist_ok=True)
+        _lock_dirs.add(lockdir)
+    return os.path.join(lockdir, name + '.lock')
+
+
+class FileLock:
+    '''
+    Exclusive lock on a lock file, shared by all the processes of the machine
+
+    usage:
+        with FileLock(lock_path('./data/RELIANCE.NS.col')):
+            ...
+
+    Input parameters
+    ----------------
+    path : str, lock file (created if required, never deleted)
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'a+')
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
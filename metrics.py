@@ -0,0 +1,336 @@
+# Instrumentation of the hot paths
+# span(name) times a block of code (load, cache, indicators, figure, serialize, ...).
+# The durations are recorded in one latency histogram per (span, callback) and logged
+# at DEBUG level, so nothing is formatted or printed unless the logging level asks
+# for it. Spans nest (a 'figure' span includes its 'indicators' span).
+#
+# install(server) adds to the flask server of the app:
+#   /metrics          : the histograms in the Prometheus text format (?format=json for json),
+#                       only answered to local clients
+#   /metrics/profiles : the hottest stacks of the last slow requests (profiler on)
+#   request timing    : 'request', the whole callback request and 'response', from the end
+#                       of the callback function to the response (json encoding of the outputs)
+#   slow requests     : logged as a WARNING with their spans
+#   sampling profiler : opt-in, the stacks of the request threads are sampled every
+#                       interval seconds, the folded stacks of slow requests are kept
+
+import os, sys
+import json
+import time
+import bisect
+import logging
+import threading
+import functools
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# upper bounds (s) of the histogram buckets
+default_buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    '''
+    Latency histogram with fixed buckets
+
+    Input parameters
+    ----------------
+    buckets : list of float, sorted upper bounds of the buckets (s), the last bucket is unbounded
+    '''
+
+    def __init__(self, buckets=default_buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        '''
+        Upper bound of the bucket containing the quantile q (max for the last bucket)
+        '''
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {'count': self.count, 'sum': self.sum, 'max': self.max,
+                'p50': self.quantile(0.5), 'p90': self.quantile(0.9), 'p99': self.quantile(0.99),
+                'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], self.counts))}
+
+
+class Metrics:
+    '''
+    Thread-safe registry of the span histograms, keyed by (span, callback)
+    '''
+
+    def __init__(self, buckets=default_buckets):
+        self.buckets = buckets
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds, callback=''):
+        key = (name, callback)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def get(self, name, callback=''):
+        return self._histograms.get((name, callback))
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def snapshot(self):
+        '''
+        Output
+        ------
+        list of {'span', 'callback', 'count', 'sum', 'max', 'p50', 'p90', 'p99', 'buckets'}
+        '''
+        with self._lock:
+            return [dict(h.snapshot(), span=name, callback=callback)
+                    for (name, callback), h in sorted(self._histograms.items())]
+
+    def prometheus(self, prefix='dashboard_span_seconds'):
+        '''
+        Histograms in the Prometheus text exposition format
+        '''
+        lines = ['# TYPE {} histogram'.format(prefix)]
+        with self._lock:
+            for (name, callback), h in sorted(self._histograms.items()):
+                labels = 'span="{}",callback="{}"'.format(name, callback)
+                total = 0
+                for bound, count in zip([repr(b) for b in h.buckets] + ['+Inf'], h.counts):
+                    total += count
+                    lines.append('{}_bucket{{{},le="{}"}} {}'.format(prefix, labels, bound, total))
+                lines.append('{}_sum{{{}}} {!r}'.format(prefix, labels, h.sum))
+                lines.append('{}_count{{{}}} {}'.format(prefix, labels, h.count))
+        return '\n'.join(lines) + '\n'
+
+
+# histograms of this process
+metrics = Metrics()
+# current callback and spans of the request handled by the thread
+_local = threading.local()
+
+
+@contextmanager
+def span(name):
+    '''
+    Time the block, record it in the histogram of (name, current callback)
+    '''
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        callback = getattr(_local, 'callback', '')
+        metrics.observe(name, seconds, callback)
+        spans = getattr(_local, 'spans', None)
+        if spans is not None:
+            spans.append((name, seconds))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('span %s %.2fms (%s)', name, seconds * 1000, callback or '-')
+
+
+def timed(func):
+    '''
+    Decorator of the dash callbacks, the spans of the call are recorded for the
+    callback (its function name) and the 'callback' span times the whole function
+    '''
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        _local.callback = func.__name__
+        try:
+            with span('callback'):
+                return func(*args, **kwargs)
+        finally:
+            # the rest of the request is the response (encoding of the outputs)
+            _local.callback_end = time.perf_counter()
+    return wrapper
+
+
+def current_spans():
+    '''
+    (name, seconds) of the spans of the request handled by this thread
+    '''
+    return list(getattr(_local, 'spans', None) or [])
+
+
+class SamplingProfiler:
+    '''
+    Sample the stacks of the registered threads every interval seconds
+
+    A sampling thread runs while at least one thread is registered, the profiled
+    code is not slowed down apart from the GIL taken by the sampler.
+
+    Input parameters
+    ----------------
+    interval : float, seconds between two samples (default : 0.005)
+    depth    : int, frames kept per stack (default : 40)
+    '''
+
+    def __init__(self, interval=0.005, depth=40):
+        self.interval = interval
+        self.depth = depth
+        # thread id -> {folded stack: samples}
+        self._samples = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, thread_id=None):
+        thread_id = thread_id or threading.get_ident()
+        with self._lock:
+            self._samples[thread_id] = defaultdict(int)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+                self._thread.start()
+
+    def stop(self, thread_id=None):
+        '''
+        Stop sampling a thread
+
+        Output
+        ------
+        list of (samples, folded stack 'outer;...;inner'), most sampled first
+        '''
+        thread_id = thread_id or threading.get_ident()
+        with self._lock:
+            samples = self._samples.pop(thread_id, {})
+        return sorted(((n, stack) for stack, n in samples.items()), reverse=True)
+
+    def _fold(self, frame):
+        stack = []
+        while frame is not None and len(stack) < self.depth:
+            code = frame.f_code
+            stack.append('{}:{}:{}'.format(os.path.basename(code.co_filename), code.co_name, frame.f_lineno))
+            frame = frame.f_back
+        return ';'.join(reversed(stack))
+
+    def _run(self):
+        while True:
+            with self._lock:
+                threads = list(self._samples)
+            if not threads:
+                with self._lock:
+                    if not self._samples:
+                        self._thread = None
+                        return
+                continue
+            frames = sys._current_frames()
+            for thread_id in threads:
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = self._fold(frame)
+                with self._lock:
+                    samples = self._samples.get(thread_id)
+                    if samples is not None:
+                        samples[stack] += 1
+            del frames
+            time.sleep(self.interval)
+
+
+def install(server, path='/metrics', slow_request_s=1.0, profile=False, profile_interval_s=0.005,
+            keep_profiles=20, allow_remote=False):
+    '''
+    Time the dash callback requests of a flask server and serve the histograms
+
+    Input parameters
+    ----------------
+    server             : flask server of the dash app (app.server)
+    path               : str, url of the metrics (default : '/metrics')
+    slow_request_s     : float, requests slower than this are logged with their spans (default : 1.0)
+    profile            : bool, sample the stacks of the callback requests (default : False)
+    profile_interval_s : float, sampling interval (default : 0.005)
+    keep_profiles      : int, number of slow request profiles kept (default : 20)
+    allow_remote       : bool, serve the metrics to non local clients (default : False)
+
+    Output
+    ------
+    SamplingProfiler or None
+    '''
+    import flask
+
+    profiler = SamplingProfiler(interval=profile_interval_s) if profile else None
+    profiles = deque(maxlen=keep_profiles)
+
+    def is_callback():
+        return flask.request.path.endswith('/_dash-update-component')
+
+    @server.before_request
+    def start_request():
+        if not is_callback():
+            return
+        _local.callback = ''
+        _local.callback_end = None
+        _local.spans = []
+        _local.start = time.perf_counter()
+        if profiler is not None:
+            profiler.start()
+
+    @server.after_request
+    def end_request(response):
+        start = getattr(_local, 'start', None)
+        if start is None or not is_callback():
+            return response
+        now = time.perf_counter()
+        callback = _local.callback
+        seconds = now - start
+        metrics.observe('request', seconds, callback)
+        if _local.callback_end is not None:
+            metrics.observe('response', now - _local.callback_end, callback)
+        stacks = profiler.stop() if profiler is not None else None
+        if seconds >= slow_request_s:
+            spans = current_spans()
+            totals = defaultdict(lambda: [0, 0.0])
+            for name, s in spans:
+                totals[name][0] += 1
+                totals[name][1] += s
+            logger.warning('Slow request %s %.0fms : %s', callback or '-', seconds * 1000,
+                           ', '.join('{} {:.1f}ms ({}x)'.format(name, s * 1000, n)
+                                     for name, (n, s) in sorted(totals.items(), key=lambda t: -t[1][1])))
+            if stacks:
+                profiles.append({'callback': callback, 'seconds': seconds, 'time': time.time(),
+                                 'spans': spans, 'stacks': stacks[:50]})
+                for n, stack in stacks[:5]:
+                    logger.warning('  %d samples : %s', n, stack)
+        _local.start = None
+        _local.spans = None
+        _local.callback = ''
+        return response
+
+    def check_client():
+        if not allow_remote and flask.request.remote_addr not in ('127.0.0.1', '::1', None):
+            flask.abort(403)
+
+    @server.route(path)
+    def serve_metrics():
+        check_client()
+        if flask.request.args.get('format') == 'json':
+            return flask.jsonify(metrics.snapshot())
+        return flask.Response(metrics.prometheus(), mimetype='text/plain; version=0.0.4')
+
+    @server.route(path.rstrip('/') + '/profiles')
+    def serve_profiles():
+        check_client()
+        return flask.Response(json.dumps(list(profiles)), mimetype='application/json')
+
+    return profiler
@@ -0,0 +1,327 @@
+# Nightly ETL jobs over all the symbols, run on a process pool
+# Stages (in this order, all by default):
+#   backfill   : download the missing bars of every symbol (full history for new symbols)
+#   normalize  : sort, de-duplicate and clean the stored bars, convert csv files to the store format
+#   indicators : precompute the standard indicators (indicators.py) into <symbol>.ind files
+#   summaries  : rebuild the summary index rows (summary.py)
+#
+# Every completed (stage, symbol) is appended to a journal, <datadir>/pipeline/<run id>.jsonl.
+# Re-running with the same run id (default : today's date) after a crash skips the
+# finished work. The indicators and summaries of unchanged files are skipped as well.
+#
+# usage: python pipeline.py [stage ...] [--symbols RELIANCE INFY | --stored] [--workers 8]
+#        python pipeline.py backfill --source fake     (offline run with generated data)
+
+import os, sys
+import json
+import time
+import datetime
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+from fetch import BulkFetcher, FakeFetcher
+from store import get_store, CsvStore, IndicatorStore
+from summary import get_summary_index, summarize
+from registry import get_registry
+from indicators import compute_indicators
+from utils import update_single_stock
+
+stage_names = ['backfill', 'normalize', 'indicators', 'summaries']
+
+# per-process state of the pool workers (stores, fetcher), see _worker
+_state = {}
+
+
+def _worker(config):
+    # (re)initialize the worker process for a run configuration
+    if _state.get('config') != config:
+        fetcher = FakeFetcher(latency=config['fake_latency']) if config['source'] == 'fake' else None
+        _state.clear()
+        _state.update(config=config,
+                      store=get_store(config['datadir']),
+                      indicator_store=IndicatorStore(config['datadir']),
+                      # the request rate is shared by all the workers
+                      bulk=BulkFetcher(fetcher=fetcher, max_workers=1,
+                                       rate=config['rate'] / config['workers'] if config['rate'] else None,
+                                       burst=1))
+    return _state
+
+
+def backfill_symbol(symbol, config):
+    state = _worker(config)
+    new = update_single_stock(symbol, period=config['period'], datadir=config['datadir'],
+                              fetcher=state['bulk'])
+    return {'new_bars': new}
+
+
+def normalize_symbol(symbol, config):
+    store = _worker(config)['store']
+    ticker = get_registry(config['datadir']).ticker(symbol)
+    source = store
+    if not store.exists(ticker):
+        # csv file of the original format
+        source = CsvStore(config['datadir'])
+        if not source.exists(ticker):
+            raise FileNotFoundError('No stored data for {}'.format(ticker))
+
+    df = source.load(ticker)
+    clean = df.dropna(subset=['Close'])
+    clean = clean.drop_duplicates('Date', keep='last').sort_values('Date', ignore_index=True)
+    rewrite = source is not store or len(clean) != len(df) or not clean['Date'].equals(df['Date'])
+    if rewrite:
+        store.save(ticker, clean)
+    return {'rows': len(clean), 'dropped': len(df) - len(clean), 'rewritten': rewrite}
+
+
+def indicators_symbol(symbol, config):
+    state = _worker(config)
+    ticker = get_registry(config['datadir']).ticker(symbol)
+    df = state['store'].load(ticker, columns=['Close'])
+    indicators = compute_indicators(df)
+    state['indicator_store'].save(ticker, indicators)
+    return {'columns': len(indicators.columns) - 1}
+
+
+def summaries_symbol(symbol, config):
+    store = _worker(config)['store']
+    ticker = get_registry(config['datadir']).ticker(symbol)
+    version = store.mtime(ticker)
+    df = store.load(ticker, columns=['Low', 'High', 'Close', 'Volume'])
+    return {'row': summarize(df), 'version': version}
+
+
+stage_functions = OrderedDict([('backfill', backfill_symbol),
+                               ('normalize', normalize_symbol),
+                               ('indicators', indicators_symbol),
+                               ('summaries', summaries_symbol)])
+
+
+def _run_task(stage, symbol, config):
+    # run one (stage, symbol) task in a pool worker, never raise
+    start = time.perf_counter()
+    try:
+        result, error = stage_functions[stage](symbol, config), None
+    except Exception as err:
+        result, error = None, '{}: {}'.format(type(err).__name__, err)
+    return symbol, result, error, time.perf_counter() - start
+
+
+class Journal:
+    '''
+    Completed (stage, symbol) tasks of a run, one json line per task
+
+    A partially written last line (crash) is ignored.
+
+    Input parameters
+    ----------------
+    path : str, journal file (created if required)
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self._done = {}
+        if os.path.isfile(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        item = json.loads(line)
+                    except ValueError:
+                        continue
+                    self._done[(item['stage'], item['symbol'])] = item.get('version')
+        self._file = open(path, 'a')
+
+    def done(self, stage, symbol, version=None):
+        '''
+        Return True if the task is recorded (for this version of the source file)
+        '''
+        key = (stage, symbol)
+        return key in self._done and (version is None or self._done[key] == version)
+
+    def record(self, stage, symbol, version=None):
+        self._done[(stage, symbol)] = version
+        self._file.write(json.dumps({'stage': stage, 'symbol': symbol, 'version': version}) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class Progress:
+    '''
+    Print the progress of a stage at most every interval seconds
+    '''
+
+    def __init__(self, stage, total, interval=2.0):
+        self.stage = stage
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.failed = 0
+        self.start = time.perf_counter()
+        self._last = 0.0
+
+    def update(self, failed=False, force=False):
+        self.done += 1
+        self.failed += int(failed)
+        now = time.perf_counter()
+        if force or now - self._last >= self.interval or self.done == self.total:
+            self._last = now
+            elapsed = now - self.start
+            eta = elapsed / self.done * (self.total - self.done)
+            print('[{}] {}/{} symbols ({:.0%}), {} failed, {:.1f}s elapsed, eta {:.1f}s'.format(
+                self.stage, self.done, self.total, self.done / self.total, self.failed, elapsed, eta))
+
+
+def run_stage(stage, symbols, config, executor, journal):
+    '''
+    Run a stage for all the symbols on the process pool
+
+    Output
+    ------
+    dict of stage timing and counters
+    '''
+    store = get_store(config['datadir'])
+    indicator_store = IndicatorStore(config['datadir'])
+    index = get_summary_index(config['datadir'])
+    registry = get_registry(config['datadir'])
+
+    # skip the work done by a previous (crashed) run and the up to date outputs
+    todo = []
+    for symbol in symbols:
+        ticker = registry.ticker(symbol)
+        if stage == 'backfill':
+            current = journal.done(stage, symbol)
+        else:
+            version = store.mtime(ticker)
+            current = version is not None and (
+                journal.done(stage, symbol, version)
+                or (stage == 'indicators' and (indicator_store.mtime(ticker) or 0) > version)
+                or (stage == 'summaries' and index.get(ticker, version=version) is not None))
+        if not current:
+            todo.append(symbol)
+
+    report = dict(stage=stage, symbols=len(symbols), skipped=len(symbols) - len(todo),
+                  done=0, failed=0, wall=0.0, task=0.0, errors={})
+    if not todo:
+        print('[{}] nothing to do ({} symbols up to date)'.format(stage, len(symbols)))
+        return report
+
+    start = time.perf_counter()
+    progress = Progress(stage, len(todo), interval=config['progress'])
+    rows = []
+    futures = [executor.submit(_run_task, stage, symbol, config) for symbol in todo]
+    for future in as_completed(futures):
+        symbol, result, error, seconds = future.result()
+        report['task'] += seconds
+        if error is not None:
+            report['failed'] += 1
+            report['errors'][symbol] = error
+        elif stage == 'summaries':
+            rows.append((symbol, result))
+        else:
+            report['done'] += 1
+            if stage == 'backfill':
+                # the refresh times of the registry sidecar, written by this process at exit
+                registry.refreshed(registry.resolve(symbol))
+            journal.record(stage, symbol, store.mtime(registry.ticker(symbol)) if stage != 'backfill' else None)
+        progress.update(failed=error is not None)
+
+    # a single writer for the summary index
+    if rows:
+        with index.batch():
+            for symbol, result in rows:
+                index.update_row(registry.ticker(symbol), result['row'], version=result['version'])
+        for symbol, result in rows:
+            journal.record(stage, symbol, result['version'])
+        report['done'] += len(rows)
+
+    report['wall'] = time.perf_counter() - start
+    return report
+
+
+def print_report(reports, total):
+    '''
+    Print the per-stage timing report
+    '''
+    print('\n{:<11s} {:>8s} {:>8s} {:>8s} {:>8s} {:>10s} {:>10s} {:>9s}'.format(
+        'stage', 'symbols', 'done', 'skipped', 'failed', 'wall (s)', 'task (s)', 'parallel'))
+    for r in reports:
+        print('{:<11s} {:>8d} {:>8d} {:>8d} {:>8d} {:>10.2f} {:>10.2f} {:>8.1f}x'.format(
+            r['stage'], r['symbols'], r['done'], r['skipped'], r['failed'], r['wall'], r['task'],
+            r['task'] / r['wall'] if r['wall'] else 0.0))
+    print('total {:.2f}s'.format(total))
+    for r in reports:
+        for symbol, error in sorted(r['errors'].items())[:10]:
+            print('[{}] {} failed: {}'.format(r['stage'], symbol, error))
+
+
+def read_symbols(args):
+    '''
+    Symbols of the run: command line, stored files or symbols file
+    '''
+    if args.symbols:
+        symbols = list(args.symbols)
+    elif args.stored:
+        symbols = get_registry(args.datadir).stored()
+    else:
+        # the symbols of other exchanges keep their suffix (see registry.py)
+        symbols = get_registry(args.datadir).add_symbols(pd.read_csv(args.symbols_file))
+    return symbols[:args.limit] if args.limit else symbols
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the stock data ETL stages on a process pool')
+    parser.add_argument('stages', nargs='*',
+                        help='stages to run, {} (default : all, in order)'.format(', '.join(stage_names)))
+    parser.add_argument('--datadir', default='./data/')
+    parser.add_argument('--symbols', nargs='+', help='symbols without extension (default exchange)')
+    parser.add_argument('--stored', action='store_true', help='all the symbols stored in datadir')
+    parser.add_argument('--symbols-file', default='./data/symbols_ns.csv')
+    parser.add_argument('--limit', type=int, default=None, help='only the first symbols')
+    parser.add_argument('--period', default='1y')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--source', default='yahoo', choices=['yahoo', 'fake'])
+    parser.add_argument('--fake-latency', type=float, default=0.05)
+    parser.add_argument('--rate', type=float, default=4.0, help='download requests per second (0 : no limit)')
+    parser.add_argument('--run-id', default=datetime.date.today().isoformat(),
+                        help='journal of the run, re-use it to resume (default : today)')
+    parser.add_argument('--restart', action='store_true', help='ignore the journal of the run')
+    parser.add_argument('--progress', type=float, default=2.0, help='progress interval (s)')
+    args = parser.parse_args(argv)
+
+    unknown = [s for s in args.stages if s not in stage_names]
+    if unknown:
+        parser.error('unknown stages {}'.format(', '.join(unknown)))
+    if not os.path.isdir(args.datadir):
+        sys.exit('Directory {} does not exist!'.format(args.datadir))
+    stages = [s for s in stage_names if s in args.stages] or stage_names
+    symbols = read_symbols(args)
+
+    journal_dir = os.path.join(args.datadir, 'pipeline')
+    os.makedirs(journal_dir, exist_ok=True)
+    journal_file = os.path.join(journal_dir, '{}.jsonl'.format(args.run_id))
+    if args.restart and os.path.isfile(journal_file):
+        os.remove(journal_file)
+    journal = Journal(journal_file)
+
+    config = dict(datadir=os.path.abspath(args.datadir), period=args.period, source=args.source,
+                  fake_latency=args.fake_latency, rate=args.rate or None, workers=args.workers,
+                  progress=args.progress)
+    print('Run {} : {} on {} symbols with {} workers'.format(
+        args.run_id, ', '.join(stages), len(symbols), args.workers))
+
+    start = time.perf_counter()
+    reports = []
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            for stage in stages:
+                reports.append(run_stage(stage, symbols, config, executor, journal))
+    finally:
+        journal.close()
+    print_report(reports, time.perf_counter() - start)
+    return 1 if any(r['failed'] for r in reports) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
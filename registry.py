@@ -0,0 +1,412 @@
+# Registry of the symbols of a data directory
+# One compact record per symbol (SymbolRecord, __slots__ and interned strings): the
+# symbol of the dropdowns, its exchange suffix, the ticker (name of the stored file),
+# the resolved path of the stored file, the data version (modification time of the
+# file, ns) and the time of the last refresh. A lookup is a dict hit and the path is
+# joined once per symbol instead of on every request.
+# The records are kept in a binary sidecar next to the data, <datadir>/registry.npy
+# (numpy structured array, like summary.npy), so the versions and refresh times
+# survive restarts and are shared by the worker processes. The file is written at
+# most every flush_interval seconds (and at exit), merged with the records written
+# by the other processes.
+#
+# Exchanges: the symbols file may have an 'Exchange' (NSE, BSE, LSE, ...) or a 'Suffix'
+# column, the other symbols are listed on the default exchange (suffix '.NS', symbol
+# 'RELIANCE', ticker 'RELIANCE.NS'). The symbols of the other exchanges keep their
+# suffix ('VOD.L'), an unknown symbol ending with a known suffix resolves to its exchange.
+#
+# Only the symbols of the symbols file (add_symbols), the stored files (stored) and the
+# successful downloads (refreshed) are registered, a lookup never adds a record.
+#
+# usage: python registry.py [datadir] [--symbols ./data/symbols_ns.csv]  (register and write the sidecar)
+
+import os, sys
+import time
+import atexit
+import argparse
+import threading
+import numpy as np
+from locks import FileLock, lock_path
+from store import get_store
+
+# exchange -> ticker suffix of Yahoo finance
+exchange_suffixes = {'NSE': '.NS', 'BSE': '.BO', 'NYSE': '', 'NASDAQ': '', 'AMEX': '',
+                     'LSE': '.L', 'TSX': '.TO', 'ASX': '.AX', 'HKEX': '.HK', 'XETRA': '.DE',
+                     'EURONEXT': '.PA', 'TSE': '.T', 'SGX': '.SI'}
+# exchange of the symbols without one
+default_suffix = '.NS'
+
+# fields of the sidecar, the string fields are widened to the longest symbol / suffix
+# when written (see sidecar_dtype), a longer ticker is never truncated
+registry_dtype = np.dtype([('symbol', 'U24'),
+                           ('suffix', 'U8'),
+                           ('version', '<i8'),
+                           ('refreshed', '<f8')])
+
+
+def sidecar_dtype(records):
+    '''
+    Return registry_dtype with the string fields sized to fit the symbols and suffixes of records
+    '''
+    symbol = max([registry_dtype['symbol'].itemsize // 4] + [len(r.symbol) for r in records])
+    suffix = max([registry_dtype['suffix'].itemsize // 4] + [len(r.suffix) for r in records])
+    return np.dtype([('symbol', 'U{}'.format(symbol)), ('suffix', 'U{}'.format(suffix)),
+                     ('version', '<i8'), ('refreshed', '<f8')])
+
+
+def symbol_suffixes(df):
+    '''
+    Return the exchange suffix of every row of a symbols file
+
+    Input parameters
+    ----------------
+    df : dataframe with a 'Symbol' column and an optional 'Suffix' or 'Exchange' column
+
+    Output
+    ------
+    list of str or None (resolved from the symbol, see SymbolRegistry.key)
+    '''
+    if 'Suffix' in df.columns:
+        return ['' if s != s else str(s) for s in df['Suffix']]
+    if 'Exchange' in df.columns:
+        return [exchange_suffixes.get(str(e).upper()) if e == e else None for e in df['Exchange']]
+    return [None] * len(df)
+
+
+class SymbolRecord:
+    '''
+    Registry entry of a symbol
+
+    Attributes
+    ----------
+    symbol    : str, symbol of the dropdowns (e.g. 'RELIANCE', 'VOD.L')
+    suffix    : str, exchange suffix of the ticker (e.g. '.NS', '.L', '')
+    ticker    : str, symbol with suffix, name of the stored data (e.g. 'RELIANCE.NS')
+    path      : str, stored file of the ticker
+    version   : int, modification time (ns) of the stored file when last seen (-1 : none)
+    refreshed : float, time of the last download / refresh (s since the epoch, nan : never)
+    '''
+    __slots__ = ('symbol', 'suffix', 'ticker', 'path', 'version', 'refreshed')
+
+    def __init__(self, symbol, suffix, ticker, path, version=-1, refreshed=float('nan')):
+        self.symbol = sys.intern(symbol)
+        self.suffix = sys.intern(suffix)
+        self.ticker = sys.intern(ticker)
+        self.path = sys.intern(path)
+        self.version = version
+        self.refreshed = refreshed
+
+    def __repr__(self):
+        return 'SymbolRecord({!r}, ticker={!r}, version={})'.format(self.symbol, self.ticker, self.version)
+
+
+class SymbolRegistry:
+    '''
+    Symbol records of a store, stored in <datadir>/registry.npy
+
+    Input parameters
+    ----------------
+    store          : store object (see store.py), resolves the paths
+    filename       : str, name of the sidecar file (default : 'registry.npy')
+    default_suffix : str, exchange suffix of the symbols without one (default : '.NS')
+    flush_interval : float, seconds between two writes of the sidecar (default : 5)
+    '''
+
+    def __init__(self, store, filename='registry.npy', default_suffix=default_suffix, flush_interval=5.0):
+        self.store = store
+        self.path = os.path.join(store.datadir, filename)
+        self.default_suffix = default_suffix
+        self.flush_interval = flush_interval
+        # known suffixes, longest first ('' matches every symbol)
+        self._suffixes = sorted(set(s for s in exchange_suffixes.values() if s) | {default_suffix},
+                                key=len, reverse=True)
+        self._records = {}
+        self._dirty = set()
+        self._loaded = False
+        self._flushed = time.time()
+        self._lock = threading.RLock()
+
+    def key(self, symbol, suffix=None):
+        '''
+        Return (registry symbol, suffix) of a symbol and optional exchange suffix
+
+        The symbols of the default exchange are registered without suffix, the
+        others with it.
+        '''
+        if suffix is None:
+            suffix = self.default_suffix
+            for s in self._suffixes:
+                if symbol.endswith(s) and len(symbol) > len(s):
+                    suffix = s
+                    break
+        if suffix == self.default_suffix:
+            if suffix and symbol.endswith(suffix):
+                symbol = symbol[:-len(suffix)]
+            return symbol, suffix
+        if not symbol.endswith(suffix):
+            symbol = symbol + suffix
+        return symbol, suffix
+
+    def _record(self, symbol, suffix, version=-1, refreshed=float('nan')):
+        ticker = symbol + suffix if suffix == self.default_suffix else symbol
+        return SymbolRecord(symbol, suffix, ticker, self.store.path(ticker), version, refreshed)
+
+    def _new(self, symbol, suffix, version=-1, refreshed=float('nan')):
+        record = self._record(symbol, suffix, version, refreshed)
+        self._records[record.symbol] = record
+        return record
+
+    def _load(self):
+        # records of the sidecar, once
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            for row in self._read():
+                if row['symbol'] not in self._records:
+                    self._new(str(row['symbol']), str(row['suffix']), int(row['version']),
+                              float(row['refreshed']))
+            self._loaded = True
+
+    def _read(self):
+        try:
+            rows = np.load(self.path, allow_pickle=False)
+        except (OSError, ValueError):
+            return np.zeros(0, dtype=registry_dtype)
+        # a sidecar written with other fields is rewritten on the next flush
+        if rows.dtype.names != registry_dtype.names or rows.dtype['symbol'].kind != 'U':
+            return np.zeros(0, dtype=registry_dtype)
+        return rows
+
+    def get(self, symbol):
+        '''
+        Return the registered record of symbol or None
+
+        Input parameters
+        ----------------
+        symbol : str, symbol of the dropdowns or ticker (e.g. 'RELIANCE', 'RELIANCE.NS', 'VOD.L')
+
+        Output
+        ------
+        SymbolRecord or None
+        '''
+        record = self._records.get(symbol)
+        if record is not None:
+            return record
+        self._load()
+        return self._records.get(symbol) or self._records.get(self.key(symbol)[0])
+
+    def resolve(self, symbol, suffix=None):
+        '''
+        Return the record of symbol, a new unregistered record for an unknown symbol
+
+        The record of an unknown symbol is registered by its first download (see refreshed).
+
+        Input parameters
+        ----------------
+        symbol : str, symbol of the dropdowns or ticker
+        suffix : str, exchange suffix (default : None, resolved from the symbol)
+        '''
+        if suffix is None:
+            record = self.get(symbol)
+            if record is not None:
+                return record
+        else:
+            self._load()
+        symbol, suffix = self.key(symbol, suffix)
+        record = self._records.get(symbol)
+        if record is None or record.suffix != suffix:
+            record = self._record(symbol, suffix)
+        return record
+
+    def ticker(self, symbol):
+        '''
+        Return the ticker (name of the stored data) of symbol
+        '''
+        return self.resolve(symbol).ticker
+
+    def add(self, symbol, suffix=None):
+        '''
+        Register symbol on an exchange (suffix, default : resolved from the symbol)
+        '''
+        self._load()
+        symbol, suffix = self.key(symbol, suffix)
+        with self._lock:
+            record = self._records.get(symbol)
+            if record is None or record.suffix != suffix:
+                record = self._new(symbol, suffix)
+                self._dirty.add(record.symbol)
+            return record
+
+    def add_symbols(self, df):
+        '''
+        Register the symbols of a symbols file
+
+        Input parameters
+        ----------------
+        df : dataframe with a 'Symbol' column and an optional 'Suffix' or 'Exchange' column
+
+        Output
+        ------
+        list of the registry symbols (the dropdown values), in the order of df
+        '''
+        return [self.add(str(s), suffix).symbol for s, suffix in zip(df['Symbol'], symbol_suffixes(df))]
+
+    def mtime(self, record):
+        '''
+        Return the modification time (ns) of the stored file of a record or None
+
+        The record version is updated as well.
+        '''
+        try:
+            mtime = os.stat(record.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        record.version = -1 if mtime is None else mtime
+        return mtime
+
+    def refreshed(self, record):
+        '''
+        Record a download / refresh of the stored data of a record, registered if required
+
+        Output
+        ------
+        modification time (ns) of the stored file or None
+        '''
+        mtime = self.mtime(record)
+        record.refreshed = time.time()
+        self._load()
+        with self._lock:
+            registered = self._records.setdefault(record.symbol, record)
+            if registered is not record:
+                registered.version, registered.refreshed = record.version, record.refreshed
+            self._dirty.add(record.symbol)
+        if time.time() - self._flushed >= self.flush_interval:
+            self.flush()
+        return mtime
+
+    def flush(self):
+        '''
+        Write the records to the sidecar, merged with the records of the other processes
+        '''
+        self._load()
+        with self._lock:
+            if not self._dirty and os.path.isfile(self.path):
+                return
+            with FileLock(lock_path(self.path)):
+                for row in self._read():
+                    record = self._records.get(row['symbol'])
+                    if record is None:
+                        self._new(str(row['symbol']), str(row['suffix']), int(row['version']),
+                                  float(row['refreshed']))
+                    elif row['symbol'] not in self._dirty and (row['refreshed'] > record.refreshed
+                                                               or np.isnan(record.refreshed)):
+                        # refreshed by another process
+                        record.version = int(row['version'])
+                        record.refreshed = float(row['refreshed'])
+                rows = np.zeros(len(self._records), dtype=sidecar_dtype(self._records.values()))
+                for i, r in enumerate(self._records.values()):
+                    rows[i] = (r.symbol, r.suffix, r.version, r.refreshed)
+                tmpname = '{}.{}.{}.tmp'.format(self.path, os.getpid(), threading.get_ident())
+                try:
+                    with open(tmpname, 'wb') as f:
+                        np.save(f, rows, allow_pickle=False)
+                    os.replace(tmpname, self.path)
+                finally:
+                    if os.path.exists(tmpname):
+                        os.remove(tmpname)
+            self._dirty.clear()
+            self._flushed = time.time()
+
+    def clear(self):
+        '''
+        Forget all the records and remove the sidecar
+        '''
+        with self._lock:
+            self._records.clear()
+            self._dirty.clear()
+            self._loaded = True
+            if os.path.isfile(self.path):
+                os.remove(self.path)
+
+    def stored(self):
+        '''
+        Register the symbols stored in the data directory (files of the known exchanges)
+
+        Output
+        ------
+        list of the registry symbols of the stored files
+        '''
+        symbols = []
+        for suffix in self._suffixes:
+            for ticker in self.store.symbols(suffix=suffix):
+                record = self.add(ticker, suffix)
+                self.mtime(record)
+                with self._lock:
+                    self._dirty.add(record.symbol)
+                symbols.append(record.symbol)
+        return symbols
+
+    def symbols(self, suffix=None):
+        '''
+        Return the registry symbols (of an exchange suffix, default : all)
+        '''
+        self._load()
+        with self._lock:
+            return [s for s, r in self._records.items() if suffix is None or r.suffix == suffix]
+
+    def __len__(self):
+        self._load()
+        return len(self._records)
+
+    def __contains__(self, symbol):
+        self._load()
+        return symbol in self._records
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(datadir='./data/'):
+    '''
+    Return the (shared) symbol registry of a data directory (default store format)
+    '''
+    # the path of datadir is only normalized on the first call (per request otherwise)
+    registry = _registries.get(datadir)
+    if registry is not None:
+        return registry
+    key = os.path.abspath(os.path.expanduser(datadir))
+    with _registries_lock:
+        if key not in _registries:
+            _registries[key] = SymbolRegistry(get_store(key))
+        _registries[datadir] = _registries[key]
+        return _registries[key]
+
+
+@atexit.register
+def _flush_registries():
+    for registry in set(_registries.values()):
+        try:
+            registry.flush()
+        except OSError:
+            pass
+
+
+if __name__ == '__main__':
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description='Register the symbols of a symbols file and the stored files')
+    parser.add_argument('datadir', nargs='?', default='./data/')
+    parser.add_argument('--symbols', default=None, help='symbols csv file (Symbol, optional Exchange / Suffix)')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.datadir):
+        sys.exit('Directory {} does not exist!'.format(args.datadir))
+    registry = get_registry(args.datadir)
+    if args.symbols:
+        registry.add_symbols(pd.read_csv(args.symbols))
+    registry.stored()
+    registry.flush()
+    print('Registered {} symbols in {}'.format(len(registry), registry.path))
@@ -0,0 +1,113 @@
+# Multi-resolution OHLC bars (aggregation pyramid)
+# The daily bars of a symbol are aggregated into weekly, monthly and quarterly bars
+# (first open, highest high, lowest low, last close, total volume). A bar is dated
+# by the first day of its calendar period (monday, first day of the month / quarter),
+# like the '1wk' and '1mo' intervals of yfinance. The stores keep one file per level
+# next to the daily file and bring it up to date on every write (see store.py): only
+# the last stored period, which may be incomplete, and the new ones are aggregated again.
+
+import numpy as np
+
+# bar intervals of the charts, 'D' are the stored daily bars
+intervals = {'D': 'Daily', 'W': 'Weekly', 'M': 'Monthly', 'Q': 'Quarterly'}
+# aggregated levels of the pyramid
+levels = ['W', 'M', 'Q']
+# column -> 'first', 'last' or reducing ufunc (the missing highs / lows are ignored)
+aggregations = [('Open', 'first'), ('High', np.fmax), ('Low', np.fmin),
+                ('Close', 'last'), ('Volume', np.add)]
+
+
+def period_ids(dates, level):
+    '''
+    Number the calendar periods of dates, consecutive periods get consecutive numbers
+
+    Input parameters
+    ----------------
+    dates : numpy datetime64 array
+    level : str, 'W', 'M' or 'Q'
+
+    Output
+    ------
+    int64 numpy array
+    '''
+    if level == 'W':
+        # 1970-01-01 was a thursday, the weeks start on monday
+        return (dates.astype('datetime64[D]').astype('int64') + 3) // 7
+    months = dates.astype('datetime64[M]').astype('int64')
+    if level == 'M':
+        return months
+    if level == 'Q':
+        return months // 3
+    raise ValueError('Unknown bar interval {}'.format(level))
+
+
+def period_starts(ids, level):
+    '''
+    First day (datetime64[ns]) of the periods numbered by period_ids
+    '''
+    if level == 'W':
+        days = ids * 7 - 3
+    else:
+        months = ids * 3 if level == 'Q' else ids
+        days = months.astype('datetime64[M]').astype('datetime64[D]').astype('int64')
+    return days.astype('datetime64[D]').astype('datetime64[ns]')
+
+
+def aggregate(arrays, level):
+    '''
+    Aggregate daily bars into the bars of a level
+
+    Input parameters
+    ----------------
+    arrays : dict of column name -> numpy array, 'Date' (sorted) and OHLC (Volume) columns
+    level  : str, 'W', 'M' or 'Q'
+
+    Output
+    ------
+    dict of column name -> numpy array, one row per period
+    '''
+    dates = np.asarray(arrays['Date']).astype('datetime64[ns]')
+    ids = period_ids(dates, level)
+    # first and last row of every period
+    first = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]]) if len(ids) else np.zeros(0, 'int64')
+    last = np.r_[first[1:], len(ids)] - 1
+    bars = {'Date': period_starts(ids[first], level)}
+    for column, how in aggregations:
+        if column not in arrays:
+            continue
+        values = np.asarray(arrays[column])
+        if how == 'first':
+            bars[column] = values[first]
+        elif how == 'last':
+            bars[column] = values[last]
+        else:
+            bars[column] = how.reduceat(values, first) if len(first) else values[:0]
+    return bars
+
+
+def update(bars, arrays, level):
+    '''
+    Bring aggregated bars up to date with the daily bars they were built from
+
+    The last period of bars and the later ones are aggregated again from the
+    daily bars, the earlier periods are kept as they are.
+
+    Input parameters
+    ----------------
+    bars   : dict of column name -> numpy array, stored bars of the level (None : aggregate all)
+    arrays : dict of column name -> numpy array, all the daily bars
+    level  : str, 'W', 'M' or 'Q'
+
+    Output
+    ------
+    dict of column name -> numpy array
+    '''
+    if bars is None or not len(bars['Date']):
+        return aggregate(arrays, level)
+    dates = np.asarray(arrays['Date']).astype('datetime64[ns]')
+    # the bars are dated by the start of their period
+    start = np.searchsorted(dates, np.asarray(bars['Date'][-1]).astype('datetime64[ns]'))
+    tail = aggregate({c: v[start:] for c, v in arrays.items()}, level)
+    if set(tail) != set(bars):
+        return aggregate(arrays, level)
+    return {c: np.concatenate([bars[c][:-1], tail[c]]) for c in tail}
@@ -0,0 +1,143 @@
+# Symbol search for the dropdowns
+# The index is built once from the symbols (and company names, if available) and
+# answers a query with the best k matches, ranked as:
+#   0 : exact symbol
+#   1 : symbol prefix             (binary search in the sorted symbols)
+#   2 : prefix of a name word     (binary search in the sorted name words)
+#   3 : symbol / name substring   (trigram candidates, verified)
+#   4 : fuzzy, most shared trigrams (typos), queries of 3+ characters
+# so the browser only receives a few options per keystroke instead of the
+# whole universe.
+
+import re
+import bisect
+from collections import defaultdict
+
+
+def normalize(text):
+    '''
+    Upper case, non alphanumeric characters as single spaces
+    '''
+    return re.sub(r'[^0-9A-Z&]+', ' ', str(text).upper()).strip()
+
+
+def trigrams(text):
+    '''
+    Set of the 3 character substrings of every word of text (padded with spaces)
+    '''
+    grams = set()
+    for word in text.split():
+        word = ' ' + word + ' '
+        grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return grams
+
+
+class SymbolIndex:
+    '''
+    Prefix and trigram index over symbols and company names
+
+    Input parameters
+    ----------------
+    symbols : list of str, symbols
+    names   : list of str, company names (default : None, symbols only)
+    '''
+
+    def __init__(self, symbols, names=None):
+        self.symbols = [str(s) for s in symbols]
+        self.names = [('' if n is None or n != n else str(n)) for n in names] if names is not None \
+            else [''] * len(self.symbols)
+        keys = [normalize(s) for s in self.symbols]
+        texts = [normalize(n) for n in self.names]
+        self._keys = keys
+        self._texts = texts
+        self._positions = {s: i for i, s in enumerate(self.symbols)}
+
+        # sorted (key, id) for the symbol prefixes
+        self._sorted = sorted((k, i) for i, k in enumerate(keys))
+        self._sorted_keys = [k for k, _ in self._sorted]
+        # sorted (word, id) for the name word prefixes
+        self._words = sorted(set((w, i) for i, t in enumerate(texts) for w in t.split()))
+        self._sorted_words = [w for w, _ in self._words]
+        # trigram -> ids of the symbols and names containing it
+        self._grams = defaultdict(set)
+        for i, (k, t) in enumerate(zip(keys, texts)):
+            for g in trigrams(k + ' ' + t):
+                self._grams[g].add(i)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    @staticmethod
+    def _prefix_ids(sorted_keys, items, prefix):
+        start = bisect.bisect_left(sorted_keys, prefix)
+        end = bisect.bisect_left(sorted_keys, prefix + '\uffff')
+        return [items[j][1] for j in range(start, end)]
+
+    def search(self, query, k=20):
+        '''
+        Return the positions of the best k matches of query (best first)
+        '''
+        q = normalize(query)
+        if not q:
+            return []
+
+        ranks = {}
+
+        def add(ids, rank):
+            for i in ids:
+                if i not in ranks or rank < ranks[i]:
+                    ranks[i] = rank
+
+        compact = q.replace(' ', '')
+        for i in self._prefix_ids(self._sorted_keys, self._sorted, compact):
+            ranks[i] = 0 if self._keys[i] == compact else 1
+        # every query word has to prefix a word of the name
+        words = q.split()
+        if words:
+            matches = None
+            for word in words:
+                ids = set(self._prefix_ids(self._sorted_words, self._words, word))
+                matches = ids if matches is None else matches & ids
+            add(matches, 2)
+
+        # substring and fuzzy matches through the trigram candidates
+        grams = trigrams(q)
+        if len(compact) >= 3 and grams:
+            counts = defaultdict(int)
+            for g in grams:
+                for i in self._grams.get(g, ()):
+                    counts[i] += 1
+            for i, c in counts.items():
+                if i in ranks:
+                    continue
+                if compact in self._keys[i] or q in self._texts[i]:
+                    ranks[i] = 3
+                elif c >= max(1, len(grams) // 2):
+                    ranks[i] = 4 + (len(grams) - c) / len(grams)
+
+        best = sorted(ranks, key=lambda i: (ranks[i], len(self._keys[i]), self._keys[i]))
+        return best[:k]
+
+    def option(self, i):
+        '''
+        Dropdown option of the symbol at position i
+        '''
+        label = self.symbols[i] if not self.names[i] else '{} - {}'.format(self.symbols[i], self.names[i])
+        return {'label': label, 'value': self.symbols[i]}
+
+    def options(self, query, k=20, keep=None):
+        '''
+        Dropdown options of the best k matches of query
+
+        Input parameters
+        ----------------
+        query : str, search text
+        k     : int, number of options (default : 20)
+        keep  : str, symbol always included (the selected value of the dropdown)
+        '''
+        ids = self.search(query, k=k) if query else []
+        options = [self.option(i) for i in ids]
+        if keep and keep not in (o['value'] for o in options):
+            i = self._positions.get(keep)
+            options.insert(0, self.option(i) if i is not None else {'label': keep, 'value': keep})
+        return options
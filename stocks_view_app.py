@@ -5,15 +5,37 @@
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
-import plotly.express as px
+import os
+import json
+import logging
+import numpy as np
 import pandas as pd
+import plotly
 import plotly.graph_objects as go
-from dash.dependencies import Input, Output
-from utils import get_single_stock, check_dir, write_sample_stock, clear_cache_data
+from dash.dependencies import Input, Output, State, ALL, MATCH, ClientsideFunction
+from dash.exceptions import PreventUpdate
+from indicators import IndicatorEngine
+from cache import FigureCache, DiskFigureCache
+from compact import PayloadBuilder, encode_array, date_ms
+from downsample import downsample_line, downsample_ohlc, visible_rows, relayout_xrange
+from store import get_store
+from analytics import UniverseCache
+from search import SymbolIndex
+from registry import get_registry
+from resample import intervals
+from live import LiveFeed, SimulatedQuoteSource, YahooQuoteSource
+from summary import get_summary_index, rebuild_summary_index, horizons
+from dataplane import DataPlane
+from asyncdata import AsyncDataLayer, HttpFetcher
+from metrics import span, timed, install as install_metrics
+from utils import get_stock_bars, get_shared_stock, check_dir, clear_cache_data, get_date_range, warm_cache
 from pathlib import Path
 
 app = dash.Dash(__name__)
 server = app.server
+# not the logger of the Dash app (named after the module), which has its own stdout
+# handler: the records would be printed again by the root handler of basicConfig
+logger = logging.getLogger('dashboard')
 
 ########################################
 # Global variables and constants
@@ -28,8 +50,54 @@ period = '1y'
 # file containing all the NS symbols
 file_symbols = './data/symbols_ns.csv'
 # clear cache data
-clear_data=True
-# default symbols
+clear_data=False
+# cached stock data older than refresh_age (s) is brought up to date (delta download)
+refresh_age = 12 * 3600
+# bar interval of the panels at startup, 'D' (daily), 'W' (weekly), 'M' (monthly) or 'Q'
+# (quarterly), the coarser bars are kept up to date by the store next to the daily data
+# (resample.py), so multi-year periods ('5y', 'max') draw a few hundred bars
+bar_interval = 'D'
+# number of stock panels (dropdown + graph), two per row
+n_panels = 6
+# 'server' : figures are built by the server on every control change
+# 'client' : the OHLC data of a panel is sent once and the figures are drawn in the browser
+#            (assets/clientside.js), only a symbol change goes back to the server
+# 'compact': like 'server', but the panels are sent as base64 float32 arrays with shared
+#            date axes and drawn in the browser from the static layout (compact.py)
+render_mode = 'server'
+# live quotes of the displayed symbols, the new ticks are appended to the graphs every
+# live_interval_ms (extendData) without rebuilding the figures (live.py)
+live_mode = False
+live_interval_ms = 2000
+# 'simulated' : local random walk from the last close, 'yahoo' : last 1 minute bar
+live_source = 'simulated'
+# ticks kept per symbol (and drawn per graph)
+live_capacity = 1000
+# True  : the dropdowns only receive the best search_top_k matches of the typed text
+#         (search_value callbacks on the server, search.py)
+# False : the full symbol list is sent once and copied to all the dropdowns in the browser
+symbol_search = True
+search_top_k = 20
+# download the missing / stale symbols on an asyncio loop (asyncdata.py) instead of in the
+# callbacks: the panel gets a placeholder at once and is rendered again when its data
+# landed (checked every pending_interval_ms), for the 'server' and 'compact' render modes
+async_loading = False
+# downloads at the same time
+async_concurrency = 8
+# None : Yahoo finance, url : quote server of the fetch.FakeQuoteServer api
+quote_server = None
+pending_interval_ms = 500
+# logging level of the app modules ('DEBUG' : every load, write and timed span)
+log_level = 'INFO'
+# latency histograms of the timed spans (load, cache, indicators, figure, serialize, ...)
+# per callback, served to local clients at metrics_path (metrics.py)
+metrics_path = '/metrics'
+# callback requests slower than slow_request_s are logged with their spans
+slow_request_s = 1.0
+# sample the stacks of the callback requests and keep the hottest ones of the slow
+# requests (logged and served at metrics_path/profiles), some overhead, off by default
+profile_requests = False
+# default symbols (one per panel, repeated if there are more panels)
 default_symbols = ['RELIANCE',
                     'TATAMOTORS',
                     'ADANIPORTS',
@@ -40,58 +108,170 @@ default_symbols = ['RELIANCE',
 # plot parameters
 margin = dict(l=25, r=25, t=30, b=5, pad=0)
 transition_duration = 300
+# approximate width of a graph (pixels), long series are downsampled to about
+# one line point per pixel and one candle per 2 pixels (zooming in re-fetches detail)
+graph_width_px = 800
+max_points = graph_width_px
+max_candles = graph_width_px // 2
+# build the server figures as plain dicts from a pre-validated layout (make_fast_figure)
+# instead of plotly graph objects (make_graph)
+fast_figures = True
+# static styling of the traces (shared by the server and the clientside figures)
+trace_styles = {'StockPrice': dict(type='scatter', line=dict(color="#332f2f", width=1.5)),
+                'Candlestick': dict(type='candlestick'),
+                'SimpleMovingAverage': dict(type='scatter',
+                                            line=dict(color="#2424ed", width=2.5, dash='dot')),
+                'Live': dict(type='scatter', line=dict(color="#e4572e", width=1.5))}
 # yaxis [min, max] -> [perc[0] * stock_min, perc[1] * stock_max]
 ylims_perc = [0.95, 1.05]
 
 # xaxis [min, max] : [min_date, max_date]
-# write sample stock (min, max date)
-write_sample_stock()
-df = pd.read_csv('./data/sample_stock.csv')
-date_range = [df['Date'].min(), df['Date'].max()]
-del df
+# None : derived from the locally stored default symbols (no download at startup)
+date_range = None
+# load the default symbols in the background at startup
+warm_start = True
 
-# clear all existing stock data with extension '.NS'
+logging.basicConfig(level=log_level, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+install_metrics(server, path=metrics_path, slow_request_s=slow_request_s, profile=profile_requests)
+
+if date_range is None:
+    date_range = get_date_range(default_symbols, period=period, datadir=datadir)
+# room for the live ticks of today
+if live_mode:
+    date_range = [date_range[0], str((pd.Timestamp.today() + pd.Timedelta(days=1)).date())]
+
+# clear all the stored stock data (every exchange, see clear_cache_data)
 clear_cache_data(datadir='./data/', value=clear_data)
     
+# memoized moving averages (and other indicators) of the loaded stocks
+indicator_engine = IndicatorEngine()
+
+# per-symbol low/high, returns, ... of the stored data (maintained by the stores on write)
+summary_index = get_summary_index(datadir)
+# summarize the files stored before the index existed (of every exchange)
+if not os.path.isfile(summary_index.path) and os.path.isdir(datadir):
+    rebuild_summary_index(get_store(datadir))
+# number of gainers and losers of the top movers view
+n_movers = 10
+# aligned prices of all the stored dropdown symbols (correlation / relative strength panel),
+# loaded by ticker (all the exchanges, see ticker_symbols)
+universe_cache = UniverseCache(get_store(datadir), suffix='')
+# lookbacks of the correlation / relative strength panel
+analytics_horizons = ['1m', '3m', '6m', '1y']
+
+# serialized figures of the server render mode, keyed by the callback inputs and data version
+# None : in-memory cache of this process, directory : cache shared by all the worker processes
+figure_cache_dir = None
+figure_cache = DiskFigureCache(figure_cache_dir) if figure_cache_dir else FigureCache()
+
+# background poller of the live quotes
+live_feed = None
+if live_mode:
+    live_feed = LiveFeed(source=YahooQuoteSource(datadir) if live_source == 'yahoo' else SimulatedQuoteSource(),
+                         interval=live_interval_ms / 1000, capacity=live_capacity)
+
 # Create necessary variables and data folder
 # load all the symbols in the memory
-print('Read all the available NSE symbols from {}'.format(file_symbols))
+logger.info('Read all the available NSE symbols from %s', file_symbols)
 df_symbols = pd.read_csv(file_symbols)
+# ticker and stored file of every symbol, resolved once (registry.py), the symbols of an
+# 'Exchange' / 'Suffix' column other than NSE keep their suffix (e.g. 'VOD.L')
+symbol_registry = get_registry(datadir)
+df_symbols['Symbol'] = symbol_registry.add_symbols(df_symbols)
+symbol_registry.flush()
+# ticker -> symbol of the dropdowns, the movers and analytics views work on the tickers
+ticker_symbols = {symbol_registry.ticker(s): s for s in df_symbols['Symbol']}
+# prefix / trigram index over the symbols (and company names, if the file has a 'Name' column)
+symbol_index = SymbolIndex(df_symbols['Symbol'], df_symbols['Name'] if 'Name' in df_symbols else None)
+
+# shared memory directory of the stock data segments for multi-process deployments
+# (gunicorn workers map the same pages instead of keeping their own copies, see
+# dataplane.py, run 'python dataplane.py --watch 60' as the loader), None : disabled
+data_plane_dir = None
+data_plane = DataPlane(data_plane_dir) if data_plane_dir else None
+
+# non-blocking downloads of the callbacks
+data_layer = None
+if async_loading:
+    data_layer = AsyncDataLayer(fetcher=HttpFetcher(quote_server) if quote_server else None,
+                                datadir=datadir, period=period, max_age=refresh_age,
+                                max_concurrency=async_concurrency)
+
+# fill the frame cache without delaying the first served layout
+if warm_start and data_layer is not None:
+    for symbol in default_symbols:
+        data_layer.request(symbol)
+elif warm_start and data_plane is None:
+    warm_cache(default_symbols, period=period, datadir=datadir, max_age=refresh_age)
 
 #########################################
 # Helper functions
 #########################################
 
 
-def make_plot_data(df, graph_name='Close', chart_name=['StockPrice'], days=10):
+def load_stock(symbol, interval='D'):
+    '''
+    Stock bars of a panel, the daily bars from the shared data plane if enabled
+    '''
+    # the async data layer refreshes the stale data in the background (see split_pending)
+    max_age = None if data_layer is not None else refresh_age
+    if data_plane is not None and interval == 'D':
+        return get_shared_stock(symbol, data_plane, period=period, datadir=datadir, max_age=max_age)
+    return get_stock_bars(symbol, interval, period=period, datadir=datadir, max_age=max_age)
 
-    data = []
+
+def plot_arrays(df, graph_name='Close', chart_name=['StockPrice'], days=10,
+                xrange=None, max_points=None, max_candles=None):
+    '''
+    Compute the arrays of the traces of a stock panel
+
+    The moving average is computed on the full data. Only the bars inside xrange
+    (all by default) are drawn, lines are downsampled (LTTB) to max_points and
+    candles re-bucketed to max_candles (None : no downsampling).
+
+    Output
+    ------
+    list of (trace name, x dates, {'y': values} or {'open', 'high', 'low', 'close': values})
+    '''
+    rows = visible_rows(df['Date'].values, xrange)
+    dates = df['Date'].values[rows]
+
+    traces = []
     for cname in chart_name:
         if cname == 'StockPrice':
-            data.append(go.Scatter(
-                                    x=df['Date'],
-                                    y=df[graph_name],
-                                    name=cname,
-                                    line=dict(color="#332f2f", width=1.5)
-                                    )
-                        )
+            x, y = downsample_line(dates, df[graph_name].values[rows], max_points)
+            traces.append((cname, x, dict(y=y)))
         if cname == 'Candlestick':
-            data.append(go.Candlestick(
-                                        x=df['Date'],
-                                        open=df['Open'], high=df['High'],
-                                        low=df['Low'], close=df['Close'],
-                                        name=cname
-                                        )
-                        )
+            x, open_, high, low, close = downsample_ohlc(
+                dates, df['Open'].values[rows], df['High'].values[rows],
+                df['Low'].values[rows], df['Close'].values[rows], max_candles)
+            traces.append((cname, x, dict(open=open_, high=high, low=low, close=close)))
         if cname == 'SimpleMovingAverage':
-            data.append(go.Scatter(
-                                    x=df['Date'],
-                                    y=df[graph_name].rolling(days).mean(),
-                                    name=cname,
-                                    line=dict(color="#2424ed",
-                                              width=2.5, dash='dot')
-                                    )
-                        )
+            with span('indicators'):
+                sma = indicator_engine.sma(df, graph_name, days)
+            x, y = downsample_line(dates, sma[rows], max_points)
+            traces.append((cname, x, dict(y=y)))
+    # empty trace extended by the live ticks (always the last one, see update_live)
+    if live_mode:
+        traces.append(('Live', np.zeros(0, dtype='datetime64[ns]'), dict(y=np.zeros(0))))
+    return traces
+
+
+def make_plot_data(df, graph_name='Close', chart_name=['StockPrice'], days=10,
+                   xrange=None, max_points=None, max_candles=None):
+    '''
+    Make the plotly traces of a stock panel (see plot_arrays)
+    '''
+    data = []
+    for cname, x, columns in plot_arrays(df, graph_name, chart_name, days,
+                                         xrange, max_points, max_candles):
+        style = trace_styles[cname]
+        # a DatetimeIndex is serialized without the nanoseconds of datetime64 arrays
+        x = pd.DatetimeIndex(x)
+        if style['type'] == 'candlestick':
+            data.append(go.Candlestick(x=x, name=cname, **columns))
+        else:
+            data.append(go.Scatter(x=x, name=cname, line=style['line'], **columns))
 
     return data
 
@@ -117,10 +297,233 @@ def make_graph(data, xaxis_title='Date', yaxis_limits=[0, 1000],
     return fig
 
 
+# layout of make_graph validated once by plotly, see make_fast_figure
+_fast_layout = {}
+# (symbol, interval) -> bars of the default view, recorded by the figure builds (see update_live)
+_view_rows = {}
+
+
+def json_dates(x):
+    '''
+    Dates as the iso strings plotly writes for a DatetimeIndex
+    '''
+    x = np.asarray(x).astype('datetime64[ns]')
+    if (x.astype('int64') % 10**9).any():
+        # fractions of seconds, left to the plotly encoder
+        return pd.DatetimeIndex(x)
+    return np.datetime_as_string(x, unit='s').tolist()
+
+
+def json_values(values):
+    '''
+    Float values as a list, NaN as None (null)
+    '''
+    values = np.asarray(values, dtype='float64')
+    out = values.astype(object)
+    out[np.isnan(values)] = None
+    return out.tolist()
+
+
+def figure_nbytes(fig):
+    '''
+    Approximate size of a figure (8 bytes per trace value) for the figure cache budget
+    '''
+    data = fig['data'] if isinstance(fig, dict) else fig.to_plotly_json()['data']
+    return sum(8 * len(v) for trace in data for v in trace.values()
+               if isinstance(v, (list, tuple, np.ndarray, pd.Index)))
+
+
+def make_fast_figure(traces, yaxis_limits=[0, 1000], xaxis_limits=[]):
+    '''
+    Same figure as make_graph(make_plot_data(...)) as a plain dict, built without
+    the plotly property validation
+
+    The arrays are converted to lists and iso date strings, which the json encoder
+    of Dash writes directly (no per-value conversion, no NaN pass).
+
+    Input parameters
+    ----------------
+    traces       : list, output of plot_arrays
+    yaxis_limits : list, [min, max] of the y axis
+    xaxis_limits : list, [min, max] dates of the x axis
+
+    Output
+    ------
+    figure dict {'data': [...], 'layout': {...}}
+    '''
+    if 'layout' not in _fast_layout:
+        _fast_layout['layout'] = make_graph([], yaxis_limits=[0, 1], xaxis_limits=[0, 1]).to_plotly_json()['layout']
+    template = _fast_layout['layout']
+
+    layout = dict(template)
+    layout['xaxis'] = dict(template['xaxis'], range=list(xaxis_limits))
+    layout['yaxis'] = dict(template['yaxis'], range=list(yaxis_limits))
+
+    data = []
+    for cname, x, columns in traces:
+        style = trace_styles[cname]
+        trace = {c: json_values(v) for c, v in columns.items()}
+        trace.update(type=style['type'], name=cname, x=json_dates(x))
+        if 'line' in style:
+            trace['line'] = style['line']
+        data.append(trace)
+    return {'data': data, 'layout': layout}
+
+
+def make_placeholder_figure(symbol, status='loading'):
+    '''
+    Empty figure of a panel whose data is being downloaded (or failed to download)
+    '''
+    fig = make_fast_figure([], xaxis_limits=date_range)
+    text = 'Loading {} ...'.format(symbol) if status == 'loading' else 'No data for {}'.format(symbol)
+    fig['layout']['annotations'] = [dict(text=text, showarrow=False, xref='paper', yref='paper',
+                                         x=0.5, y=0.5, font=dict(size=16, color='#323232'))]
+    return fig
+
+
+def make_panel_data(df):
+    '''
+    Compact OHLC arrays of a stock dataframe for the browser (client render mode)
+
+    Same encoding as the compact render mode (compact.py): float64 millisecond dates
+    and float32 prices as base64 little-endian arrays.
+    '''
+    data = {'Date': encode_array(date_ms(df['Date'].values), dtype='float64')}
+    for c in ['Open', 'High', 'Low', 'Close']:
+        data[c] = encode_array(df[c].values, dtype='float32')
+    data['yaxis_range'] = [float(v) for v in stock_yaxis_limits(df)]
+    return data
+
+
+def stock_yaxis_limits(df):
+    '''
+    Y axis [min, max] of a stock panel
+
+    The low/high come from the summary index, the dataframe is only scanned if
+    the summary row is missing or was computed for another version of the file.
+    '''
+    version = df.attrs.get('version')
+    symbol = df.attrs.get('symbol')
+    row = None
+    if version is not None and symbol:
+        row = summary_index.get(symbol_registry.ticker(symbol), version=version)
+    if row is not None:
+        low, high = row['low'], row['high']
+    else:
+        low, high = df['Low'].min(), df['High'].max()
+    return [ylims_perc[0]*float(low), ylims_perc[1]*float(high)]
+
+
+def make_movers_table(rows, horizon):
+    '''
+    Table of the symbols, last close and return over the horizon of summary rows
+    '''
+    header = html.Tr([html.Th('Symbol'), html.Th('Close'), html.Th('Return ({})'.format(horizon))])
+    body = [html.Tr([html.Td(ticker_symbols.get(row['symbol'], row['symbol'])),
+                     html.Td('{:.2f}'.format(row['last_close'])),
+                     html.Td('{:+.2%}'.format(row['ret_' + horizon]))])
+            for row in rows]
+    return html.Table([header] + body, className='movers_table')
+
+
+def make_corr_heatmap(symbols, corr):
+    '''
+    Heatmap figure of a correlation matrix
+    '''
+    fig = go.Figure(go.Heatmap(z=corr, x=symbols, y=symbols, zmin=-1, zmax=1,
+                               colorscale='RdBu', reversescale=True))
+    fig.update_layout(margin=margin, template='simple_white', yaxis_autorange='reversed',
+                      title_text='Correlation of the daily returns', title_x=0.5)
+    return fig
+
+
+def make_ranking_table(ranking):
+    '''
+    Table of the symbols sorted by relative strength
+    '''
+    header = html.Tr([html.Th(c) for c in ['Symbol', 'Return', 'Rel. strength',
+                                           'Volatility', 'Max drawdown']])
+    body = [html.Tr([html.Td(row.Symbol),
+                     html.Td('{:+.2%}'.format(row.Return)),
+                     html.Td('{:+.2%}'.format(row.RelativeStrength)),
+                     html.Td('{:.1%}'.format(row.Volatility)),
+                     html.Td('{:.1%}'.format(row.MaxDrawdown))])
+            for row in ranking.itertuples()]
+    return html.Table([header] + body, className='movers_table')
+
+
+def make_base_layout():
+    '''
+    Static figure layout (styling, template and x-axis range) and trace styles
+    shared by the clientside figures
+    '''
+    layout = make_graph([], yaxis_limits=None, xaxis_limits=date_range).to_plotly_json()['layout']
+    return {'layout': layout, 'styles': trace_styles, 'live': live_mode}
+
+
+def make_panels(n_panels):
+    '''
+    Make the layout rows of n_panels stock panels, two panels per row
+
+    Each pair of panels gets a row of symbol dropdowns followed by a row of graphs.
+    The dropdowns start with the option of their default symbol only, the other
+    options come from the search (or the 'symbol-options' store).
+    '''
+
+    rows = []
+    for first in range(0, n_panels, 2):
+        panels = range(first, min(first + 2, n_panels))
+        rows.append(html.Div(
+            [
+                html.Div(
+                    [
+                        html.H6(
+                            id={'type': 'drop_text', 'index': i},
+                            className="info_text"
+                        ),
+                        dcc.Dropdown(
+                            id={'type': 'drop', 'index': i},
+                            options=symbol_index.options('', keep=default_symbols[i % len(default_symbols)]),
+                            value=default_symbols[i % len(default_symbols)],
+                        )
+                    ],
+                    className='pretty_container six columns',
+                )
+                for i in panels
+            ],
+            className='row'
+        ))
+        rows.append(html.Div(
+            [
+                html.Div(
+                    [
+                        dcc.Graph(id={'type': 'stock', 'index': i})
+                    ] + ([dcc.Store(id={'type': 'stock-data', 'index': i})]
+                         if render_mode == 'client' else []),
+                    className='pretty_container six columns',
+                )
+                for i in panels
+            ],
+            className='row'
+        ))
+    return rows
+
+
 # Create app layout
 app.layout= html.Div(
     [
         # dcc.Store(id='aggregate_data'),
+        dcc.Store(id='figure-layout', data=make_base_layout() if render_mode != 'server' else None),
+        dcc.Store(id='figure-payload'),
+        # all the dropdown options, sent once (symbol_search = False)
+        dcc.Store(id='symbol-options',
+                  data=None if symbol_search else [symbol_index.option(i) for i in range(len(symbol_index))]),
+        # last live tick sent to every panel (see update_live)
+        dcc.Store(id='live-state', data={}),
+        dcc.Interval(id='live-interval', interval=live_interval_ms, disabled=not live_mode),
+        # panels waiting for a download (async_loading, see split_pending)
+        dcc.Store(id='pending-panels', data=[]),
+        dcc.Interval(id='pending-interval', interval=pending_interval_ms, disabled=True),
 
         # Title
         html.Div(
@@ -159,6 +562,17 @@ app.layout= html.Div(
                             value='Close',
                             # labelStyle={'display': 'inline-block'},
                             className="dcc_control"
+                        ),
+                        html.H6(
+                            'Interval:',
+                            className="control_label"
+                        ),
+                        dcc.RadioItems(
+                            id='interval',
+                            options=[{'label': name, 'value': i} for i, name in intervals.items()],
+                            value=bar_interval,
+                            labelStyle={'display': 'inline-block'},
+                            className="dcc_control"
                         )
                     ],
                     className='pretty_container three columns'
@@ -188,7 +602,7 @@ app.layout= html.Div(
 
                 html.Div(
                     [
-                        html.H6('Moving average Length (in Days):',
+                        html.H6('Moving average Length (in Bars):',
                                 className="control_label"
                                 ),
                         html.Br(),
@@ -207,176 +621,68 @@ app.layout= html.Div(
             className='row'
         ),
 
-        # Graphs
-        html.Div(
-            [
-                html.Div(
-                    [
-                        html.H6(
-                            id="drop_text-1",
-                            className="info_text"
-                        ),
-                        dcc.Dropdown(
-                            id='drop-1',
-                            options=[{'label': s, 'value': s}
-                                     for s in df_symbols['Symbol']
-                                     ],
-                            #value=df_symbols['Symbol'][0],
-                            value=default_symbols[0],
-                        )
-                    ],
-                    className='pretty_container six columns',
-                ),
-                html.Div(
-                    [
-                        html.H6(
-                            id="drop_text-2",
-                            className="info_text"
-                        ),
-                        dcc.Dropdown(
-                            id='drop-2',
-                            options=[{'label': s, 'value': s}
-                                     for s in df_symbols['Symbol']
-                                     ],
-                            value=default_symbols[1],
+        # Graphs, two panels (dropdown + graph) per row
+    ] + make_panels(n_panels) + [
 
-                        )
-                    ],
-                    className='pretty_container six columns',
-                ),
-            ],
-            className='row'
-        ),
-        html.Div(
-            [
-                html.Div(
-                    [
-                        # dcc.Graph(id='main_graph')
-                        dcc.Graph(id='stock-1')
-                    ],
-                    className='pretty_container six columns',
-                ),
-                html.Div(
-                    [
-                        dcc.Graph(id='stock-2')
-                    ],
-                    className='pretty_container six columns',
-                ),
-            ],
-            className='row'
-        ),
+        # Top movers of the stored symbols (summary index, no stock data loaded)
         html.Div(
             [
                 html.Div(
                     [
                         html.H6(
-                            id="drop_text-3",
-                            className="info_text"
+                            'Top movers:',
+                            className="control_label"
                         ),
-                        dcc.Dropdown(
-                            id='drop-3',
-                            options=[{'label': s, 'value': s}
-                                     for s in df_symbols['Symbol']
-                                     ],
-                            value=default_symbols[2],
-
-                        )
-                    ],
-                    className='pretty_container six columns',
-                ),
-                html.Div(
-                    [
-                        html.H6(
-                            id="drop_text-4",
-                            className="info_text"
+                        dcc.RadioItems(
+                            id='movers-horizon',
+                            options=[{'label': h.upper(), 'value': h} for h in horizons],
+                            value='1d',
+                            labelStyle={'display': 'inline-block'},
+                            className="dcc_control"
                         ),
-                        dcc.Dropdown(
-                            id='drop-4',
-                            options=[{'label': s, 'value': s}
-                                     for s in df_symbols['Symbol']
-                                     ],
-                            value=default_symbols[3],
-
+                        html.Div(
+                            [
+                                html.Div(id='movers-gainers', className='six columns'),
+                                html.Div(id='movers-losers', className='six columns')
+                            ],
+                            className='row'
                         )
                     ],
-                    className='pretty_container six columns',
-                ),
-            ],
-            className='row'
-        ),
-        html.Div(
-            [
-                html.Div(
-                    [
-                        dcc.Graph(id='stock-3')
-                    ],
-                    className='pretty_container six columns',
-                ),
-                html.Div(
-                    [
-                        dcc.Graph(id='stock-4')
-                    ],
-                    className='pretty_container six columns',
-                ),
+                    className='pretty_container twelve columns'
+                )
             ],
             className='row'
         ),
+
+        # Correlation heatmap and relative strength ranking of the stored symbols
         html.Div(
             [
                 html.Div(
                     [
                         html.H6(
-                            id="drop_text-5",
-                            className="info_text"
+                            'Correlation and relative strength:',
+                            className="control_label"
                         ),
-                        dcc.Dropdown(
-                            id='drop-5',
-                            options=[{'label': s, 'value': s}
-                                     for s in df_symbols['Symbol']
-                                     ],
-                            value=default_symbols[4],
-
-                        )
-                    ],
-                    className='pretty_container six columns',
-                ),
-                html.Div(
-                    [
-                        html.H6(
-                            id="drop_text-6",
-                            className="info_text"
+                        dcc.RadioItems(
+                            id='analytics-horizon',
+                            options=[{'label': h.upper(), 'value': h} for h in analytics_horizons],
+                            value='3m',
+                            labelStyle={'display': 'inline-block'},
+                            className="dcc_control"
                         ),
-                        dcc.Dropdown(
-                            id='drop-6',
-                            options=[{'label': s, 'value': s}
-                                     for s in df_symbols['Symbol']
-                                     ],
-                            value=default_symbols[5],
-
+                        html.Div(
+                            [
+                                html.Div(dcc.Graph(id='corr-heatmap'), className='seven columns'),
+                                html.Div(id='rs-ranking', className='five columns')
+                            ],
+                            className='row'
                         )
                     ],
-                    className='pretty_container six columns',
-                ),
+                    className='pretty_container twelve columns'
+                )
             ],
             className='row'
         ),
-        html.Div(
-            [
-                html.Div(
-                    [
-                        dcc.Graph(id='stock-5')
-                    ],
-                    className='pretty_container six columns',
-                ),
-                html.Div(
-                    [
-                        dcc.Graph(id='stock-6')
-                    ],
-                    className='pretty_container six columns',
-                ),
-            ],
-            className='row'
-        )
     ],
     id="mainContainer",
     style={
@@ -388,111 +694,439 @@ app.layout= html.Div(
 ###################################################
 # callbacks
 ###################################################
-# call back, stock-1
-@ app.callback(
-    Output('stock-1', 'figure'),
-    [Input('drop-1', 'value'),
-     Input('stock-price', 'value'),
-     Input('chart-type', 'value'),
-     Input('days', 'value')
-     ]
-)
-def update_figure(symbol, graph_name, chart_name, days_num):
-    df = get_single_stock(symbol, period=period, datadir=datadir)
-
-    # make plot data
-    data = make_plot_data(df, graph_name=graph_name, chart_name=chart_name, days=days_num)
-    yaxis_limits = [ylims_perc[0]*df['Low'].min(), ylims_perc[1]*df['High']]
-    return make_graph(data, yaxis_limits=yaxis_limits, xaxis_limits=date_range)
-
-# call back, stock-2
-@ app.callback(
-    Output('stock-2', 'figure'),
-    [Input('drop-2', 'value'),
-     Input('stock-price', 'value'),
-     Input('chart-type', 'value'),
-     Input('days', 'value')
-     ]
-)
-def update_figure(symbol, graph_name, chart_name, days_num):
-    df=get_single_stock(symbol, period=period, datadir=datadir)
-    
-    # make plot data
-    data=make_plot_data(df, graph_name=graph_name, chart_name=chart_name, days=days_num)
-    yaxis_limits= [ylims_perc[0]*df['Low'].min(), ylims_perc[1]*df['High']]
-    return make_graph(data, yaxis_limits=yaxis_limits, xaxis_limits=date_range)
-
-
-# call back, stock-3
-@ app.callback(
-    Output('stock-3', 'figure'),
-    [Input('drop-3', 'value'),
-     Input('stock-price', 'value'),
-     Input('chart-type', 'value'),
-     Input('days', 'value')
-     ]
-)
-def update_figure(symbol, graph_name, chart_name, days_num):
-    df=get_single_stock(symbol, period=period, datadir=datadir)
-
-    # make plot data
-    data=make_plot_data(df, graph_name=graph_name, chart_name=chart_name, days=days_num)
-    yaxis_limits= [ylims_perc[0]*df['Low'].min(), ylims_perc[1]*df['High']]
-    return make_graph(data, yaxis_limits=yaxis_limits, xaxis_limits=date_range)
-
-
-# call back, stock-4
-@ app.callback(
-    Output('stock-4', 'figure'),
-    [Input('drop-4', 'value'),
-     Input('stock-price', 'value'),
-     Input('chart-type', 'value'),
-     Input('days', 'value')
-     ]
-)
-def update_figure(symbol, graph_name, chart_name, days_num):
-    df=get_single_stock(symbol, period=period, datadir=datadir)
-
-    # make plot data
-    data=make_plot_data(df, graph_name=graph_name, chart_name=chart_name, days=days_num)
-    yaxis_limits= [ylims_perc[0]*df['Low'].min(), ylims_perc[1]*df['High']]
-    return make_graph(data, yaxis_limits=yaxis_limits, xaxis_limits=date_range)
-
-
-# call back, stock-5
-@ app.callback(
-    Output('stock-5', 'figure'),
-    [Input('drop-5', 'value'),
-     Input('stock-price', 'value'),
-     Input('chart-type', 'value'),
-     Input('days', 'value')
-     ]
-)
-def update_figure(symbol, graph_name, chart_name, days_num):
-    df=get_single_stock(symbol, period=period, datadir=datadir)
-
-    # make plot data
-    data=make_plot_data(df, graph_name=graph_name, chart_name=chart_name, days=days_num)
-    yaxis_limits= [ylims_perc[0]*df['Low'].min(), ylims_perc[1]*df['High']]
-    return make_graph(data, yaxis_limits=yaxis_limits, xaxis_limits=date_range)
-
-
-# call back, stock-6
-@ app.callback(
-    Output('stock-6', 'figure'),
-    [Input('drop-6', 'value'),
-     Input('stock-price', 'value'),
-     Input('chart-type', 'value'),
-     Input('days', 'value')
-     ]
-)
-def update_figure(symbol, graph_name, chart_name, days_num):
-    df=get_single_stock(symbol, period=period, datadir=datadir)
+def changed_panels(ctx):
+    '''
+    Return the positions of the panels to re-render for the triggering inputs
+
+    A dropdown change or a zoom only re-renders its own panel, a change of the
+    shared controls (or the initial call) re-renders all the panels.
+
+    Output
+    ------
+    set of panel positions, set of the positions triggered by a zoom (relayoutData)
+    '''
+    indices = [item['id']['index'] for item in ctx.inputs_list[0]]
+    selected = set()
+    zoomed = set()
+    for trigger in ctx.triggered:
+        prop_id, prop = trigger['prop_id'].rsplit('.', 1)
+        if not prop_id.startswith('{'):
+            return set(range(len(indices))), set()
+        i = indices.index(json.loads(prop_id)['index'])
+        if prop == 'relayoutData':
+            zoomed.add(i)
+        else:
+            selected.add(i)
+    return selected | zoomed, zoomed - selected
+
+
+def figure_key(df, symbol, graph_name, chart_name, days_num, xrange=None, interval='D'):
+    '''
+    Normalized figure cache key of the callback inputs and the data version
+    '''
+    chart_name = tuple(chart_name or [])
+    # the moving average length only matters when it is drawn
+    days_num = days_num if 'SimpleMovingAverage' in chart_name else None
+    return (symbol, period, interval, df.attrs.get('version'), graph_name, chart_name, days_num,
+            tuple(date_range), tuple(xrange or ()), max_points, max_candles, live_mode)
+
+
+def default_view_rows(df):
+    '''
+    Number of bars of df inside the default x range of the graphs (date_range)
+    '''
+    rows = visible_rows(df['Date'].values, date_range)
+    return len(range(*rows.indices(len(df))))
+
+
+def is_full_view(nrows, xrange=None):
+    '''
+    Whether the figure of the default view draws all the bars of xrange (None : default view)
+
+    The nrows bars inside date_range (see default_view_rows) are drawn at full resolution
+    when there are at most max_candles of them, a zoom inside date_range is then handled
+    by the browser.
+    '''
+    if nrows > max_candles:
+        return False
+    if not xrange:
+        return True
+    return (pd.Timestamp(xrange[0]) >= pd.Timestamp(date_range[0])
+            and pd.Timestamp(xrange[1]) <= pd.Timestamp(date_range[1]))
+
+
+def make_stock_figure(symbol, graph_name, chart_name, days_num, xrange=None, zoom_only=False,
+                      interval='D'):
+    # empty graph for a cleared dropdown
+    if not symbol:
+        return make_graph([], xaxis_limits=date_range)
+
+    df = load_stock(symbol, interval)
+    nrows = _view_rows[(symbol, interval)] = default_view_rows(df)
+
+    # all the bars are already drawn if the default view is not downsampled
+    if is_full_view(nrows, xrange):
+        if zoom_only:
+            return dash.no_update
+        xrange = None
+
+    # a cache hit skips building and validating the plotly figure
+    key = figure_key(df, symbol, graph_name, chart_name, days_num, xrange, interval)
+    with span('cache'):
+        cached = figure_cache.get(key)
+        if cached is not None:
+            # the memory cache keeps the figure itself, the disk cache its json
+            return json.loads(cached) if figure_cache.serialized else cached
+
+    with span('figure'):
+        yaxis_limits = stock_yaxis_limits(df)
+        if fast_figures:
+            traces = plot_arrays(df, graph_name, chart_name, days_num, xrange or date_range,
+                                 max_points, max_candles)
+            fig = make_fast_figure(traces, yaxis_limits=yaxis_limits, xaxis_limits=xrange or date_range)
+        else:
+            # make plot data
+            data = make_plot_data(df, graph_name=graph_name, chart_name=chart_name, days=days_num,
+                                  xrange=xrange or date_range, max_points=max_points,
+                                  max_candles=max_candles)
+            fig = make_graph(data, yaxis_limits=yaxis_limits, xaxis_limits=xrange or date_range)
+
+    # Dash encodes every callback output itself (no pass-through of json text), the memory
+    # cache keeps the figure and a hit only pays that encoding
+    if figure_cache.serialized:
+        with span('serialize'):
+            figure_cache.put(key, json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder) if fast_figures
+                             else fig.to_json())
+    else:
+        figure_cache.put(key, fig, figure_nbytes(fig))
+    return fig
+
+
+def is_xaxis_relayout(relayout):
+    # zoom, pan or reset of the x axis (not autosize or y-axis only events)
+    return bool(relayout) and any(k.startswith('xaxis.range') or k == 'xaxis.autorange'
+                                  for k in relayout)
+
+
+def panels_to_render(symbols, relayouts):
+    '''
+    Return the (position, symbol, xrange, zoom_only) of the panels to re-render
+    '''
+    changed, zoomed = changed_panels(dash.callback_context)
+    for i, symbol in enumerate(symbols):
+        if i not in changed or (i in zoomed and not is_xaxis_relayout(relayouts[i])):
+            continue
+        yield i, symbol, relayout_xrange(relayouts[i]), i in zoomed
+
+
+def update_figures(symbols, relayouts, graph_name, chart_name, days_num, interval='D', panels=None):
+    # panels showing the same symbol (and range) share one figure
+    figures = {}
+    outputs = [dash.no_update] * len(symbols)
+    if panels is None:
+        panels = panels_to_render(symbols, relayouts)
+    for i, symbol, xrange, zoom_only in panels:
+        key = (symbol, tuple(xrange or ()), zoom_only)
+        if key not in figures:
+            figures[key] = make_stock_figure(symbol, graph_name, chart_name, days_num, xrange,
+                                             zoom_only=zoom_only, interval=interval)
+        outputs[i] = figures[key]
+    return outputs
+
+
+def add_compact_panel(builder, position, symbol, graph_name, chart_name, days_num,
+                      xrange=None, zoom_only=False, interval='D'):
+    # empty graph for a cleared dropdown
+    if not symbol:
+        builder.add_panel(position, [], xrange=date_range)
+        return
+
+    df = load_stock(symbol, interval)
+    nrows = _view_rows[(symbol, interval)] = default_view_rows(df)
+
+    # see make_stock_figure
+    if is_full_view(nrows, xrange):
+        if zoom_only:
+            return
+        xrange = None
+
+    with span('figure'):
+        traces = plot_arrays(df, graph_name, chart_name or [], days_num,
+                             xrange or date_range, max_points, max_candles)
+        yaxis_limits = stock_yaxis_limits(df)
+    with span('serialize'):
+        builder.add_panel(position, traces, xrange=xrange or date_range, yrange=yaxis_limits)
+
+
+def update_payload(symbols, relayouts, graph_name, chart_name, days_num, interval='D', panels=None,
+                   placeholders=()):
+    builder = PayloadBuilder(len(symbols))
+    if panels is None:
+        panels = panels_to_render(symbols, relayouts)
+    for i, symbol, xrange, zoom_only in panels:
+        add_compact_panel(builder, i, symbol, graph_name, chart_name, days_num, xrange,
+                          zoom_only=zoom_only, interval=interval)
+    # panels waiting for their data
+    for i in placeholders:
+        builder.add_panel(i, [], xrange=date_range)
+    if not builder.panels:
+        raise PreventUpdate
+    with span('serialize'):
+        return builder.build()
+
+
+def split_pending(symbols, relayouts, pending):
+    '''
+    Split the panels to render into the ones whose data is available and the ones
+    waiting for a download (async_loading)
+
+    The stored data of a stale symbol is rendered right away and again once its
+    refresh landed, a placeholder is only shown when nothing is stored. A tick of
+    the pending interval only renders the pending panels whose data landed.
+
+    Output
+    ------
+    ready panels (see panels_to_render), {position: status} of the new placeholders,
+    sorted positions of the pending panels
+    '''
+    triggers = [t['prop_id'] for t in dash.callback_context.triggered]
+    pending = set(pending or [])
+    tick = triggers == ['pending-interval.n_intervals']
+    if tick:
+        panels = [(i, symbols[i], relayout_xrange(relayouts[i]), False)
+                  for i in sorted(pending) if i < len(symbols)]
+    else:
+        panels = list(panels_to_render(symbols, relayouts))
+
+    ready, placeholders = [], {}
+    for panel in panels:
+        i, symbol = panel[0], panel[1]
+        status = data_layer.request(symbol) if symbol else 'ready'
+        if status == 'ready' or (status == 'stale' and not tick):
+            # a stale panel is drawn once before its refresh lands
+            ready.append(panel)
+        elif status == 'failed' or (status == 'loading' and i not in pending):
+            placeholders[i] = status
+        if status in ('loading', 'stale'):
+            pending.add(i)
+        else:
+            pending.discard(i)
+    return ready, placeholders, sorted(pending)
+
+
+def update_figures_async(symbols, relayouts, graph_name, chart_name, days_num, interval, n_intervals,
+                         pending):
+    ready, placeholders, new_pending = split_pending(symbols, relayouts, pending)
+    if not ready and not placeholders and new_pending == sorted(pending or []):
+        raise PreventUpdate
+    outputs = update_figures(symbols, relayouts, graph_name, chart_name, days_num, interval, panels=ready)
+    for i, status in placeholders.items():
+        outputs[i] = make_placeholder_figure(symbols[i], status)
+    return outputs, new_pending, not new_pending
+
+
+def update_payload_async(symbols, relayouts, graph_name, chart_name, days_num, interval, n_intervals,
+                         pending):
+    ready, placeholders, new_pending = split_pending(symbols, relayouts, pending)
+    if not ready and not placeholders and new_pending == sorted(pending or []):
+        raise PreventUpdate
+    try:
+        payload = update_payload(symbols, relayouts, graph_name, chart_name, days_num, interval,
+                                 panels=ready, placeholders=sorted(placeholders))
+    except PreventUpdate:
+        payload = dash.no_update
+    return payload, new_pending, not new_pending
+
+
+def update_movers(horizon):
+    # restricted to the symbols of the dropdowns
+    gainers, losers = summary_index.top_movers(horizon, n=n_movers, symbols=list(ticker_symbols), suffix='')
+    return make_movers_table(gainers, horizon), make_movers_table(losers, horizon)
+
+
+def update_analytics(horizon):
+    days = horizons[horizon]
+    universe = universe_cache.get(symbols=list(ticker_symbols)).lookback(days + 1)
+    ranking = universe.ranking(window=days)
+    # heatmap in the ranking order
+    order = [universe.symbols.index(s) for s in ranking['Symbol']]
+    corr = universe.correlation()[order][:, order]
+    ranking['Symbol'] = ranking['Symbol'].map(ticker_symbols)
+    return (make_corr_heatmap(list(ranking['Symbol']), corr),
+            make_ranking_table(ranking.head(n_movers)))
+
+
+def live_key(symbol, graph_name, chart_name, days_num, relayout, nrows=None, interval='D'):
+    # the inputs that rebuild the figure of a panel (and drop its live ticks),
+    # a zoom only rebuilds the server figures of downsampled data (see make_stock_figure)
+    xrange = None
+    if render_mode != 'client' and is_xaxis_relayout(relayout):
+        xrange = relayout_xrange(relayout)
+        if nrows is not None and is_full_view(nrows, xrange):
+            xrange = None
+    return json.dumps([symbol, graph_name, list(chart_name or []), days_num, interval, xrange], default=str)
+
+
+def update_live(n_intervals, symbols, graph_name, chart_name, days_num, interval, relayouts, state):
+    '''
+    Append the new live ticks of every panel to its 'Live' trace
+
+    Only the ticks after the last one sent to a panel are returned. A panel whose
+    figure was rebuilt since the last tick (different symbol, controls or zoom)
+    gets all the buffered ticks again.
+    '''
+    state = dict(state or {})
+    outputs = []
+    # the live trace comes after the chart traces
+    trace_index = len([c for c in (chart_name or []) if c in trace_styles])
+    for i, symbol in enumerate(symbols):
+        if not symbol:
+            outputs.append(dash.no_update)
+            continue
+        row = summary_index.get(symbol_registry.ticker(symbol))
+        # bars of the default view of the last figure build, no data access per tick
+        nrows = _view_rows.get((symbol, interval))
+        key = live_key(symbol, graph_name, chart_name, days_num, relayouts[i], nrows=nrows,
+                       interval=interval)
+        panel = state.get(str(i))
+        if panel is None or panel['key'] != key:
+            live_feed.subscribe(symbol, start_price=None if row is None else row['last_close'])
+            panel = {'key': key, 'seq': 0}
+        times, prices, _, seq = live_feed.since(symbol, panel['seq'])
+        state[str(i)] = {'key': key, 'seq': seq}
+        if not len(times):
+            outputs.append(dash.no_update)
+            continue
+        x = np.datetime_as_string(times, unit='ms').tolist()
+        outputs.append([dict(x=[x], y=[prices.tolist()]), [trace_index], live_capacity])
+    return outputs, state
+
+
+def search_symbols(search_value, value):
+    # keep the options while nothing is typed
+    if not search_value:
+        raise PreventUpdate
+    return symbol_index.options(search_value, k=search_top_k, keep=value)
+
+
+def update_panel_data(symbol, interval='D'):
+    if not symbol:
+        return None
+    df = load_stock(symbol, interval)
+    with span('serialize'):
+        return make_panel_data(df)
+
+
+if symbol_search:
+    # call back, best matches of the text typed in a dropdown
+    app.callback(
+        Output({'type': 'drop', 'index': MATCH}, 'options'),
+        [Input({'type': 'drop', 'index': MATCH}, 'search_value')],
+        [State({'type': 'drop', 'index': MATCH}, 'value')]
+    )(timed(search_symbols))
+else:
+    # clientside call back, copy the symbol list to all the dropdowns
+    app.clientside_callback(
+        ClientsideFunction(namespace='stocks', function_name='copy_options'),
+        Output({'type': 'drop', 'index': ALL}, 'options'),
+        [Input('symbol-options', 'data')],
+        [State({'type': 'drop', 'index': ALL}, 'id')]
+    )
+
+# call back, rank the stored symbols by their return over the selected horizon
+app.callback(
+    [Output('movers-gainers', 'children'),
+     Output('movers-losers', 'children')],
+    [Input('movers-horizon', 'value')]
+)(timed(update_movers))
+
+# call back, correlation heatmap and relative strength ranking over the selected lookback
+app.callback(
+    [Output('corr-heatmap', 'figure'),
+     Output('rs-ranking', 'children')],
+    [Input('analytics-horizon', 'value')]
+)(timed(update_analytics))
+
+# inputs of the callbacks rendering the panels on the server
+panel_inputs = [Input({'type': 'drop', 'index': ALL}, 'value'),
+                Input({'type': 'stock', 'index': ALL}, 'relayoutData'),
+                Input('stock-price', 'value'),
+                Input('chart-type', 'value'),
+                Input('days', 'value'),
+                Input('interval', 'value')]
+
+if render_mode == 'client':
+    # call back, send the panel data once per symbol or interval change
+    app.callback(
+        Output({'type': 'stock-data', 'index': MATCH}, 'data'),
+        [Input({'type': 'drop', 'index': MATCH}, 'value'),
+         Input('interval', 'value')]
+    )(timed(update_panel_data))
+
+    # clientside call back, redraw a panel for the display controls
+    app.clientside_callback(
+        ClientsideFunction(namespace='stocks', function_name='render_figure'),
+        Output({'type': 'stock', 'index': MATCH}, 'figure'),
+        [Input({'type': 'stock-data', 'index': MATCH}, 'data'),
+         Input('stock-price', 'value'),
+         Input('chart-type', 'value'),
+         Input('days', 'value')],
+        [State('figure-layout', 'data')]
+    )
+elif render_mode == 'compact':
+    if async_loading:
+        # call back, compact data of the changed panels, placeholders for the missing data
+        app.callback(
+            [Output('figure-payload', 'data'),
+             Output('pending-panels', 'data'),
+             Output('pending-interval', 'disabled')],
+            panel_inputs + [Input('pending-interval', 'n_intervals')],
+            [State('pending-panels', 'data')]
+        )(timed(update_payload_async))
+    else:
+        # call back, compact data of all the changed panels in a single request
+        app.callback(
+            Output('figure-payload', 'data'),
+            panel_inputs
+        )(timed(update_payload))
+
+    # clientside call back, decode the payload into the figures
+    app.clientside_callback(
+        ClientsideFunction(namespace='stocks', function_name='render_payload'),
+        Output({'type': 'stock', 'index': ALL}, 'figure'),
+        [Input('figure-payload', 'data')],
+        [State('figure-layout', 'data')]
+    )
+elif async_loading:
+    # call back, the stock panels with data, placeholders for the missing data
+    app.callback(
+        [Output({'type': 'stock', 'index': ALL}, 'figure'),
+         Output('pending-panels', 'data'),
+         Output('pending-interval', 'disabled')],
+        panel_inputs + [Input('pending-interval', 'n_intervals')],
+        [State('pending-panels', 'data')]
+    )(timed(update_figures_async))
+else:
+    # call back, all the stock panels in a single request
+    app.callback(
+        Output({'type': 'stock', 'index': ALL}, 'figure'),
+        panel_inputs
+    )(timed(update_figures))
 
-    # make plot data
-    data=make_plot_data(df, graph_name=graph_name, chart_name=chart_name, days=days_num)
-    yaxis_limits= [ylims_perc[0]*df['Low'].min(), ylims_perc[1]*df['High']]
-    return make_graph(data, yaxis_limits=yaxis_limits, xaxis_limits=date_range)
+if live_mode:
+    # call back, new live ticks of all the panels
+    app.callback(
+        [Output({'type': 'stock', 'index': ALL}, 'extendData'),
+         Output('live-state', 'data')],
+        [Input('live-interval', 'n_intervals')],
+        [State({'type': 'drop', 'index': ALL}, 'value'),
+         State('stock-price', 'value'),
+         State('chart-type', 'value'),
+         State('days', 'value'),
+         State('interval', 'value'),
+         State({'type': 'stock', 'index': ALL}, 'relayoutData'),
+         State('live-state', 'data')]
+    )(timed(update_live))
 
 
 # Main
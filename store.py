@@ -0,0 +1,490 @@
+# Storage backends for the per-symbol stock OHLC data
+# Two interchangeable backends are available:
+#   - CsvStore      : one text csv per symbol (e.g. ./data/RELIANCE.NS), the original format
+#   - ColumnarStore : one binary columnar file per symbol (e.g. ./data/RELIANCE.NS.col)
+# Both expose the same methods (save, load, load_column, exists, mtime, remove, symbols)
+# so the rest of the code does not care how the data is kept on disk.
+# Every write also updates the weekly, monthly and quarterly bars of the symbol
+# (LevelStore, <symbol>.W.col, <symbol>.M.col, <symbol>.Q.col, see resample.py).
+
+import os, sys
+import json
+import mmap
+import logging
+import threading
+import argparse
+import numpy as np
+import pandas as pd
+import resample
+from summary import get_summary_index
+
+logger = logging.getLogger(__name__)
+
+# column dtypes of the cached stock data
+ohlc_dtypes = {'Open': 'float64', 'High': 'float64', 'Low': 'float64',
+               'Close': 'float64', 'Volume': 'int64',
+               'Dividends': 'float64', 'Stock Splits': 'float64'}
+
+
+def normalize_stock_frame(df):
+    '''
+    Normalize a stock OHLC dataframe to a 'Date' column and float/int OHLC columns
+
+    Input parameters
+    ----------------
+    df : dataframe with 'Date' column (or date index) and OHLC columns
+
+    Output
+    ------
+    dataframe with datetime 'Date' and float/int OHLC columns
+    '''
+    if 'Date' not in df.columns and isinstance(df.index, pd.DatetimeIndex):
+        df = df.rename_axis('Date').reset_index()
+    dtypes = {c: t for c, t in ohlc_dtypes.items() if c in df.columns}
+    # astype returns a new frame, the dataframe of the caller is left unchanged
+    out = df.astype(dtypes)
+    if 'Date' in out.columns:
+        dates = pd.to_datetime(out['Date'])
+        # keep naive datetimes, plotly and the csv files have no timezone
+        if dates.dt.tz is not None:
+            dates = dates.dt.tz_localize(None)
+        # same resolution as the stored frames (pandas >= 2 may infer us/s)
+        out['Date'] = dates.astype('datetime64[ns]')
+    return out
+
+
+class CsvStore:
+    '''
+    Text csv store, one file per symbol: <datadir>/<symbol>
+
+    Input parameters
+    ----------------
+    datadir : directory to save the stock data (default : './data/')
+    '''
+    ext = ''
+    # keep the summary row of every saved symbol up to date (see summary.py)
+    summarized = True
+    # keep the weekly / monthly / quarterly bars of every saved symbol up to date
+    aggregated = True
+
+    def __init__(self, datadir='./data/'):
+        self.datadir = os.path.abspath(os.path.expanduser(datadir))
+
+    def path(self, symbol):
+        return os.path.join(self.datadir, symbol + self.ext)
+
+    def exists(self, symbol):
+        return os.path.isfile(self.path(symbol))
+
+    def mtime(self, symbol):
+        '''
+        Return the modification time (ns) of the symbol file or None if it does not exist
+        '''
+        try:
+            return os.stat(self.path(symbol)).st_mtime_ns
+        except OSError:
+            return None
+
+    def save(self, symbol, df):
+        '''
+        Write the stock dataframe (date index or 'Date' column) for symbol
+
+        The data is written to a temporary file first and renamed over the old
+        file, so readers never see a partially written file. The summary row of
+        the symbol (see summary.py) is updated afterwards.
+        '''
+        outname = self.path(symbol)
+        logger.debug('Write %s', outname)
+        df = normalize_stock_frame(df)
+        self._replace(outname, lambda tmpname: self._write(tmpname, df))
+        if self.summarized:
+            get_summary_index(self.datadir).update(symbol, df, version=self.mtime(symbol))
+        if self.aggregated:
+            for level in resample.levels:
+                get_level_store(self.datadir, level).update(symbol, df)
+
+    def _replace(self, outname, write):
+        # write(tmpname) a temporary file and rename it over outname
+        tmpname = '{}.{}.{}.tmp'.format(outname, os.getpid(), threading.get_ident())
+        try:
+            write(tmpname)
+            os.replace(tmpname, outname)
+        finally:
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+
+    def _write(self, outname, df):
+        if 'Date' in df.columns:
+            df = df.set_index('Date')
+        df.to_csv(outname)
+
+    def append(self, symbol, df):
+        '''
+        Append new bars to the stored data of symbol (atomic rewrite)
+
+        Bars with a date already in the store replace the stored ones.
+
+        Input parameters
+        ----------------
+        symbol : str, stock symbol with extension (e.g. 'RELIANCE.NS')
+        df     : dataframe with the new bars (date index or 'Date' column)
+
+        Output
+        ------
+        merged dataframe
+        '''
+        df = normalize_stock_frame(df)
+        if self.exists(symbol):
+            old = self.load(symbol)
+            df = pd.concat([old[~old['Date'].isin(df['Date'])], df], ignore_index=True)
+            df = df.sort_values('Date', ignore_index=True)
+        self.save(symbol, df)
+        return df
+
+    def last_date(self, symbol):
+        '''
+        Return the date of the last stored bar of symbol or None
+        '''
+        if not self.exists(symbol):
+            return None
+        dates = self.load_column(symbol, 'Date')
+        return pd.Timestamp(dates[-1]) if len(dates) else None
+
+    def touch(self, symbol):
+        '''
+        Mark the stored data of symbol as refreshed (update its modification time)
+        '''
+        os.utime(self.path(symbol))
+        if self.summarized:
+            get_summary_index(self.datadir).touch(symbol, self.mtime(symbol))
+        if self.aggregated:
+            # the levels stay newer than the daily file (see LevelStore.current)
+            for level in resample.levels:
+                levels = get_level_store(self.datadir, level)
+                if levels.exists(symbol):
+                    levels.touch(symbol)
+
+    def load(self, symbol, columns=None):
+        '''
+        Read the stock data for symbol
+
+        Input parameters
+        ----------------
+        symbol  : str, stock symbol with extension (e.g. 'RELIANCE.NS')
+        columns : list, columns to read besides 'Date' (default : None, all columns)
+
+        Output
+        ------
+        normalized dataframe with 'Date' column
+        '''
+        usecols = None if columns is None else ['Date'] + list(columns)
+        df = pd.read_csv(self.path(symbol), usecols=usecols)
+        return normalize_stock_frame(df)
+
+    def load_column(self, symbol, column='Close'):
+        '''
+        Read a single column of the stock data as numpy array
+        '''
+        if column == 'Date':
+            return self.load(symbol, columns=[])['Date'].values
+        return self.load(symbol, columns=[column])[column].values
+
+    def remove(self, symbol):
+        os.remove(self.path(symbol))
+        if self.summarized:
+            get_summary_index(self.datadir).remove(symbol)
+        if self.aggregated:
+            for level in resample.levels:
+                levels = get_level_store(self.datadir, level)
+                if levels.exists(symbol):
+                    levels.remove(symbol)
+
+    def symbols(self, suffix='.NS'):
+        '''
+        Return all the symbols (ending with suffix) saved in the store
+        '''
+        tail = suffix + self.ext
+        return sorted(f[:len(f) - len(self.ext)] if self.ext else f
+                      for f in os.listdir(self.datadir) if f.endswith(tail))
+
+
+class ColumnarStore(CsvStore):
+    '''
+    Binary columnar store, one file per symbol: <datadir>/<symbol>.col
+
+    File layout
+    -----------
+    magic        : 8 bytes, b'OHLCCOL1'
+    header size  : uint32 (little endian)
+    header       : json, {'nrows': n, 'columns': [{'name', 'dtype', 'offset'}, ...]}
+    column data  : raw little-endian arrays, each aligned to 64 bytes
+
+    The 'Date' column is kept as datetime64[ns]. Single columns are loaded as
+    read-only, zero-copy views on a memory map of the file.
+
+    Input parameters
+    ----------------
+    datadir     : directory to save the stock data (default : './data/')
+    float_dtype : str, dtype of the price columns, 'float64' or 'float32' (default : 'float64')
+    '''
+    ext = '.col'
+    magic = b'OHLCCOL1'
+    align = 64
+
+    def __init__(self, datadir='./data/', float_dtype='float64'):
+        super().__init__(datadir)
+        self.float_dtype = np.dtype(float_dtype)
+
+    def _column_arrays(self, df):
+        df = normalize_stock_frame(df)
+        arrays = [('Date', df['Date'].values.astype('datetime64[ns]'))]
+        for c in df.columns:
+            if c == 'Date':
+                continue
+            if ohlc_dtypes.get(c) == 'int64':
+                values = df[c].values.astype('<i8')
+            else:
+                values = df[c].values.astype(self.float_dtype.newbyteorder('<'))
+            arrays.append((c, values))
+        return arrays
+
+    def _write(self, outname, df):
+        self._write_arrays(outname, self._column_arrays(df))
+
+    def _write_arrays(self, outname, arrays, meta=None):
+        # arrays : list of (column name, little-endian numpy array), meta : extra header fields
+        # the header size depends on the offsets, grow it until it is stable
+        columns = []
+        header = b''
+        while True:
+            offset = self._aligned(len(self.magic) + 4 + len(header))
+            columns = []
+            for name, values in arrays:
+                columns.append(dict(name=name, dtype=values.dtype.str, offset=offset))
+                offset = self._aligned(offset + values.nbytes)
+            new_header = json.dumps(dict(meta or {}, nrows=len(arrays[0][1]), columns=columns)).encode()
+            if len(new_header) == len(header):
+                break
+            header = new_header
+
+        with open(outname, 'wb') as f:
+            f.write(self.magic)
+            f.write(np.uint32(len(header)).astype('<u4').tobytes())
+            f.write(header)
+            for col, (_, values) in zip(columns, arrays):
+                f.write(b'\0' * (col['offset'] - f.tell()))
+                f.write(values.tobytes())
+
+    def _aligned(self, offset):
+        return -(-offset // self.align) * self.align
+
+    def _read_header(self, f):
+        if f.read(len(self.magic)) != self.magic:
+            raise ValueError('{} is not a columnar stock file'.format(f.name))
+        size = int(np.frombuffer(f.read(4), dtype='<u4')[0])
+        return json.loads(f.read(size).decode())
+
+    def load_columns(self, symbol, columns=None):
+        '''
+        Map the columns of the stock data as read-only numpy arrays
+
+        Input parameters
+        ----------------
+        symbol  : str, stock symbol with extension (e.g. 'RELIANCE.NS')
+        columns : list, column names (default : None, all columns)
+
+        Output
+        ------
+        dict of column name -> zero-copy numpy array backed by the file memory map
+        '''
+        return self.map_columns(symbol, columns)[1]
+
+    def map_columns(self, symbol, columns=None):
+        '''
+        Same as load_columns, also return the file header (dict)
+        '''
+        with open(self.path(symbol), 'rb') as f:
+            header = self._read_header(f)
+            nrows = header['nrows']
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if nrows else b''
+        arrays = {}
+        for col in header['columns']:
+            if columns is None or col['name'] in columns:
+                arrays[col['name']] = np.frombuffer(buf, dtype=col['dtype'],
+                                                    count=nrows, offset=col['offset'] if nrows else 0)
+        return header, arrays
+
+    def load(self, symbol, columns=None):
+        '''
+        Read the stock data for symbol
+
+        Input parameters
+        ----------------
+        symbol  : str, stock symbol with extension (e.g. 'RELIANCE.NS')
+        columns : list, columns to read besides 'Date' (default : None, all columns)
+
+        Output
+        ------
+        dataframe with 'Date' column
+        '''
+        names = None if columns is None else ['Date'] + list(columns)
+        arrays = self.load_columns(symbol, names)
+        return pd.DataFrame(arrays)
+
+    def load_column(self, symbol, column='Close'):
+        '''
+        Map a single column of the stock data as read-only, zero-copy numpy array
+        '''
+        return self.load_columns(symbol, [column])[column]
+
+
+class IndicatorStore(ColumnarStore):
+    '''
+    Precomputed indicators, one columnar file per symbol: <datadir>/<symbol>.ind
+
+    Same layout as ColumnarStore ('Date' and one float column per indicator).
+    '''
+    ext = '.ind'
+    summarized = False
+    aggregated = False
+
+
+class LevelStore(ColumnarStore):
+    '''
+    Aggregated bars of one level of the pyramid (see resample.py), one columnar file
+    per symbol: <datadir>/<symbol>.<level>.col (e.g. RELIANCE.NS.W.col)
+
+    The header keeps the number, first and last date and last close of the daily
+    bars the file was built from. If the new daily bars start with the same ones
+    (new bars appended) only the last periods are aggregated again, otherwise
+    (e.g. dividend adjustment) the whole history.
+
+    Input parameters
+    ----------------
+    datadir : directory of the stock data (default : './data/')
+    level   : str, 'W', 'M' or 'Q' (default : 'W')
+    '''
+    summarized = False
+    aggregated = False
+
+    def __init__(self, datadir='./data/', level='W'):
+        super().__init__(datadir)
+        self.level = level
+        self.ext = '.{}{}'.format(level, ColumnarStore.ext)
+
+    def update(self, symbol, df):
+        '''
+        Aggregate the daily bars of symbol (normalized dataframe) and write them
+        '''
+        arrays = {c: df[c].values for c in ['Date'] + [c for c, _ in resample.aggregations]
+                  if c in df.columns}
+        dates = arrays['Date'].astype('datetime64[ns]').view('int64')
+        close = np.asarray(arrays['Close'], dtype='float64')
+        bars = None
+        try:
+            header, stored = self.map_columns(symbol)
+            source = header.get('source') or {}
+            n = source.get('nrows', 0)
+            if 0 < n <= len(dates) and dates[0] == source['first'] and dates[n - 1] == source['last'] \
+                    and close[n - 1] == source['close']:
+                bars = stored
+        except (OSError, ValueError):
+            pass
+        bars = resample.update(bars, arrays, self.level)
+
+        columns = [('Date', bars['Date'].astype('datetime64[ns]'))]
+        for c, values in bars.items():
+            if c != 'Date':
+                columns.append((c, values.astype('<i8' if ohlc_dtypes.get(c) == 'int64' else '<f8')))
+        source = {'nrows': len(dates)}
+        if len(dates):
+            source.update(first=int(dates[0]), last=int(dates[-1]), close=float(close[-1]))
+        self._replace(self.path(symbol), lambda tmpname: self._write_arrays(tmpname, columns, {'source': source}))
+
+    def current(self, store, symbol):
+        '''
+        Return True if the bars of symbol were written after the data of store changed
+        '''
+        mtime = self.mtime(symbol)
+        return mtime is not None and mtime >= (store.mtime(symbol) or 0)
+
+
+# available storage backends
+store_formats = {'csv': CsvStore, 'columnar': ColumnarStore}
+# backend used by get_store when no format is given
+default_store_format = 'columnar'
+
+_stores = {}
+
+
+def get_store(datadir='./data/', fmt=None):
+    '''
+    Return the (shared) store instance for a data directory
+
+    Input parameters
+    ----------------
+    datadir : directory to save the stock data (default : './data/')
+    fmt     : str, 'csv' or 'columnar' (default : None, default_store_format)
+
+    Output
+    ------
+    store object
+    '''
+    fmt = fmt or default_store_format
+    key = (fmt, os.path.abspath(os.path.expanduser(datadir)))
+    if key not in _stores:
+        _stores[key] = store_formats[fmt](datadir)
+    return _stores[key]
+
+
+def get_level_store(datadir='./data/', level='W'):
+    '''
+    Return the (shared) LevelStore instance of a data directory and level ('W', 'M', 'Q')
+    '''
+    key = (level, os.path.abspath(os.path.expanduser(datadir)))
+    if key not in _stores:
+        _stores[key] = LevelStore(datadir, level=level)
+    return _stores[key]
+
+
+def migrate_csv_cache(datadir='./data/', suffix='.NS', float_dtype='float64', remove=False):
+    '''
+    Convert all the cached csv stock files in datadir to the columnar format
+
+    Input parameters
+    ----------------
+    datadir     : directory containing the csv stock data (default : './data/')
+    suffix      : str, extension of the stock files to convert (default : '.NS')
+    float_dtype : str, dtype of the price columns (default : 'float64')
+    remove      : bool, delete the csv files after conversion (default : False)
+
+    Output
+    ------
+    list of converted symbols
+    '''
+    src = CsvStore(datadir)
+    dst = ColumnarStore(datadir, float_dtype=float_dtype)
+    converted = []
+    for symbol in src.symbols(suffix=suffix):
+        dst.save(symbol, src.load(symbol))
+        if remove:
+            # not src.remove, the summary row now belongs to the columnar file
+            os.remove(src.path(symbol))
+        converted.append(symbol)
+    print('Converted {} symbols in {}'.format(len(converted), datadir))
+    return converted
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert cached csv stock files to the columnar format')
+    parser.add_argument('datadir', nargs='?', default='./data/')
+    parser.add_argument('--suffix', default='.NS')
+    parser.add_argument('--float32', action='store_true', help='store the prices as float32')
+    parser.add_argument('--remove', action='store_true', help='delete the csv files after conversion')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.datadir):
+        sys.exit('Directory {} does not exist!'.format(args.datadir))
+    migrate_csv_cache(args.datadir, suffix=args.suffix,
+                      float_dtype='float32' if args.float32 else 'float64',
+                      remove=args.remove)
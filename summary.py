@@ -0,0 +1,330 @@
+# Per-symbol summary index of the stored stock data
+# One row per symbol (date span, low/high, last close, returns over the standard
+# horizons, average volume) kept in a single compact binary file next to the data,
+# <datadir>/summary.npy (numpy structured array). The stores update the row of a
+# symbol on every write (see store.py), so the axis limits and the universe screens
+# never need to load the stock data.
+#
+# usage: python summary.py [datadir]   (rebuild the index from the stored files)
+
+import os, sys
+import logging
+import argparse
+import threading
+import contextlib
+import numpy as np
+from locks import FileLock, lock_path
+
+logger = logging.getLogger(__name__)
+
+# return horizons in trading days
+horizons = {'1d': 1, '1w': 5, '1m': 21, '3m': 63, '6m': 126, '1y': 252}
+# number of last bars of the average volume
+volume_window = 20
+
+summary_dtype = np.dtype([('symbol', 'U32'),
+                          ('version', '<i8'),
+                          ('first_date', '<M8[D]'),
+                          ('last_date', '<M8[D]'),
+                          ('nrows', '<i8'),
+                          ('low', '<f8'),
+                          ('high', '<f8'),
+                          ('last_close', '<f8')]
+                         + [('ret_' + h, '<f8') for h in horizons]
+                         + [('avg_volume', '<f8')])
+
+
+def summarize(df):
+    '''
+    Compute the summary row of a normalized stock dataframe
+
+    Input parameters
+    ----------------
+    df : dataframe with 'Date' and OHLC (Volume) columns
+
+    Output
+    ------
+    dict of summary field -> value (without symbol and version)
+    '''
+    n = len(df)
+    row = {'nrows': n}
+    if n == 0:
+        row.update(first_date=np.datetime64('NaT'), last_date=np.datetime64('NaT'))
+        return row
+
+    dates = df['Date'].values
+    close = np.asarray(df['Close'].values, dtype='float64')
+    row['first_date'] = dates[0]
+    row['last_date'] = dates[-1]
+    row['low'] = np.nanmin(df['Low'].values)
+    row['high'] = np.nanmax(df['High'].values)
+    row['last_close'] = close[-1]
+    for h, days in horizons.items():
+        if n > days and close[-1 - days] != 0:
+            row['ret_' + h] = close[-1] / close[-1 - days] - 1
+    if 'Volume' in df.columns:
+        row['avg_volume'] = df['Volume'].values[-volume_window:].mean()
+    return row
+
+
+class SummaryIndex:
+    '''
+    Summary rows of the symbols of a data directory, stored in <datadir>/summary.npy
+
+    The file is re-read when another process changed it and rewritten atomically
+    (under a file lock) on every update.
+
+    Input parameters
+    ----------------
+    datadir  : directory of the stock data (default : './data/')
+    filename : str, name of the index file (default : 'summary.npy')
+    '''
+
+    def __init__(self, datadir='./data/', filename='summary.npy'):
+        self.datadir = os.path.abspath(os.path.expanduser(datadir))
+        self.path = os.path.join(self.datadir, filename)
+        self._lock = threading.RLock()
+        self._rows = np.zeros(0, dtype=summary_dtype)
+        self._positions = {}
+        self._mtime = None
+        self._batch = 0
+
+    def _refresh(self):
+        # reload the file if it changed on disk
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        rows = np.zeros(0, dtype=summary_dtype)
+        if mtime is not None:
+            try:
+                stored = np.load(self.path, allow_pickle=False)
+                # rows of an index written with other fields are rebuilt on the next write
+                if stored.dtype == summary_dtype:
+                    rows = stored
+            except (OSError, ValueError):
+                pass
+        self._rows = rows
+        self._positions = {s: i for i, s in enumerate(rows['symbol'])}
+        self._mtime = mtime
+
+    def _save(self):
+        tmpname = '{}.{}.{}.tmp'.format(self.path, os.getpid(), threading.get_ident())
+        try:
+            with open(tmpname, 'wb') as f:
+                np.save(f, self._rows, allow_pickle=False)
+            os.replace(tmpname, self.path)
+        finally:
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+    def _set(self, symbol, values):
+        # read-modify-write of the row of symbol, shared with the other processes
+        with self._lock:
+            if self._batch:
+                self._set_row(symbol, values)
+                return
+            with FileLock(lock_path(self.path)):
+                self._refresh()
+                self._set_row(symbol, values)
+                self._save()
+
+    def _set_row(self, symbol, values):
+        i = self._positions.get(symbol)
+        if i is None:
+            row = np.zeros(1, dtype=summary_dtype)
+            for name in summary_dtype.names:
+                if summary_dtype[name].kind == 'f':
+                    row[name] = np.nan
+                elif summary_dtype[name].kind == 'M':
+                    row[name] = np.datetime64('NaT')
+            row['symbol'] = symbol
+            self._rows = np.concatenate([self._rows, row])
+            i = self._positions[symbol] = len(self._rows) - 1
+        else:
+            # the loaded array may be shared with readers
+            self._rows = self._rows.copy()
+        for name, value in values.items():
+            self._rows[name][i] = value
+
+    @contextlib.contextmanager
+    def batch(self):
+        '''
+        Write the index file once for all the updates made inside the with block
+
+        usage:
+            with index.batch():
+                for symbol in symbols:
+                    index.update(symbol, ...)
+        '''
+        with self._lock:
+            if self._batch:
+                self._batch += 1
+                try:
+                    yield self
+                finally:
+                    self._batch -= 1
+                return
+            with FileLock(lock_path(self.path)):
+                self._refresh()
+                self._batch += 1
+                try:
+                    yield self
+                finally:
+                    self._batch -= 1
+                    self._save()
+
+    def update(self, symbol, df, version=None):
+        '''
+        Recompute the row of symbol from its (normalized) stock dataframe
+
+        Input parameters
+        ----------------
+        symbol  : str, stock symbol with extension (e.g. 'RELIANCE.NS')
+        df      : dataframe with 'Date' and OHLC columns
+        version : int, modification time (ns) of the stored file
+        '''
+        self.update_row(symbol, summarize(df), version=version)
+
+    def update_row(self, symbol, row, version=None):
+        '''
+        Set the row of symbol to values computed by summarize (e.g. in another process)
+        '''
+        values = {name: np.nan for name in summary_dtype.names if summary_dtype[name].kind == 'f'}
+        values.update(row)
+        values['version'] = -1 if version is None else version
+        self._set(symbol, values)
+
+    def touch(self, symbol, version):
+        '''
+        Set the version of the row of symbol (stored file refreshed, data unchanged)
+        '''
+        with self._lock:
+            self._refresh()
+            if symbol not in self._positions:
+                return
+        self._set(symbol, {'version': version})
+
+    def remove(self, symbol):
+        with self.batch():
+            if symbol in self._positions:
+                self._rows = self._rows[self._rows['symbol'] != symbol]
+                self._positions = {s: i for i, s in enumerate(self._rows['symbol'])}
+
+    def get(self, symbol, version=None):
+        '''
+        Return the summary row of symbol (numpy record) or None
+
+        Input parameters
+        ----------------
+        symbol  : str, stock symbol with extension (e.g. 'RELIANCE.NS')
+        version : int, only return the row if it was computed for this file version
+        '''
+        with self._lock:
+            self._refresh()
+            i = self._positions.get(symbol)
+            if i is None:
+                return None
+            row = self._rows[i]
+        if version is not None and row['version'] != version:
+            return None
+        return row
+
+    def table(self):
+        '''
+        Return all the summary rows (numpy structured array, do not modify)
+        '''
+        with self._lock:
+            self._refresh()
+            return self._rows
+
+    def top_movers(self, horizon='1d', n=10, symbols=None, suffix='.NS'):
+        '''
+        Rank the symbols by their return over a horizon
+
+        Input parameters
+        ----------------
+        horizon : str, one of horizons (default : '1d')
+        n       : int, number of gainers and losers (default : 10)
+        symbols : list, restrict to these symbols (without suffix) (default : None, all)
+        suffix  : str, exchange suffix of the stored symbols (default : '.NS', '' : the symbols are tickers)
+
+        Output
+        ------
+        gainers, losers : structured arrays sorted by decreasing / increasing return
+        '''
+        rows = self.table()
+        rows = rows[np.char.endswith(rows['symbol'], suffix)]
+        if symbols is not None:
+            rows = rows[np.isin(rows['symbol'], [s + suffix for s in symbols])]
+        ret = rows['ret_' + horizon]
+        rows = rows[~np.isnan(ret)]
+        ret = ret[~np.isnan(ret)]
+        order = np.argsort(ret, kind='stable')
+        return rows[order[::-1][:n]], rows[order[:n]]
+
+    def __len__(self):
+        return len(self.table())
+
+    def __contains__(self, symbol):
+        return self.get(symbol) is not None
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_summary_index(datadir='./data/'):
+    '''
+    Return the (shared) summary index of a data directory
+    '''
+    key = os.path.abspath(os.path.expanduser(datadir))
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = SummaryIndex(key)
+        return _indexes[key]
+
+
+def rebuild_summary_index(store, symbols=None):
+    '''
+    Recompute the summary rows of all the symbols saved in a store
+
+    Input parameters
+    ----------------
+    store   : store object (see store.py)
+    symbols : list, tickers to summarize (default : None, the stored files of every
+              exchange, see registry.SymbolRegistry.stored)
+
+    Output
+    ------
+    number of summarized symbols
+    '''
+    index = get_summary_index(store.datadir)
+    if symbols is None:
+        # the registry imports the stores, which import this module
+        from registry import SymbolRegistry
+        registry = SymbolRegistry(store)
+        symbols = [registry.get(s).ticker for s in registry.stored()]
+    with index.batch():
+        for symbol in symbols:
+            index.update(symbol, store.load(symbol, columns=['Low', 'High', 'Close', 'Volume']),
+                         version=store.mtime(symbol))
+    logger.info('Summarized %d symbols in %s', len(symbols), store.datadir)
+    return len(symbols)
+
+
+if __name__ == '__main__':
+    from store import get_store, store_formats
+
+    parser = argparse.ArgumentParser(description='Rebuild the summary index of the stored stock data')
+    parser.add_argument('datadir', nargs='?', default='./data/')
+    parser.add_argument('--format', default=None, choices=sorted(store_formats))
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.datadir):
+        sys.exit('Directory {} does not exist!'.format(args.datadir))
+    count = rebuild_summary_index(get_store(args.datadir, fmt=args.format))
+    print('Summarized {} symbols in {}'.format(count, args.datadir))
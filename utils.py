@@ -3,12 +3,35 @@
 # Please check out its official doc for details: https://pypi.org/project/yfinance/
 
 from numpy import empty
-import yfinance as yf
 import pandas as pd
 #import json
 import os, sys
+import re
+import time
+import logging
+import threading
+import numpy as np
 from pathlib import Path
 import plotly.graph_objects as go
+from cache import FrameCache
+from store import get_store, get_level_store, normalize_stock_frame, CsvStore, ColumnarStore, IndicatorStore
+from resample import levels
+from fetch import BulkFetcher, ListingValidator, FetchError
+from locks import SingleFlight, FileLock, lock_path
+from summary import get_summary_index
+from registry import get_registry, symbol_suffixes
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+# parsed stock dataframes shared by all the callbacks
+frame_cache = FrameCache()
+# one download / refresh per symbol at a time, the other callers wait for its result
+single_flight = SingleFlight()
+# a failed refresh serves the stored data and is only tried again after refresh_retry_s
+refresh_retry_s = 60.0
+# stored file path -> time of the last failed refresh
+_refresh_failures = {}
 
 
 # Load historical data in the past 10 years
@@ -25,43 +48,388 @@ def download_single_stock(symbol='RELIANCE.NS', period='1y'):
     ------
     stock dataframe  
     '''
-    symbol
+    # yfinance is only imported when something is downloaded
+    import yfinance as yf
     ticker = yf.Ticker(symbol)
     stock = ticker.history(period=period)
     return stock
 
-def get_single_stock(symbol, period='1y', datadir='./data/'):
+def get_single_stock(symbol, period='1y', datadir='./data/', max_age=None, cache=True):
     '''
     Download and read the stock OHLC data as dataframe
     
     Input parameters
     ----------------
-    symbol : str, stock symbol without extension
+    symbol : str, stock symbol without extension (or with the suffix of another exchange)
     period : str, time period('1d','1m', '1y'...)
-    datadir: directory to save the stock data (in csv format) (default : './data/')
+    datadir: directory to save the stock data (default : './data/')
+    max_age: float, refresh (delta download) data older than max_age seconds (default : None, never)
+    cache  : bool, keep the loaded dataframe in the frame cache (default : True)
     
     Output
     ------
     dataframe containing stock OHLC data
     '''
-    # filename
-    stock_file = datadir + symbol + '.NS'
-    # make absolute path
-    stock_file = make_abspath(stock_file)
-
+    # ticker and stored file of the symbol, resolved once (see registry.py)
+    registry = get_registry(datadir)
+    record = registry.resolve(symbol)
+    # storage backend (csv or columnar) for the data directory
+    store = registry.store
+
+    # fetch the missing bars of stale data
+    mtime = registry.mtime(record)
+    if mtime is not None and max_age is not None and time.time() - mtime / 1e9 > max_age \
+            and time.time() - _refresh_failures.get(record.path, 0.0) > refresh_retry_s:
+        try:
+            with span('refresh'):
+                single_flight.do(('update', record.path), _update_locked,
+                                 store, symbol, period, datadir, max_age)
+            _refresh_failures.pop(record.path, None)
+        except FetchError as err:
+            # no network, empty answer, ...: the stored (stale) data is still served
+            logger.warning('Refresh of %s failed, serve the stored data: %s', symbol, err)
+            _refresh_failures[record.path] = time.time()
+        mtime = registry.mtime(record)
+
+    # serve repeat renders from memory as long as the file did not change
+    key = (symbol, period)
+    if mtime is not None:
+        with span('cache'):
+            df = frame_cache.get(key, mtime=mtime)
+        if df is not None:
+            return df
+
+    # concurrent callers of a missing or changed symbol share one load / download
+    with span('load'):
+        return single_flight.do(('load', record.path), _load_or_download,
+                                registry, record, period, key, mtime, cache)
+
+
+def _load_or_download(registry, record, period, key, mtime, cache=True):
+    '''
+    Load the stock data from the store, download and save it first if the file does not exist
+    '''
+    store = registry.store
+    ticker = record.ticker
     # check if the file exists
-    if Path(stock_file).exists():
-        print('Load {}'.format(stock_file))
-        df = pd.read_csv(stock_file)
+    if mtime is not None:
+        logger.debug('Load %s', record.path)
+        df = store.load(ticker)
     else:
-        print('Download {} stock data'.format(symbol))
-        df = download_single_stock(symbol + '.NS', period=period)
-        # print(df.head())
-        write_csv(df, stock_file)
-        df = pd.read_csv(stock_file)
+        # another worker process may be downloading the same symbol
+        with FileLock(lock_path(record.path)):
+            mtime = registry.mtime(record)
+            if mtime is not None:
+                logger.debug('Load %s', record.path)
+                df = store.load(ticker)
+            else:
+                logger.info('Download %s stock data', record.symbol)
+                # keep the downloaded frame, no need to read back the file just written
+                df = normalize_stock_frame(download_single_stock(ticker, period=period))
+                store.save(ticker, df)
+                mtime = registry.refreshed(record)
+
+    # identify the data for the indicator engine (see indicators.py)
+    df.attrs['symbol'] = record.symbol
+    df.attrs['version'] = mtime
+    if cache:
+        frame_cache.put(key, df, mtime=mtime)
+    return df
+
 
+def _update_locked(store, symbol, period, datadir, max_age):
+    '''
+    Refresh stale stock data unless another worker process did it while we waited for the lock
+    '''
+    ticker = get_registry(datadir).ticker(symbol)
+    with FileLock(lock_path(store.path(ticker))):
+        mtime = store.mtime(ticker)
+        if mtime is not None and time.time() - mtime / 1e9 > max_age:
+            update_single_stock(symbol, period=period, datadir=datadir)
+
+def get_stock_bars(symbol, interval='D', period='1y', datadir='./data/', max_age=None):
+    '''
+    Read the stock OHLC bars of an interval as dataframe
+
+    The daily bars come from get_single_stock, the weekly, monthly and quarterly
+    bars from the level files the store writes next to the daily file (see
+    resample.py). Files stored before the levels existed are aggregated once.
+
+    Input parameters
+    ----------------
+    symbol  : str, stock symbol without extension
+    interval: str, 'D', 'W', 'M' or 'Q' (default : 'D')
+    period  : str, time period of a download ('1d','1m', '1y'...)
+    datadir : directory of the stock data (default : './data/')
+    max_age : float, see get_single_stock (default : None)
+
+    Output
+    ------
+    dataframe containing the stock OHLC bars
+    '''
+    if interval == 'D':
+        return get_single_stock(symbol, period=period, datadir=datadir, max_age=max_age)
+    store = get_store(datadir)
+    bar_store = get_level_store(datadir, interval)
+    ticker = get_registry(datadir).ticker(symbol)
+
+    # download / refresh the daily bars first, the store updates the levels
+    mtime = store.mtime(ticker)
+    if mtime is None or (max_age is not None and time.time() - mtime / 1e9 > max_age):
+        get_single_stock(symbol, period=period, datadir=datadir, max_age=max_age)
+
+    if not bar_store.current(store, ticker):
+        with span('load'):
+            single_flight.do(('levels', store.path(ticker)), _update_levels, store, ticker)
+
+    version = bar_store.mtime(ticker)
+    key = (symbol, period, interval)
+    with span('cache'):
+        df = frame_cache.get(key, mtime=version)
+    if df is not None:
+        return df
+    with span('load'):
+        df = bar_store.load(ticker)
+    df.attrs['symbol'] = symbol
+    df.attrs['version'] = version
+    df.attrs['interval'] = interval
+    frame_cache.put(key, df, mtime=version)
     return df
 
+
+def _update_levels(store, ticker):
+    '''
+    Aggregate the daily bars of a symbol stored before the levels existed
+    '''
+    with FileLock(lock_path(store.path(ticker))):
+        df = store.load(ticker)
+        for level in levels:
+            bar_store = get_level_store(store.datadir, level)
+            if not bar_store.current(store, ticker):
+                logger.debug('Aggregate %s %s bars', ticker, level)
+                bar_store.update(ticker, df)
+
+
+def get_shared_stock(symbol, plane, period='1y', datadir='./data/', max_age=None):
+    '''
+    Read the stock OHLC data from the shared memory data plane (see dataplane.py)
+
+    A missing or outdated segment is published from the store first (after a
+    download or refresh if required). Nothing is kept in the frame cache of the
+    process, the data stays in the shared segment.
+
+    Input parameters
+    ----------------
+    symbol : str, stock symbol without extension
+    plane  : DataPlane object
+    period : str, time period('1d','1m', '1y'...)
+    datadir: directory of the stock data (default : './data/')
+    max_age: float, see get_single_stock (default : None)
+
+    Output
+    ------
+    SharedFrame (read-only, zero-copy dataframe)
+    '''
+    store = get_store(datadir)
+    record = get_registry(datadir).resolve(symbol)
+    ticker = record.ticker
+    mtime = store.mtime(ticker)
+    if mtime is not None and (max_age is None or time.time() - mtime / 1e9 <= max_age):
+        with span('cache'):
+            frame = plane.attach(ticker, record.symbol)
+        if frame is not None and frame.attrs['version'] == mtime:
+            return frame
+    with span('load'):
+        return single_flight.do(('publish', plane.path(ticker)), _publish_stock,
+                                store, plane, symbol, period, datadir, max_age)
+
+
+def _publish_stock(store, plane, symbol, period, datadir, max_age):
+    '''
+    Publish the current stock data of symbol to the data plane and attach it
+    '''
+    record = get_registry(datadir).resolve(symbol)
+    ticker = record.ticker
+    mtime = store.mtime(ticker)
+    if mtime is None or (max_age is not None and time.time() - mtime / 1e9 > max_age):
+        # download / refresh through the store
+        get_single_stock(symbol, period=period, datadir=datadir, max_age=max_age, cache=False)
+    # one publisher per symbol across the worker processes
+    with FileLock(lock_path(plane.path(ticker))):
+        plane.publish_store(store, symbols=[ticker])
+    return plane.attach(ticker, record.symbol)
+
+
+def update_single_stock(symbol, period='1y', datadir='./data/', fetcher=None):
+    '''
+    Bring the stored stock data up to date by downloading only the missing bars
+
+    The last stored bar is downloaded again together with the new ones. If its
+    price changed, or a new bar carries a dividend or a split, the (adjusted)
+    history changed as well and the full period is downloaded again.
+
+    Input parameters
+    ----------------
+    symbol : str, stock symbol without extension
+    period : str, time period used for a full download ('1d','1m', '1y'...)
+    datadir: directory to save the stock data (default : './data/')
+    fetcher: data source with fetch(symbol, period, start), or a BulkFetcher to share
+             its rate limiter between calls (default : None, Yahoo finance)
+
+    Output
+    ------
+    number of new bars (-1 : full download)
+    '''
+    registry = get_registry(datadir)
+    record = registry.resolve(symbol)
+    store = registry.store
+    ticker = record.ticker
+    bulk = fetcher if isinstance(fetcher, BulkFetcher) else BulkFetcher(fetcher=fetcher, max_workers=1)
+
+    last = store.last_date(ticker)
+    if last is not None:
+        new = apply_delta(store, ticker, bulk.fetch_one(ticker, period=period, start=last), last)
+        if new is not None:
+            registry.refreshed(record)
+            return new
+
+    df = bulk.fetch_one(ticker, period=period)
+    # never replace the stored history with an empty download
+    if df is None or not len(df):
+        raise FetchError('No data downloaded for {}'.format(ticker))
+    store.save(ticker, df)
+    registry.refreshed(record)
+    return -1
+
+def apply_delta(store, ticker, delta, last):
+    '''
+    Append the downloaded bars after the last stored date
+
+    Input parameters
+    ----------------
+    store  : stock data store
+    ticker : str, stock symbol with extension (e.g. 'RELIANCE.NS')
+    delta  : dataframe, bars downloaded from the last stored date onwards
+    last   : last stored date
+
+    Output
+    ------
+    number of new bars, None if the stored history has to be downloaded again
+    (dividend/split adjustment)
+    '''
+    # nothing downloaded (e.g. the empty frame of yfinance, without a date index): no new bars
+    if delta is None or not len(delta):
+        store.touch(ticker)
+        return 0
+    delta = normalize_stock_frame(delta)
+    if 'Date' not in delta.columns:
+        raise FetchError('Downloaded bars of {} have no dates'.format(ticker))
+    new = delta[delta['Date'] > last]
+    overlap = delta[delta['Date'] == last]
+
+    # corporate actions re-adjust the whole price history
+    actions = [c for c in ['Dividends', 'Stock Splits'] if c in new.columns]
+    adjusted = bool(len(new)) and bool((new[actions] != 0).any().any())
+    if len(overlap):
+        stored_close = store.load_column(ticker, 'Close')[-1]
+        adjusted |= not np.isclose(overlap['Close'].iloc[0], stored_close, rtol=1e-4)
+
+    if adjusted:
+        logger.info('Dividend/split adjustment for %s, download full history', ticker)
+        return None
+    if len(new):
+        logger.info('Append %d new bars to %s', len(new), ticker)
+        store.append(ticker, delta)
+    else:
+        store.touch(ticker)
+    return len(new)
+
+def period_start(end, period='1y'):
+    '''
+    Return the start date of a yfinance-style period ending at end
+
+    Input parameters
+    ----------------
+    end    : datetime, last date
+    period : str, time period ('5d', '1wk', '6mo', '1y', 'ytd'...)
+
+    Output
+    ------
+    start date (pd.Timestamp) or None for 'max'
+    '''
+    end = pd.Timestamp(end)
+    if period == 'max':
+        return None
+    if period == 'ytd':
+        return pd.Timestamp(year=end.year, month=1, day=1)
+    match = re.fullmatch(r'(\d+)(d|wk|mo|y)', period)
+    if match is None:
+        raise ValueError('Unknown period {}'.format(period))
+    units = {'d': 'days', 'wk': 'weeks', 'mo': 'months', 'y': 'years'}
+    return end - pd.DateOffset(**{units[match.group(2)]: int(match.group(1))})
+
+def get_date_range(symbols, period='1y', datadir='./data/'):
+    '''
+    Return the [min_date, max_date] x-axis range from the local store (no download)
+
+    The last date is the most recent bar of the stored symbols (today if none
+    is stored yet), the first date is the start of the period before it.
+
+    Input parameters
+    ----------------
+    symbols : list, stock symbols without extension
+    period  : str, time period('1d','1m', '1y'...)
+    datadir : directory of the stock data (default : './data/')
+
+    Output
+    ------
+    list of two dates ('YYYY-MM-DD')
+    '''
+    store = get_store(datadir)
+    registry = get_registry(datadir)
+    tickers = [registry.ticker(s) for s in symbols if os.path.isfile(registry.resolve(s).path)]
+    ends = [store.last_date(t) for t in tickers]
+    ends = [d for d in ends if d is not None]
+    end = max(ends) if ends else pd.Timestamp.today().normalize()
+
+    start = period_start(end, period)
+    if start is None:
+        starts = [pd.Timestamp(store.load_column(t, 'Date')[0]) for t in tickers]
+        start = min(starts) if starts else end - pd.DateOffset(years=1)
+    return [start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')]
+
+def warm_cache(symbols, period='1y', datadir='./data/', max_age=None, background=True):
+    '''
+    Load (and refresh/download if required) the symbols into the frame cache
+
+    Input parameters
+    ----------------
+    symbols    : list, stock symbols without extension
+    period     : str, time period('1d','1m', '1y'...)
+    datadir    : directory of the stock data (default : './data/')
+    max_age    : float, see get_single_stock (default : None)
+    background : bool, run in a daemon thread and return immediately (default : True)
+
+    Output
+    ------
+    thread object (background) or None
+    '''
+    def run():
+        start = time.perf_counter()
+        for s in symbols:
+            try:
+                get_single_stock(s, period=period, datadir=datadir, max_age=max_age)
+            except Exception as err:
+                logger.warning('Warm cache: failed to load %s: %s', s, err)
+        logger.info('Warm cache: %d symbols in %.2fs', len(symbols), time.perf_counter() - start)
+
+    if not background:
+        run()
+        return None
+    thread = threading.Thread(target=run, name='warm-cache', daemon=True)
+    thread.start()
+    return thread
+
 def write_csv(dataframe, outname='./data/sample_stock.csv'):
     '''
     Write a dataframe as csv
@@ -96,7 +464,8 @@ def write_csv(dataframe, outname='./data/sample_stock.csv'):
 #         json.dump(in_dict, outfile)
 
     
-def read_multiple_stocks(symbol=['RELIANCE.NS'], period='1y', save=True, outdir='./data/'):
+def read_multiple_stocks(symbol=['RELIANCE.NS'], period='1y', save=True, outdir='./data/',
+                         max_workers=8, fetcher=None):
     '''
     Read multiple stocks history data for specified period as dataframe
     and save it (optional)
@@ -105,34 +474,30 @@ def read_multiple_stocks(symbol=['RELIANCE.NS'], period='1y', save=True, outdir=
     ----------------
     symbol : str, symbol for stock
     period : str, time period ('1d', '1m', '1y'... )
-    save   : bool, write the df as csv or not
+    save   : bool, write the df to the store or not
     outdir : directory to save the data
+    max_workers : int, number of concurrent downloads (default : 8)
+    fetcher : data source with fetch(symbol, period) (default : None, Yahoo finance)
 
     Output
     ------
-    write individual stock as dataframes (csv)
+    write individual stock as dataframes (store format) as soon as they are downloaded
     return multiple stocks as dict
     '''
-
-    stock_dict = {}
-    for s in symbol:
-        ticker = yf.Ticker(s)
-        stock = ticker.history(period=period)
-        stock_dict[s] = stock
-
-        if save:
-            write_csv(stock, outname=outdir + s)
+    store = get_store(outdir) if save else None
+    bulk = BulkFetcher(fetcher=fetcher, max_workers=max_workers)
+    stock_dict, _ = bulk.fetch_all(symbol, period=period, store=store)
 
     return stock_dict
 
 def make_abspath(filename=''):
     # expanduser (if '~' in path) 
     filename = os.path.expanduser(filename)
-    print('Debug - after expanduser : {}'.format(filename))
+    logger.debug('after expanduser : %s', filename)
 
     # get absolute path
     filename = os.path.abspath(filename)
-    print('Debug - after absolute path : {}'.format(filename))
+    logger.debug('after absolute path : %s', filename)
 
     return filename
 
@@ -152,36 +517,50 @@ def get_symbols(filename='', skiprows=0, usecols='', outfile=''):
     # print the pandas dataframe
     print(df.head())
 
-    # drop all columns except Symbol
-    df = df[['Symbol']]
+    # drop all columns except Symbol and the company name (symbol search, search.py)
+    names = [c for c in ['Name', 'Company Name', 'Company'] if c in df.columns]
+    df = df[['Symbol'] + names[:1]].rename(columns={c: 'Name' for c in names[:1]})
     print(df.head())
     
     write_csv(df, outname=outfile)
 
-# remove symbols that are not listed on NS
-def remove_symbols(filename='', outfile=''):
-    
-    # convert to absolute path
+# remove symbols that are not listed on their exchange (NS by default)
+def remove_symbols(filename='', outfile='./data/symbols_ns.csv',
+                   cache_file='./data/listing_cache.json', batch_size=20, max_workers=8, fetcher=None):
+    '''
+    Remove the symbols that are not listed on their exchange and write the remaining ones
+
+    The tickers are resolved by the symbol registry of the output directory (see registry.py).
+    The symbols whose listing could not be checked (failed probe) are kept.
+
+    Input parameters
+    ----------------
+    filename    : csv file with a 'Symbol' column (and an optional 'Exchange' or 'Suffix' column)
+    outfile     : file to save the listed symbols (default : './data/symbols_ns.csv')
+    cache_file  : json file caching the confirmed listings (default : './data/listing_cache.json')
+    batch_size  : int, number of symbols checked per request (default : 20)
+    max_workers : int, number of batches checked at the same time (default : 8)
+    fetcher     : data source with listed(symbols) (default : None, Yahoo finance)
+    '''
     df = pd.read_csv(filename)
-    df = df[['Symbol']]
-    
-    # print the pandas dataframe
-    non_ns = []
-    for s in df['Symbol']:
-        ticker = yf.Ticker(s + '.NS')
-        stock = ticker.history(period='1d')
-        if stock.empty:
-            # print('{} not listed on NS'.format(s))
-            ind = df[df['Symbol'] == s].index
-            non_ns.append(ind)
-    
-    # drop non-ns cols
-    # print(non_ns)
-    for ind in non_ns:
-        df.drop(ind, axis=0, inplace=True)
-        
+    df = df[['Symbol'] + [c for c in ['Exchange', 'Suffix'] if c in df.columns][:1]]
+
+    registry = get_registry(os.path.dirname(outfile) or '.')
+    tickers = pd.Series([registry.resolve(str(s), suffix).ticker
+                         for s, suffix in zip(df['Symbol'], symbol_suffixes(df))], index=df.index)
+    validator = ListingValidator(fetcher=fetcher, cache_file=cache_file,
+                                 batch_size=batch_size, max_workers=max_workers)
+    listed = validator.listed(list(tickers))
+    if validator.unprobed:
+        # a failed probe says nothing about the listing, keep the symbols
+        logger.warning('Could not check the listing of %d symbols, kept: %s',
+                       len(validator.unprobed), ', '.join(sorted(validator.unprobed)))
+
+    # drop the unlisted symbols
+    df = df[tickers.isin(listed | validator.unprobed)]
+
     # write as csv
-    write_csv(df, outname='./data/symbols_ns.csv')
+    write_csv(df, outname=outfile)
 
 
 # Check whether the directory exists and create (if required)
@@ -249,44 +628,35 @@ def make_candlestick(df, margin={}, transition_duration=300):
 def write_sample_stock(symbol='ADANIPORTS'):
     # read and write single stock
     symbol = 'ADANIPORTS'
-    df = download_single_stock(symbol + '.NS')
+    df = download_single_stock(get_registry().ticker(symbol))
     write_csv(df, outname='./data/sample_stock.csv') 
 
-# clear all existing stock data with extension '.NS'
+# clear all the stored stock data (csv, columnar, indicator and level files of every exchange)
 def clear_cache_data(datadir='./data/', value=True):
     if value:
-        print('Clear all ".NS" files from {}'.format(datadir))
-        files = os.listdir(datadir)
-        NS_files = [file for file in files if file.endswith('.NS')]
-        for file in NS_files:
-            print('Remove {}'.format(file))
-            os.remove(datadir+file)
-        print('Clear all ".NS" files from {}'.format(datadir))
-       
-
-if __name__ == '__main__':
-    # # read and write single stock
-    # symbol = 'ADANIPORTS'
-    # df = download_single_stock(symbol + '.NS')
-    # write_csv(df, outname='./data/sample_stock.csv')
-
-    # # read and write multiple stocks
-    # symbol = ['ADANIPORTS', 'ALKEM', 'ASHOKA',
-    #         'ASHOKLEY', 'ASIANPAINT', 'BAJFINANCE',
-    #         'BRITANNIA', 'CAMS', 'COALINDIA']
-    # for i in range(len(symbol)):
-    #     symbol[i] +='.NS'
-
-    # read_multiple_stocks(symbol, period='1y', save=True, outdir='./data/')
-
-
-    # # get all symbols
-    # filename = '~/Downloads/holdings-SY9025.xlsx'
-    # skiprows = 22
-    # usecols = 'B:M'
-    # get_symbols(filename=filename, skiprows=skiprows, usecols=usecols, outfile='./data/symbols.csv')
-
-    # remove non-NS symbols
-    remove_symbols('./data/symbols.csv')
+        print('Clear all the stock data files from {}'.format(datadir))
+        registry = get_registry(datadir)
+        # the registered symbols and the stored files of the known exchanges
+        registry.stored()
+        tickers = sorted(set(registry.get(s).ticker for s in registry.symbols()))
+        stores = [CsvStore(datadir), ColumnarStore(datadir), IndicatorStore(datadir)] + \
+                 [get_level_store(datadir, l) for l in levels]
+        for ticker in tickers:
+            for store in stores:
+                filename = store.path(ticker)
+                if os.path.isfile(filename):
+                    print('Remove {}'.format(os.path.basename(filename)))
+                    os.remove(filename)
+        # the summary rows and the registry records of the removed files
+        index_file = get_summary_index(datadir).path
+        if os.path.isfile(index_file):
+            os.remove(index_file)
+        registry.clear()
+        print('Clear all the stock data files from {}'.format(datadir))
 
 
+if __name__ == '__main__':
+    # ETL jobs over all the symbols (backfill, normalize, indicators, summaries) on a process pool
+    # e.g. python utils.py backfill normalize --workers 8, see pipeline.py
+    import pipeline
+    sys.exit(pipeline.main())